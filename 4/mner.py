@@ -1,12 +1,22 @@
+# The QID index and the detokenizer are the modules of the preparators in final/spacy, run with them on the path:
+#     PYTHONPATH=../final/spacy python mner.py
 import os
 
 import datasets
 import spacy
 from datasets import DatasetDict
+from detokenizer import SpacingRules, detokenize
 from pathlib import Path
+from qid_index import get_qid_index, label_anchors
 from spacy.tokens import DocBin
 from tqdm import tqdm
 
+NUM_PROC = os.cpu_count()
+
+# The marks attached to the preceding token, their tags are ignored
+MNER_MARKS = {',', '.', '!', '?', ';', ':', '"', "'s"}
+MNER_SPACING = SpacingRules(no_space_before=MNER_MARKS, untagged=MNER_MARKS)
+
 
 def load_and_split_ds(path, name, test_size=0.2):
     ds = datasets.load_dataset(path, name)
@@ -48,117 +58,21 @@ def tokens_to_text_with_tags(tokens, tags):
     Returns:
         Tuple[str, List[Dict[str, int | str]]]: The formatted sentence and entity list.
     """
-    sentence = ""
-    entities = []
-    current_pos = 0
-    current_entity = None
-
-    for token, tag in zip(tokens, tags):
-        if token in {',', '.', '!', '?', ';', ':', '"', "'s"}:
-            sentence += token  # Attach punctuation directly
-        else:
-            if sentence and not sentence.endswith(' '):
-                sentence += ' '
-                current_pos += 1
-            start_pos = current_pos
-            sentence += token
-            end_pos = current_pos + len(token)
-            current_pos = end_pos
-
-            if tag.startswith('B-'):
-                if current_entity:
-                    entities.append(current_entity)
-                current_entity = {'start': start_pos, 'end': end_pos, 'label': tag[2:]}
-            elif tag.startswith('I-') and current_entity:
-                current_entity['end'] = end_pos
-            elif tag != 'O':
-                if current_entity:
-                    entities.append(current_entity)
-                    current_entity = None
-                entities.append({'start': start_pos, 'end': end_pos, 'label': tag})
-            else:
-                if current_entity:
-                    entities.append(current_entity)
-                    current_entity = None
-
-    if current_entity:
-        entities.append(current_entity)
-
-    return sentence, entities
-
-
-def get_lines_set(file_path):
-    """
-    Gets a set of lines from a path.
+    text, _, entities = detokenize(tokens, tags, MNER_SPACING)
+    return text, entities
 
-    :param file_path: The file to read from.
-    :return: A set of lines from the file.
-    """
-    lines_set = set()
-    with open(file_path, 'r') as file:
-        for line in file:
-            # Remove leading/trailing spaces and check if the line is not empty
-            line = line.strip()
-            if line:
-                lines_set.add(line)
-    return lines_set
 
-PER_WIKIDATA_ENTITIES = get_lines_set('PER-ND.txt') | get_lines_set('PER-FI.txt')
-LOC_WIKIDATA_ENTITIES = get_lines_set('LOC-ND.txt')
-ORG_WIKIDATA_ENTITIES = get_lines_set('ORG-ND.txt')
-
-
-def get_entity_by_qid(qid):
+def convert_batch_wikianc(batch):
     """
-    Returns the entity by WikiData QID.
+    Converts a batch of WikiANC rows with one lookup of their QIDs in the memory-mapped index.
 
-    :return: Entity corresponding to the QID.
+    :param batch: The columns of the rows.
+    :return: The text and the entities of the rows.
     """
-    if not qid:
-        return 'MISC'
-    elif qid in LOC_WIKIDATA_ENTITIES:
-        return 'LOC'
-    elif qid in PER_WIKIDATA_ENTITIES:
-        return 'PER'
-    elif qid in ORG_WIKIDATA_ENTITIES:
-        return 'ORG'
-    else:
-        return 'MISC'
-
-
-def convert_row_wikianc(row):
-    entities = []
-    for anchor in row['paragraph_anchors']:
-        start_raw = anchor.get('start')
-        end_raw = anchor.get('end')
-        qid = anchor.get('qid')
-        label = get_entity_by_qid(str(qid))
-
-        # skip if any are None
-        if start_raw is None or end_raw is None or label is None:
-            continue
-
-        # ensure these are actually integers
-        try:
-            start = int(start_raw)
-            end = int(end_raw)
-        except ValueError:
-            # if you can't convert them to int, skip
-            print(f"start_raw={start_raw}, type(start_raw)={type(start_raw)}")
-            print(f"start_raw={end_raw}, type(start_raw)={type(end_raw)}")
-            continue
-
-        entities.append({
-            "start": start,
-            "end": end,
-            "label": label,
-        })
-
-    data_point = {
-        "text": row["paragraph_text"],
-        "entities": entities,
+    return {
+        "text": batch["paragraph_text"],
+        "entities": label_anchors(batch["paragraph_anchors"], 'MISC'),
     }
-    return data_point
 
 
 def create_spacy_doc_bin_files(dataset, output_dir, file_name, language, chunk_size=5000):
@@ -222,13 +136,15 @@ def create_spacy_doc_bin_files(dataset, output_dir, file_name, language, chunk_s
 
 
 def create_spacy_files(data_source, language):
-    train_ner = data_source['train'].shuffle().select(range(min(3200000, len(data_source['train'])))).map(convert_row_wikianc)
+    # The index is opened before the map processes are forked, so that they share its pages
+    get_qid_index()
+    train_ner = data_source['train'].shuffle().select(range(min(3200000, len(data_source['train'])))).map(convert_batch_wikianc, batched=True, num_proc=NUM_PROC)
     create_spacy_doc_bin_files(dataset=train_ner, file_name='train', output_dir=f'./{language}/train', language='xx')
 
-    dev_ner = data_source['test'].shuffle().select(range(min(960000, len(data_source['test'])))).map(convert_row_wikianc)
+    dev_ner = data_source['test'].shuffle().select(range(min(960000, len(data_source['test'])))).map(convert_batch_wikianc, batched=True, num_proc=NUM_PROC)
     create_spacy_doc_bin_files(dataset=dev_ner, file_name='dev', output_dir=f'./{language}/dev', language='xx')
 
-    valid_ner = data_source['validation'].shuffle().select(range(min(4800000, len(data_source['validation'])))).map(convert_row_wikianc)
+    valid_ner = data_source['validation'].shuffle().select(range(min(4800000, len(data_source['validation'])))).map(convert_batch_wikianc, batched=True, num_proc=NUM_PROC)
     create_spacy_doc_bin_files(dataset=valid_ner, file_name='validation', output_dir=f'./{language}/validation', language='xx')
 
 
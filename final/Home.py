@@ -7,4 +7,9 @@ st.set_page_config(page_title="NER App", layout="wide")
 language, model = setup_sidebar_and_model()
 
 st.markdown("# NER tagger app")
-st.markdown("This is a named entity recognition app for Slavic languages from SpaCy.")
\ No newline at end of file
+st.markdown("This is a named entity recognition app for Slavic languages from SpaCy.")
+
+preload_status = st.session_state["preloader"].status()
+if preload_status:
+    st.markdown("### Preloaded models")
+    st.table({"Language": list(preload_status), "State": list(preload_status.values())})
\ No newline at end of file
@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+"""
+NER load benchmark
+
+Drives the inference path with concurrent synthetic sessions over Slavic texts of varying length and reports
+docs/sec, tokens/sec, p50/p95/p99 latency, peak RSS and cold vs warm numbers per language. The results are written
+as JSON, so that runs of different commits can be compared with --baseline.
+
+In-process, every language is benchmarked in a fresh process, so that its peak RSS holds its own model only and not
+the models of the languages before it. Tokens are counted as the pipeline tokenizes, in-process and over HTTP. Requests
+the service rejects with 429 are retried after its Retry-After, or with exponential backoff, and reported as rejected.
+
+Examples:
+    python ner_benchmark.py --languages pl ru --sessions 8 --requests 50 --output results.json
+    python ner_benchmark.py --languages pl --url http://localhost:8080 --output results.json
+    python ner_benchmark.py --languages pl --output new.json --baseline old.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+SENTENCES = {
+    "be": ["Мінск з'яўляецца сталіцай Беларусі.", "Янка Купала нарадзіўся ў Вязынцы."],
+    "bg": ["София е столицата на България.", "Христо Ботев е роден в Калофер."],
+    "cs": ["Praha je hlavní město České republiky.", "Václav Havel se narodil v Praze."],
+    "hr": ["Zagreb je glavni grad Hrvatske.", "Nikola Tesla rođen je u Smiljanu."],
+    "mk": ["Скопје е главен град на Северна Македонија.", "Кирил Пејчиновиќ живеел во Тетово."],
+    "pl": ["Warszawa jest stolicą Polski.", "Maria Skłodowska-Curie urodziła się w Warszawie."],
+    "ru": ["Москва — столица России.", "Лев Толстой жил в Ясной Поляне."],
+    "sk": ["Bratislava je hlavné mesto Slovenska.", "Milan Rastislav Štefánik sa narodil v Košariskách."],
+    "sl": ["Ljubljana je glavno mesto Slovenije.", "France Prešeren se je rodil v Vrbi."],
+    "sr": ["Београд је главни град Србије.", "Никола Тесла је рођен у Смиљану."],
+    "uk": ["Київ є столицею України.", "Тарас Шевченко народився в Моринцях."],
+}
+
+# Number of sentences per text, from a short query to a long document
+TEXT_LENGTHS = [1, 4, 16, 64]
+
+
+def build_corpus(language, texts_per_length, seed):
+    rng = random.Random(seed)
+    sentences = SENTENCES[language]
+    return [
+        " ".join(rng.choice(sentences) for _ in range(length))
+        for length in TEXT_LENGTHS
+        for _ in range(texts_per_length)
+    ]
+
+
+def read_corpus(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+def process_rss(process):
+    """Returns the RSS of a process and its children, e.g. the workers of the inference executor."""
+    rss = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            rss += child.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass
+    return rss
+
+
+class RssSampler:
+    """Samples the RSS of the process and its children in a background thread and keeps the peak."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.baseline = process_rss(psutil.Process()) if psutil is not None else 0
+        self.peak = self.baseline
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        process = psutil.Process() if psutil is not None else None
+        while not self._stop.is_set():
+            if process is not None:
+                self.peak = max(self.peak, process_rss(process))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+class InProcessTarget:
+    """Tags texts through the app's inference path."""
+
+    def __init__(self, language):
+        from utils.inference_executor import pipe
+        from utils.model_loader import load_spacy_model
+
+        self.language = language
+        self._pipe = pipe
+        self._load = load_spacy_model
+        self.model = None
+
+    def load(self):
+        self.model = self._load(self.language)
+
+    def tag(self, text):
+        """Returns the number of tokens of the text and of times it was rejected, which the app never does."""
+        doc = next(self._pipe(self.language, self.model, [text]))
+        return len(doc), 0
+
+
+class RequestRejected(Exception):
+    """Raised when the service still rejects a request after all retries."""
+
+    def __init__(self, rejections):
+        super().__init__(f"Rejected {rejections} times")
+        self.rejections = rejections
+
+
+class HttpTarget:
+    """Tags texts through the headless NER service."""
+
+    def __init__(self, language, url, max_retries=5, backoff_seconds=0.1):
+        self.language = language
+        self.url = url.rstrip("/") + "/ner"
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+    def load(self):
+        self.tag("warm")
+
+    def _retry_delay(self, error, attempt):
+        retry_after = error.headers.get("Retry-After") if error.headers else None
+        if retry_after is not None and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff_seconds * 2 ** attempt * random.uniform(0.5, 1.5)
+
+    def tag(self, text):
+        """
+        Returns the number of tokens of the text, as the service tokenized it, and of times it was rejected.
+
+        :raises RequestRejected: When the service rejects the text with 429 more than max_retries times.
+        """
+        body = json.dumps({"language": self.language, "text": text}).encode("utf-8")
+        for attempt in range(self.max_retries + 1):
+            request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+            try:
+                with urllib.request.urlopen(request) as response:
+                    return json.load(response)["tokens"], attempt
+            except urllib.error.HTTPError as e:
+                if e.code != 429:
+                    raise
+                if attempt < self.max_retries:
+                    time.sleep(self._retry_delay(e, attempt))
+        raise RequestRejected(self.max_retries + 1)
+
+
+def run_sessions(target, corpus, sessions, requests_per_session, seed):
+    """
+    Runs concurrent sessions, each sending requests one after another, and returns the measurements.
+
+    The latency of a request includes its retries. A request rejected after all retries is counted as failed and
+    left out of the latencies, docs and tokens.
+    """
+
+    def session(index):
+        rng = random.Random(seed + index)
+        latencies, tokens, rejected, failed = [], 0, 0, 0
+        for _ in range(requests_per_session):
+            text = rng.choice(corpus)
+            start = time.perf_counter()
+            try:
+                text_tokens, text_rejections = target.tag(text)
+            except RequestRejected as e:
+                rejected += e.rejections
+                failed += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            tokens += text_tokens
+            rejected += text_rejections
+        return latencies, tokens, rejected, failed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        results = list(executor.map(session, range(sessions)))
+    seconds = time.perf_counter() - start
+
+    latencies = [latency for session_latencies, _, _, _ in results for latency in session_latencies]
+    tokens = sum(session_tokens for _, session_tokens, _, _ in results)
+    return {
+        "docs": len(latencies),
+        "rejected": sum(rejected for _, _, rejected, _ in results),
+        "failed": sum(failed for _, _, _, failed in results),
+        "seconds": seconds,
+        "docs_per_sec": len(latencies) / seconds,
+        "tokens_per_sec": tokens / seconds,
+        "latency_ms": {
+            "p50": 1000 * percentile(latencies, 50),
+            "p95": 1000 * percentile(latencies, 95),
+            "p99": 1000 * percentile(latencies, 99),
+            "mean": 1000 * statistics.fmean(latencies) if latencies else 0.0,
+        },
+    }
+
+
+def benchmark_language(language, args):
+    corpus = read_corpus(args.corpus) if args.corpus else build_corpus(language, args.texts_per_length, args.seed)
+    target = HttpTarget(language, args.url, args.max_retries) if args.url else InProcessTarget(language)
+
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        target.load()
+        load_seconds = time.perf_counter() - start
+
+        # The first requests after loading pay for lazy allocations
+        cold = run_sessions(target, corpus, 1, args.cold_requests, args.seed)
+        warm = run_sessions(target, corpus, args.sessions, args.requests, args.seed)
+
+    # The RSS of the service is not visible from here when benchmarking over HTTP
+    peak_rss_mb = None if args.url else rss.peak / 2 ** 20
+    baseline_rss_mb = None if args.url else rss.baseline / 2 ** 20
+    result = {"load_seconds": load_seconds, "cold": cold, "warm": warm, "peak_rss_mb": peak_rss_mb,
+              "baseline_rss_mb": baseline_rss_mb}
+    print(f"{language}: load={load_seconds:.2f}s  cold p50={cold['latency_ms']['p50']:.1f}ms  "
+          f"warm {warm['docs_per_sec']:.1f} docs/s, {warm['tokens_per_sec']:.0f} tokens/s, "
+          f"p50={warm['latency_ms']['p50']:.1f}ms p95={warm['latency_ms']['p95']:.1f}ms "
+          f"p99={warm['latency_ms']['p99']:.1f}ms  rejected={warm['rejected']} failed={warm['failed']}  "
+          f"peak RSS={peak_rss_mb or 0:.0f}MB (+{(peak_rss_mb or 0) - (baseline_rss_mb or 0):.0f}MB over the "
+          f"process before loading)", flush=True)
+    return result
+
+
+def benchmark_language_isolated(language, args):
+    """Benchmarks a language in a fresh process, so that no model of another language counts into its peak RSS."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(benchmark_language, language, args).result()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Print the relative change of the main metrics against a baseline run."""
+    print(f"\nCompared to {baseline.get('commit')}:")
+    for language, result in results["languages"].items():
+        base = baseline["languages"].get(language)
+        if base is None:
+            continue
+        for name, new, old in (
+            ("docs/s", result["warm"]["docs_per_sec"], base["warm"]["docs_per_sec"]),
+            ("p95 ms", result["warm"]["latency_ms"]["p95"], base["warm"]["latency_ms"]["p95"]),
+            ("p99 ms", result["warm"]["latency_ms"]["p99"], base["warm"]["latency_ms"]["p99"]),
+            ("load s", result["load_seconds"], base["load_seconds"]),
+            ("RSS MB", result["peak_rss_mb"], base["peak_rss_mb"]),
+        ):
+            if new is None or old is None:
+                continue
+            change = (new - old) / old * 100 if old else 0.0
+            print(f"  {language} {name:7} {old:10.2f} → {new:10.2f}  ({change:+.1f}%)")
+
+
+def main() -> None:
+    """CLI wrapper."""
+    parser = argparse.ArgumentParser(description="Benchmark the NER inference path under load")
+    parser.add_argument("--languages", nargs="+", default=["pl"], help="Languages to benchmark")
+    parser.add_argument("--sessions", default=4, type=int, help="Number of concurrent sessions")
+    parser.add_argument("--requests", default=25, type=int, help="Number of requests per session")
+    parser.add_argument("--cold-requests", default=3, type=int, help="Number of requests right after loading")
+    parser.add_argument("--texts-per-length", default=8, type=int, help="Synthetic texts per text length")
+    parser.add_argument("--corpus", help="File with one text per line instead of the synthetic corpus")
+    parser.add_argument("--url", help="Benchmark the NER service at this URL instead of the in-process path")
+    parser.add_argument("--max-retries", default=5, type=int, help="Retries of a request the service rejects with 429")
+    parser.add_argument("--seed", default=0, type=int, help="Random seed")
+    parser.add_argument("--output", help="JSON file to write the results to")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "machine": {"platform": platform.platform(), "cpus": os.cpu_count()},
+        "settings": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "languages": {
+            language: benchmark_language(language, args) if args.url else benchmark_language_isolated(language, args)
+            for language in args.languages
+        },
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Written {args.output}.")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+"""
+Headless NER HTTP service
+
+Serves the trained wikiann pipelines over HTTP/JSON. Concurrent requests for the same language are collected for
+up to --max-wait-ms milliseconds or --max-batch docs and run as one nlp.pipe batch. A request of more than
+--max-batch texts is rejected with 413. When the docs queued for a language would exceed --max-queue, the request is
+rejected with 429, and when it is not tagged within the timeout, with 504.
+
+Example:
+    python ner_service.py --port 8080 --preload pl,ru
+    curl -X POST localhost:8080/ner -d '{"language": "pl", "texts": ["Jan Kowalski mieszka w Warszawie."]}'
+
+The response holds the entities and the number of tokens of every text, as the pipeline tokenized it.
+"""
+
+import argparse
+import json
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.languages import AVAILABLE_LANGUAGES
+from utils.model_loader import estimate_model_size, load_spacy_model
+from utils.model_registry import ModelRegistry
+
+
+def doc_to_entities(doc):
+    return [{"start": ent.start_char, "end": ent.end_char, "label": ent.label_, "text": ent.text} for ent in doc.ents]
+
+
+class MicroBatcher:
+    """Collects texts of one language from concurrent requests and tags them in shared batches."""
+
+    def __init__(self, language, registry, max_wait_ms, max_batch, max_queue):
+        self.language = language
+        self.registry = registry
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        # The queue is bounded by the number of docs, not of requests, see submit
+        self._queue = queue.Queue()
+        self._queued_docs = 0
+        self._queued_lock = threading.Lock()
+        # A request taken from the queue that did not fit into the previous batch
+        self._carry = None
+        self._thread = threading.Thread(target=self._run, name=f"batcher-{language}", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts):
+        """
+        Queues the texts of one request.
+
+        :return: A future of the entities and the number of tokens of every text.
+        :raises ValueError: When the request has more texts than a batch holds.
+        :raises queue.Full: When the texts do not fit into the queue of the language.
+        """
+        if len(texts) > self.max_batch:
+            raise ValueError(f"A request holds at most {self.max_batch} texts")
+        with self._queued_lock:
+            if self._queued_docs + len(texts) > self.max_queue:
+                raise queue.Full
+            self._queued_docs += len(texts)
+        future = Future()
+        self._queue.put_nowait((texts, future))
+        return future
+
+    def _take(self, timeout=None):
+        if self._carry is not None:
+            item, self._carry = self._carry, None
+            return item
+        item = self._queue.get(timeout=timeout)
+        with self._queued_lock:
+            self._queued_docs -= len(item[0])
+        return item
+
+    def _collect(self):
+        items = [self._take()]
+        docs_count = len(items[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while docs_count < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._take(timeout=timeout)
+            except queue.Empty:
+                break
+            if docs_count + len(item[0]) > self.max_batch:
+                self._carry = item
+                break
+            items.append(item)
+            docs_count += len(item[0])
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            try:
+                model = self.registry.get(self.language)
+                texts = [text for item_texts, _ in items for text in item_texts]
+                results = [(doc_to_entities(doc), len(doc)) for doc in model.pipe(texts, batch_size=self.max_batch)]
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for item_texts, future in items:
+                future.set_result(results[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+
+class NERServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class NERRequestHandler(BaseHTTPRequestHandler):
+    batchers = {}
+    timeout_seconds = 60
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        self._send_json(200, {"status": "ok", "languages": sorted(self.batchers)})
+
+    def do_POST(self):
+        if self.path != "/ner":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length < 0:
+                raise ValueError("Content-Length must not be negative")
+            request = json.loads(self.rfile.read(length))
+            language = request["language"]
+            if not isinstance(language, str):
+                raise ValueError("language must be a string")
+            texts = request["texts"] if "texts" in request else [request["text"]]
+            if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                raise ValueError("text must be a string and texts a list of strings")
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": f"Invalid request: {e}"})
+            return
+
+        batcher = self.batchers.get(language)
+        if batcher is None:
+            self._send_json(404, {"error": f"Language '{language}' is not served"})
+            return
+
+        try:
+            future = batcher.submit(texts)
+        except ValueError as e:
+            self._send_json(413, {"error": str(e)})
+            return
+        except queue.Full:
+            self._send_json(429, {"error": "Too many requests"}, headers={"Retry-After": "1"})
+            return
+
+        try:
+            results = future.result(timeout=self.timeout_seconds)
+        except FutureTimeoutError:
+            self._send_json(504, {"error": f"Not tagged within {self.timeout_seconds} s"},
+                            headers={"Retry-After": str(self.timeout_seconds)})
+            return
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+
+        entities, tokens = [list(values) for values in zip(*results)] or ([], [])
+        if "texts" in request:
+            self._send_json(200, {"language": language, "entities": entities, "tokens": tokens})
+        else:
+            self._send_json(200, {"language": language, "entities": entities[0], "tokens": tokens[0]})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main() -> None:
+    """CLI wrapper."""
+    parser = argparse.ArgumentParser(description="Serve the NER models over HTTP")
+    parser.add_argument("--host", default="0.0.0.0", help="Host to listen on")
+    parser.add_argument("--port", default=8080, type=int, help="Port to listen on")
+    parser.add_argument("--max-wait-ms", default=10, type=float, help="Time to collect a batch for")
+    parser.add_argument("--max-batch", default=32, type=int, help="Maximal number of docs in a batch")
+    parser.add_argument("--max-queue", default=1024, type=int, help="Maximal number of queued docs per language")
+    parser.add_argument("--preload", default="", help="Comma separated languages to load at startup")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    registry = ModelRegistry(load_spacy_model, size_estimator=estimate_model_size)
+    for language in filter(None, args.preload.split(",")):
+        registry.get(language)
+
+    NERRequestHandler.batchers = {
+        language: MicroBatcher(language, registry, args.max_wait_ms, args.max_batch, args.max_queue)
+        for language in AVAILABLE_LANGUAGES
+    }
+
+    server = NERServer((args.host, args.port), NERRequestHandler)
+    print(f"Serving NER on {args.host}:{args.port}...", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,9 @@
-import random
-from io import StringIO
+import html
+import os
 
 import streamlit as st
-from spacy import displacy
 
+from utils.streaming_ner import TaggedFile, iter_chunks, remove_stale_tagged_files, tag_to_html_file
 from utils.ui_components import setup_sidebar_and_model
 
 st.set_page_config(page_title="File input NER")
@@ -13,11 +13,36 @@ language, model = setup_sidebar_and_model()
 st.write("You can also upload a file of raw text and the output will be an HTML file.")
 
 uploaded_file = st.file_uploader("Choose a file")
-if uploaded_file is not None:
-    stringio = StringIO(uploaded_file.getvalue().decode("utf-8"))
-    text = stringio.read()
 
-    html = displacy.render(model(text), style="ent")
+# The tagged file is kept until another file or language is chosen, and removed as soon as it is replaced
+tagged_key = (uploaded_file.file_id, language) if uploaded_file is not None else None
+tagged = st.session_state.get("tagged_file")
+if tagged is not None and (tagged.key != tagged_key or not tagged.exists()):
+    tagged.remove()
+    del st.session_state["tagged_file"]
+    tagged = None
 
-    file_name = f"tagged_text_{random.randint(10000,100000)}.html"
-    st.download_button("download the output file", html, file_name)
\ No newline at end of file
+if uploaded_file is not None:
+    if tagged is None:
+        remove_stale_tagged_files()
+        progress = st.progress(0.0, text="Tagging the file...")
+        total_bytes = max(uploaded_file.size, 1)
+
+        def on_bytes_read(bytes_read):
+            progress.progress(min(bytes_read / total_bytes, 1.0), text="Tagging the file...")
+
+        uploaded_file.seek(0)
+        path = tag_to_html_file(language, model, iter_chunks(uploaded_file, on_bytes_read=on_bytes_read))
+        progress.empty()
+
+        tagged = TaggedFile(tagged_key, path)
+        st.session_state["tagged_file"] = tagged
+
+    # Streamlit streams the file from the static directory, it is not read into the memory of the app
+    file_name = f"tagged_{os.path.splitext(uploaded_file.name)[0]}.html"
+    if tagged.is_servable():
+        st.markdown(f'<a href="{tagged.url}" download="{html.escape(file_name)}">download the output file</a>',
+                    unsafe_allow_html=True)
+    else:
+        # Too large to be served statically, the file is only read when the button is clicked
+        st.download_button("download the output file", tagged.open, file_name, mime="text/html")
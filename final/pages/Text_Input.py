@@ -1,7 +1,8 @@
 import streamlit as st
-from spacy import displacy
 from spacy_streamlit import visualize_ner
 
+from utils.model_loader import ner_labels
+from utils.result_cache import cached_ner, get_result_cache
 from utils.ui_components import setup_sidebar_and_model
 
 st.set_page_config(page_title="Text input NER")
@@ -11,5 +12,8 @@ language, model = setup_sidebar_and_model()
 text = st.text_area("Insert a text to get the NER tags for it")
 
 if text:
-    html_results = displacy.render(model(text), style="dep", minify=True, page=True)
-    visualize_ner(model(text), labels=model.get_pipe("ner").labels)
\ No newline at end of file
+    doc = cached_ner(language, model, text)
+    visualize_ner(doc, labels=ner_labels(model))
+
+stats = get_result_cache().stats()
+st.sidebar.caption(f"Result cache: {stats['hits'] + stats['disk_hits']} hits, {stats['misses']} misses")
\ No newline at end of file
@@ -0,0 +1,173 @@
+"""
+Shared detokenizer of BIO token sequences.
+
+Turns the tokens and BIO tags of a sentence into its text, the spaces after its tokens and the character offsets of
+its entities. Whether a token is followed by a space only depends on the token and its neighbours, so the spaces are
+computed first from precomputed sets of marks, and the text and the token offsets follow from them with one join
+instead of growing the text token by token.
+
+The spacing is given by SpacingRules:
+- ATTACH_PUNCTUATION attaches every punctuation mark to the preceding token and ignores the tags of the marks, as
+  the MAPA texts have always been written.
+- WIKIANN_SPACING attaches opening brackets and quotes to the following token and the other marks to the preceding
+  one, as the WikiANN docs are built.
+"""
+
+PUNCTUATION_MARKS = frozenset({
+    ',', '.', '!', '?', ';', ':', '"', "'", "''", '[', ']', '(', ')', '{', '}',
+    '“', '”', '‘', '’', '–', '-', '—', '/', '\\', '|', '<', '>', '<<', '>>', '#', '*', '&', '%', '$', '@', '`', '~',
+    '‹', '›', '«', '»'
+})
+
+NO_SPACE_BEFORE_MARKS = frozenset({
+    ',', '.', '!', '?', ';', ':', ']', ')', '}', '”', '’', '>', '>>', '›', '»'
+})
+
+NO_SPACE_AFTER_MARKS = frozenset({
+    '[', '(', '{', '“', '‘', '<', '<<', '‹', '«',
+})
+
+# Two-token sequences with no space before, respectively after them
+NO_SPACE_BEFORE_SEQUENCE = ("''", "'")
+NO_SPACE_AFTER_SEQUENCE = ("'", "''")
+
+
+class SpacingRules:
+    """
+    The rules of where a detokenized sentence has no space between two tokens.
+
+    :param no_space_before: The tokens with no space before them.
+    :param no_space_after: The tokens with no space after them.
+    :param no_space_before_sequences: The pairs of tokens with no space before them.
+    :param no_space_after_sequences: The pairs of tokens with no space after them.
+    :param untagged: The tokens whose tags are ignored, they neither start, continue nor end an entity.
+    """
+
+    def __init__(self, no_space_before=(), no_space_after=(), no_space_before_sequences=(),
+                 no_space_after_sequences=(), untagged=()):
+        self.no_space_before = frozenset(no_space_before)
+        self.no_space_after = frozenset(no_space_after)
+        self.no_space_before_sequences = tuple(no_space_before_sequences)
+        self.no_space_after_sequences = tuple(no_space_after_sequences)
+        self.untagged = frozenset(untagged)
+
+    def spaces(self, tokens):
+        """
+        Computes whether each token is followed by a space.
+
+        :param tokens: The tokens of a sentence.
+        :return: The spaces of the tokens, the last token is never followed by a space.
+        """
+        if not tokens:
+            return []
+        no_space_before, no_space_after = self.no_space_before, self.no_space_after
+        if no_space_after:
+            spaces = [token not in no_space_after and next_token not in no_space_before
+                      for token, next_token in zip(tokens, tokens[1:])]
+        else:
+            spaces = [next_token not in no_space_before for next_token in tokens[1:]]
+        spaces.append(False)
+
+        # The sequences are rare, so they are only looked for when their first token occurs
+        for sequences, offset in ((self.no_space_before_sequences, -1), (self.no_space_after_sequences, 1)):
+            for first, second in sequences:
+                if first not in tokens:
+                    continue
+                for i in range(len(tokens) - 1):
+                    if tokens[i] == first and tokens[i + 1] == second and 0 <= i + offset < len(tokens):
+                        spaces[i + offset] = False
+        spaces[-1] = False
+        return spaces
+
+
+ATTACH_PUNCTUATION = SpacingRules(no_space_before=PUNCTUATION_MARKS, untagged=PUNCTUATION_MARKS)
+
+WIKIANN_SPACING = SpacingRules(
+    no_space_before=NO_SPACE_BEFORE_MARKS,
+    no_space_after=NO_SPACE_AFTER_MARKS,
+    no_space_before_sequences=[NO_SPACE_BEFORE_SEQUENCE],
+    no_space_after_sequences=[NO_SPACE_AFTER_SEQUENCE],
+)
+
+
+def _parse_tag(tag, label_map):
+    """Splits a tag into its `B` or `I` prefix, None for a tag without one, and its mapped label."""
+    if tag[:2] in ('B-', 'I-'):
+        label = tag[2:]
+        return tag[0], label if label_map is None else label_map[label]
+    return None, tag
+
+
+def detokenize(tokens, tags, rules=WIKIANN_SPACING, label_map=None):
+    """
+    Detokenizes a sentence and extracts the character offsets of its entities.
+
+    An `I-` tag continues the entity before it if that has the same label and starts a new one otherwise, as spaCy
+    reads BIO tags. A tag without a `B-` or `I-` prefix other than `O` is a one-token entity with the tag as label.
+
+    :param tokens: The tokens of the sentence, without whitespace.
+    :param tags: The BIO tags of the tokens.
+    :param rules: The spacing rules.
+    :param label_map: A mapping of the labels of the tags, a label mapped to `O` is not an entity.
+    :return: The text, the spaces of the tokens and the entities as dictionaries of start, end and label.
+    """
+    spaces = rules.spaces(tokens)
+    text = ''.join([token + ' ' if space else token for token, space in zip(tokens, spaces)])
+    if tags.count('O') == len(tags):
+        return text, spaces, []
+
+    untagged = rules.untagged
+    parsed_tags = {}
+    entities = []
+    current_entity = None
+    position = 0
+
+    for token, space, tag in zip(tokens, spaces, tags):
+        start = position
+        position += len(token) + space
+        if tag == 'O':
+            if current_entity and token not in untagged:
+                entities.append(current_entity)
+                current_entity = None
+            continue
+        if token in untagged:
+            continue
+
+        parsed_tag = parsed_tags.get(tag)
+        if parsed_tag is None:
+            parsed_tag = parsed_tags[tag] = _parse_tag(tag, label_map)
+        prefix, label = parsed_tag
+
+        if label == 'O':
+            if current_entity:
+                entities.append(current_entity)
+                current_entity = None
+        elif prefix == 'I' and current_entity and current_entity['label'] == label:
+            current_entity['end'] = start + len(token)
+        else:
+            if current_entity:
+                entities.append(current_entity)
+            current_entity = {'start': start, 'end': start + len(token), 'label': label}
+            if prefix is None:
+                entities.append(current_entity)
+                current_entity = None
+
+    if current_entity:
+        entities.append(current_entity)
+
+    return text, spaces, entities
+
+
+def detokenize_batch(batch_tokens, batch_tags, rules=WIKIANN_SPACING, label_map=None):
+    """
+    Detokenizes a batch of sentences, see detokenize.
+
+    :return: The texts, the spaces and the entities of the sentences.
+    """
+    texts, batch_spaces, batch_entities = [], [], []
+    for tokens, tags in zip(batch_tokens, batch_tags):
+        text, spaces, entities = detokenize(tokens, tags, rules, label_map)
+        texts.append(text)
+        batch_spaces.append(spaces)
+        batch_entities.append(entities)
+    return texts, batch_spaces, batch_entities
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+"""
+Benchmark of the shared detokenizer
+
+Times detokenize against the previous per-preparator implementations in detokenizer_reference.py, which grew the
+text token by token. tests/test_detokenizer.py checks that detokenize and the WikiANN docs agree with them.
+
+Example:
+    python detokenizer_benchmark.py --sentences 20000 --tokens 40
+"""
+
+import argparse
+import random
+import time
+
+from detokenizer import ATTACH_PUNCTUATION, detokenize_batch
+from detokenizer_reference import build_sentences, reference_tokens_to_spans
+
+
+def timed(function, *args, repeat=3):
+    """Returns the result of a function and its best time of several runs."""
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        seconds.append(time.perf_counter() - start)
+    return result, min(seconds)
+
+
+def main() -> None:
+    """CLI wrapper."""
+    parser = argparse.ArgumentParser(description="Benchmark the shared detokenizer against the previous ones")
+    parser.add_argument("--sentences", default=20000, type=int, help="Number of sentences")
+    parser.add_argument("--tokens", default=40, type=int, help="Maximum tokens per sentence")
+    parser.add_argument("--seed", default=0, type=int, help="Random seed")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    batch_tokens, batch_tags = build_sentences(args.sentences, args.tokens, rng)
+    _, reference_seconds = timed(
+        lambda: [reference_tokens_to_spans(tokens, tags) for tokens, tags in zip(batch_tokens, batch_tags)])
+    _, seconds = timed(detokenize_batch, batch_tokens, batch_tags, ATTACH_PUNCTUATION)
+
+    print(f"{args.sentences} sentences of up to {args.tokens} tokens:")
+    print(f"  previous     {reference_seconds:8.3f}s  {args.sentences / reference_seconds:10.0f} sentences/s")
+    print(f"  detokenize   {seconds:8.3f}s  {args.sentences / seconds:10.0f} sentences/s"
+          f"  ({reference_seconds / seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+The previous detokenizers, kept as references for tests/test_detokenizer.py and detokenizer_benchmark.py:
+tokens_to_spans of the WikiANN preparator, tokens_to_text_with_tags of the MAPA preparator and its copy in 4/mner.py,
+and the spaces of the previous WikiANN create_doc. build_sentences builds the random sentences they are compared on.
+"""
+
+from detokenizer import PUNCTUATION_MARKS
+
+WORDS = ['Jan', 'Kowalski', 'mieszka', 'w', 'Warszawie', 'nad', 'Wisłą', 'i', 'Kraków', 'r', '1920']
+MARKS = [',', '.', '(', ')', '-', '"', "'", "''", '«', '»', ':', '[', ']', '“', '”']
+LABELS = ['PER', 'LOC', 'ORG']
+TAG_LIST = ['O', 'B-PER', 'I-PER', 'B-ORG', 'I-ORG', 'B-LOC', 'I-LOC']
+
+MNER_MARKS = {',', '.', '!', '?', ';', ':', '"', "'s"}
+
+NO_SPACE_BEFORE_MARKS = {',', '.', '!', '?', ';', ':', ']', ')', '}', '”', '’', '>', '>>', '›', '»'}
+NO_SPACE_AFTER_MARKS = {'[', '(', '{', '“', '‘', '<', '<<', '‹', '«'}
+
+
+def reference_tokens_to_spans(tokens, tags, tag_map=None, punctuation_marks=PUNCTUATION_MARKS, advance=True):
+    """tokens_to_spans and tokens_to_text_with_tags, and with advance=False the copy in 4/mner.py."""
+    sentence = ""
+    entities = []
+    current_pos = 0
+    current_entity = None
+
+    for token, tag in zip(tokens, tags):
+        if token in punctuation_marks:
+            sentence += token
+            if advance:
+                current_pos += len(token)
+        else:
+            if sentence and not sentence.endswith(' '):
+                sentence += ' '
+                current_pos += 1
+            start_pos = current_pos
+            sentence += token
+            end_pos = current_pos + len(token)
+            current_pos = end_pos
+
+            if tag.startswith('B-'):
+                if current_entity:
+                    entities.append(current_entity)
+                current_entity = {'start': start_pos, 'end': end_pos,
+                                  'label': tag_map[tag[2:]] if tag_map else tag[2:]}
+            elif tag.startswith('I-') and current_entity:
+                current_entity['end'] = end_pos
+            elif tag != 'O':
+                if current_entity:
+                    entities.append(current_entity)
+                    current_entity = None
+                entities.append({'start': start_pos, 'end': end_pos, 'label': tag})
+            else:
+                if current_entity:
+                    entities.append(current_entity)
+                    current_entity = None
+
+    if current_entity:
+        entities.append(current_entity)
+
+    return sentence, entities
+
+
+def reference_compute_spaces(tokens):
+    """The spaces of the WikiANN docs as create_doc computed them."""
+    tokens_len = len(tokens)
+    spaces = [True] * tokens_len
+    spaces[tokens_len - 1] = False
+
+    for i, token in enumerate(tokens):
+        if i > 0 and (token in NO_SPACE_BEFORE_MARKS or
+                      i < tokens_len - 1 and tokens[i] == "''" and tokens[i + 1] == "'"):
+            spaces[i - 1] = False
+        if token in NO_SPACE_AFTER_MARKS or \
+                i > 0 and tokens[i - 1] == "'" and tokens[i] == "''":
+            spaces[i] = False
+
+    return spaces
+
+
+def build_sentences(count, tokens, rng, marks=MARKS):
+    """Builds sentences of words and marks with well-formed BIO tags, an I- tag only continues its own label."""
+    batch_tokens, batch_tags = [], []
+    for _ in range(count):
+        sentence_tokens, sentence_tags, label = [], [], None
+        for _ in range(rng.randint(1, tokens)):
+            token = rng.choice(marks) if rng.random() < 0.25 else rng.choice(WORDS)
+            if token in marks:
+                # The previous implementations ignore the tags of the marks, they do not end an entity
+                sentence_tags.append(rng.choice(TAG_LIST))
+            elif label and rng.random() < 0.5:
+                sentence_tags.append(f'I-{label}')
+            elif rng.random() < 0.3:
+                label = rng.choice(LABELS)
+                sentence_tags.append(f'B-{label}')
+            else:
+                label = None
+                sentence_tags.append('O')
+            if token not in marks and sentence_tags[-1] == 'O':
+                label = None
+            sentence_tokens.append(token)
+        batch_tokens.append(sentence_tokens)
+        batch_tags.append(sentence_tags)
+    return batch_tokens, batch_tags
@@ -3,9 +3,11 @@ import os
 import datasets
 import spacy
 from datasets import DatasetDict
-from spacy.tokens import DocBin
+from spacy.tokens import Doc, DocBin
 from tqdm import tqdm
 
+from detokenizer import ATTACH_PUNCTUATION, detokenize
+
 DS_PATH = 'joelniklaus/mapa'
 
 def tokens_to_text_with_tags(tokens, tags, tag_map):
@@ -21,48 +23,8 @@ def tokens_to_text_with_tags(tokens, tags, tag_map):
     Returns:
         Tuple[str, List[Dict[str, int | str]]]: The formatted sentence and entity list.
     """
-    sentence = ""
-    entities = []
-    current_pos = 0
-    current_entity = None
-
-    for token, tag in zip(tokens, tags):
-        if token in {
-            ',', '.', '!', '?', ';', ':', '"', "'", "''", '[', ']', '(', ')', '{', '}',
-            '“', '”', '‘', '’', '–', '-', '—', '/', '\\', '|', '<', '>', '<<', '>>', '#', '*', '&', '%', '$', '@', '`', '~',
-            '‹', '›', '«', '»'
-        }:
-            sentence += token  # Attach punctuation directly
-            current_pos += len(token)
-        else:
-            if sentence and not sentence.endswith(' '):
-                sentence += ' '
-                current_pos += 1
-            start_pos = current_pos
-            sentence += token
-            end_pos = current_pos + len(token)
-            current_pos = end_pos
-
-            if tag.startswith('B-'):
-                if current_entity:
-                    entities.append(current_entity)
-                current_entity = {'start': start_pos, 'end': end_pos, 'label': tag_map[tag[2:]]}
-            elif tag.startswith('I-') and current_entity:
-                current_entity['end'] = end_pos
-            elif tag != 'O':
-                if current_entity:
-                    entities.append(current_entity)
-                    current_entity = None
-                entities.append({'start': start_pos, 'end': end_pos, 'label': tag})
-            else:
-                if current_entity:
-                    entities.append(current_entity)
-                    current_entity = None
-
-    if current_entity:
-        entities.append(current_entity)
-
-    return sentence, entities
+    text, _, entities = detokenize(tokens, tags, ATTACH_PUNCTUATION, tag_map)
+    return text, entities
 
 
 def load_ds(path, name, language):
@@ -91,63 +53,62 @@ def load_and_split_ds(path, name, test_size=0.2):
             'validation': ds_split_2['train']})
 
 
+def map_tags(tags, tag_map):
+    """
+    Maps the labels of IOB tags, a label mapped to 'O' makes the tag 'O'. An 'I-' tag that does not continue an
+    entity of the same label starts a new one, as spaCy rejects it otherwise.
+
+    Args:
+        tags (List[str]): The IOB tags of a sentence.
+        tag_map (Dict[str, str]): The labels by dataset label.
+
+    Returns:
+        List[str]: The mapped IOB tags.
+    """
+    mapped_tags = []
+    previous_label = 'O'
+    for tag in tags:
+        prefix, _, label = tag.partition('-')
+        label = tag_map[label] if label else 'O'
+        if label == 'O':
+            mapped_tags.append('O')
+        else:
+            mapped_tags.append(f"{'I' if prefix == 'I' and label == previous_label else 'B'}-{label}")
+        previous_label = label
+    return mapped_tags
+
+
+def create_docs(batch, nlp, tag_map):
+    """
+    Creates the docs of a batch of dataset rows from their tokens, without tokenizing them again.
+
+    Args:
+        batch (Dict[str, List]): The columns of the rows, as returned by Dataset.iter.
+        nlp (Language): The pipeline whose vocab the docs use.
+        tag_map (Dict[str, str]): The labels by dataset label.
+
+    Returns:
+        List[Doc]: The docs of the rows.
+    """
+    docs = []
+    for tokens, tags in zip(batch['tokens'], batch['coarse_grained']):
+        # Empty tokens are not valid words of a Doc, and they add nothing to the text
+        if '' in tokens:
+            tokens, tags = [token for token in tokens if token], [tag for token, tag in zip(tokens, tags) if token]
+        docs.append(Doc(nlp.vocab, tokens, ATTACH_PUNCTUATION.spaces(tokens), ents=map_tags(tags, tag_map)))
+    return docs
+
+
 def create_spacy_doc_bin_files(dataset, output_dir, file_name, language, tag_map, chunk_size=100):
     os.makedirs(output_dir, exist_ok=True)  # Ensure output directory exists
 
     nlp = spacy.blank(language)
-    docs_limit = len(dataset)
-    file_index = 0
-
-    for i in tqdm(range(0, docs_limit, chunk_size), "Serialization:"):
-        db = DocBin()
-        for j in range(i, min(i + chunk_size, docs_limit)):
-            datum = dataset[j]
-            text, tags = tokens_to_text_with_tags(datum['tokens'], datum['coarse_grained'], tag_map)
-            doc = nlp(text)
-            ents = []
-            for tag in tags:
-                start = tag.get('start')
-                end = tag.get('end')
-                label = tag.get('label')
-
-                span = doc.char_span(start, end, label=label)
-
-                try:
-                    if text[start].isspace():
-                        print(f"Entity span '{text[start:end]}' has leading whitespace. Skipping.")
-                        print(f"Text: '{text}'")
-                        span = None
-
-                    if text[end - 1].isspace():
-                        print(f"Entity span '{text[start:end]}' has trailing whitespace. Skipping.")
-                        print(f"Text: '{text}'")
-                        span = None
-                except IndexError:
-                    print(f"Index is out of range. start: {start}, end: {end}, test: '{text}'")
-                    span = None
-
-                if span is not None:
-                    ents.append(span)
-
-            # Discard overlapping entities and keep the longest one
-            ents = sorted(ents, key=lambda x: (x.start, -x.end + x.start))
-            filtered_ents = []
-            for ent in ents:
-                if not filtered_ents or ent.start >= filtered_ents[-1].end:
-                    filtered_ents.append(ent)
-
-            try:
-                doc.ents = filtered_ents
-            except ValueError as ex:
-                print(f"ValueError raised.")
-                print(f"filtered_ents={filtered_ents}, text={text}")
-                raise ex
-            db.add(doc)
+    batches = dataset.select_columns(['tokens', 'coarse_grained']).iter(batch_size=chunk_size)
 
+    for file_index, batch in enumerate(tqdm(batches, "Serialization:", total=-(-len(dataset) // chunk_size))):
         # Save the chunk to a new file
         output_file = os.path.join(output_dir, f'{file_name}{file_index + 1}.spacy')
-        db.to_disk(output_file)
-        file_index += 1
+        DocBin(docs=create_docs(batch, nlp, tag_map)).to_disk(output_file)
 
 
 def create_spacy_files(data_source, language, tag_map):
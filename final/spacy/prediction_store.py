@@ -0,0 +1,213 @@
+"""
+Persistent store of model predictions
+
+The evaluators of the spaCy, TNER and XLM-R models save what a model predicted on a shard of a test set, together
+with the gold labels of the shard, so that the metrics can be computed again with rescore_predictions.py, e.g. with
+another label mapping or report format, without running the model again.
+
+An entry is keyed by (model hash, shard hash) and written as gzipped JSON to
+`{store}/{model hash}/{shard hash}.json.gz`:
+
+    {"version": 1, "kind": "tner", "model": "...", "model_hash": "...", "language": "sl", "shard": "...",
+     "shard_hash": "...", "seconds": 12.3, "created": "...", "sentences": [...]}
+
+Every sentence holds the gold `tokens` and `tags` and the predictions in the form of its kind:
+- spacy: the `spaces` of the tokens, the tokens and spaces the model predicted on, `pred_tokens` and `pred_spaces`,
+  and the `entities` as [start char, end char, label]. A gold tag of a token with missing annotation is empty.
+- tner: the sub-word tokens the model read, `input`, their `probability` and the `entities` as
+  [positions in input, label, probabilities].
+- xlmr: the `entities` as [start char, end char, label, score] in the tokens joined by spaces.
+
+The model hash is the hash of the files of a local model directory, or of the current commit of a 🤗 Hub model, and
+the shard hash is the hash of the gold data, so an entry is only reused for the same model on the same data.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from token_alignment import align_entity_offsets_to_tokens, align_predictions_to_tokens
+
+STORE_VERSION = 1
+ENTRY_SUFFIX = '.json.gz'
+MODEL_HASHES_FILE = 'model_hashes.json'
+KINDS = ('spacy', 'tner', 'xlmr')
+CHUNK_SIZE = 1024 * 1024
+# The scores are only reported, so they are kept with as many digits as the reports print
+SCORE_DIGITS = 4
+
+
+def file_sha256(path) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def data_hash(*parts) -> str:
+    """Returns the hash of JSON-serializable data, e.g. the tokens and tags of a shard."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def round_scores(scores):
+    """Rounds a score or a list of scores, None stays None."""
+    if scores is None:
+        return None
+    if isinstance(scores, (list, tuple)):
+        return [round(float(score), SCORE_DIGITS) for score in scores]
+    return round(float(scores), SCORE_DIGITS)
+
+
+class PredictionStore:
+    """
+    Directory of the predictions of models on shards of test sets.
+
+    :param root: The directory of the store, created when missing.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, model_hash: str, shard_hash: str) -> Path:
+        return Path(self.root, model_hash, f"{shard_hash}{ENTRY_SUFFIX}")
+
+    def load(self, model_hash: str, shard_hash: str) -> Optional[dict]:
+        """Returns the entry of the model and shard, None when it is missing or of another version."""
+        try:
+            with gzip.open(self.path(model_hash, shard_hash), 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        return entry if entry.get('version') == STORE_VERSION else None
+
+    def save(self, kind: str, model: str, model_hash: str, language: str, shard: str, shard_hash: str,
+             sentences: List[dict], seconds: float) -> dict:
+        """
+        Writes the predictions of a model on a shard.
+
+        :param kind: The kind of the predictions, one of KINDS.
+        :param model: The name or path of the model.
+        :param model_hash: The hash of the model, see model_hash.
+        :param language: The language of the shard.
+        :param shard: The name or path of the shard.
+        :param shard_hash: The hash of the gold data of the shard.
+        :param sentences: The gold data and predictions of the sentences of the shard.
+        :param seconds: The time the model took to predict the shard.
+        :return: The written entry.
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Unknown kind of predictions {kind}, expected one of {', '.join(KINDS)}")
+        entry = {
+            'version': STORE_VERSION,
+            'kind': kind,
+            'model': str(model),
+            'model_hash': model_hash,
+            'language': language,
+            'shard': str(shard),
+            'shard_hash': shard_hash,
+            'seconds': seconds,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'sentences': sentences,
+        }
+        path = self.path(model_hash, shard_hash)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first, so a concurrent reader never sees a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file, gzip.open(tmp_file, 'wt', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return entry
+
+    def entries(self, model_hash: str = '') -> Iterator[dict]:
+        """Yields the entries of the models whose hash starts with the given prefix, all of them by default."""
+        for path in sorted(self.root.glob(f"{model_hash}*/*{ENTRY_SUFFIX}")):
+            entry = self.load(path.parent.name, path.name[:-len(ENTRY_SUFFIX)])
+            if entry is not None:
+                yield entry
+
+    def _model_hashes(self) -> Dict[str, dict]:
+        try:
+            with open(Path(self.root, MODEL_HASHES_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def model_hash(self, name_or_path: str) -> str:
+        """
+        Returns the hash of a model.
+
+        The hash of a local directory is the hash of the names and contents of its files. It is kept in the store
+        with the sizes and modification times of the files, so that the files are only read again when they change.
+        A name that is not a directory is looked up on the 🤗 Hub and hashed with its current commit.
+
+        :param name_or_path: The directory of the model, or its name on the 🤗 Hub.
+        :return: The hex digest of the model.
+        """
+        directory = Path(name_or_path)
+        if not directory.is_dir():
+            from huggingface_hub import HfApi
+
+            return data_hash('hub', str(name_or_path), HfApi().model_info(str(name_or_path)).sha)
+
+        files = sorted(path for path in directory.resolve().rglob('*') if path.is_file())
+        signature = data_hash([(str(path), path.stat().st_size, path.stat().st_mtime_ns) for path in files])
+        model_hashes = self._model_hashes()
+        known = model_hashes.get(str(directory.resolve()))
+        if known and known['signature'] == signature:
+            return known['hash']
+
+        digest = data_hash([(path.relative_to(directory.resolve()).as_posix(), file_sha256(path)) for path in files])
+        model_hashes[str(directory.resolve())] = {'signature': signature, 'hash': digest}
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(model_hashes, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, Path(self.root, MODEL_HASHES_FILE))
+        return digest
+
+
+def map_tag(tag: str, label_map: Optional[Dict[str, str]]) -> str:
+    if not label_map or tag[:2] not in ('B-', 'I-'):
+        return tag
+    label = label_map.get(tag[2:], tag[2:])
+    return 'O' if label == 'O' else f"{tag[:2]}{label}"
+
+
+def entry_labels(entry: dict, label_map: Optional[Dict[str, str]] = None) -> Tuple[List[List[str]], List[List[str]]]:
+    """
+    Returns the gold and the predicted IOB2 labels of the tokens of an entry, as seqeval scores them.
+
+    :param entry: An entry of the store.
+    :param label_map: A mapping of the labels of both, a label mapped to `O` is not an entity.
+    :return: The gold and the predicted labels of the sentences.
+    """
+    true_labels, pred_labels = [], []
+    kind = entry['kind']
+    for sentence in entry['sentences']:
+        tokens = sentence['tokens']
+        if kind == 'tner':
+            pred = align_predictions_to_tokens(tokens, sentence['input'],
+                                               [(positions, label) for positions, label, _ in sentence['entities']])
+        elif kind == 'xlmr':
+            entities = [{'start': start, 'end': end, 'entity_group': label}
+                        for start, end, label, _ in sentence['entities']]
+            pred = align_entity_offsets_to_tokens(tokens, entities, ' '.join(tokens))
+        else:
+            text = ''.join([token + ' ' if space else token for token, space in zip(tokens, sentence['spaces'])])
+            entities = [{'start': start, 'end': end, 'entity_group': label}
+                        for start, end, label in sentence['entities']]
+            pred = align_entity_offsets_to_tokens(tokens, entities, text)
+        # Tokens with missing annotation count as outside of entities
+        true_labels.append([map_tag(tag or 'O', label_map) for tag in sentence['tags']])
+        pred_labels.append([map_tag(tag, label_map) for tag in pred])
+    return true_labels, pred_labels
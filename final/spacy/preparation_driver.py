@@ -0,0 +1,341 @@
+"""
+Shared driver of the dataset preparators.
+
+A preparator plans the shards of its (language, split) datasets and provides a function that converts one slice of
+rows into one output file. The driver runs the shards in a process pool, largest first so that the workers finish
+together, writes every shard atomically and prints an aggregated progress and throughput summary.
+
+Every shard has a key, a hash of its inputs: the fingerprint of the dataset, the rows of the shard and whatever else
+the preparator passes, e.g. the shuffle seed, the version of the QID index and the version of the converter. The keys
+of the written shards are kept in a `.manifest.json` per output directory, and shards whose key did not change are
+not converted again. A shard that writes several files, e.g. in several formats, has a key per file, and only its
+files whose key changed are written again.
+
+Text shards can be merged into one file per split. The byte range and key of every shard in a merged file are kept in
+a `.segments.json` next to it, and the shards are deleted after a successful merge, so that their data is only on
+disk once. A shard that is up to date is copied from its range of the previous merged file, and only the shards that
+changed are converted again.
+"""
+
+import contextlib
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from functools import lru_cache
+
+import spacy
+from tqdm import tqdm
+
+MANIFEST_FILE = '.manifest.json'
+SEGMENTS_SUFFIX = '.segments.json'
+COPY_BLOCK_SIZE = 1024 * 1024
+
+
+@dataclass
+class ShardUnit:
+    language: str
+    split: str
+    start: int
+    stop: int
+    output_file: str
+    cost: float = 0.0
+    key: str = ''
+    # Further files that the conversion of the shard writes besides output_file, and their keys, by default the key
+    # of the shard
+    extra_outputs: tuple = ()
+    extra_keys: tuple = ()
+
+    @property
+    def outputs(self):
+        """The files of the shard with their keys."""
+        extra_keys = self.extra_keys or (self.key,) * len(self.extra_outputs)
+        return ((self.output_file, self.key), *zip(self.extra_outputs, extra_keys))
+
+    @property
+    def size(self):
+        return self.stop - self.start
+
+
+@lru_cache(maxsize=None)
+def blank_model(blank_language):
+    """Returns the blank pipeline of a SpaCy language code, created once per process."""
+    return spacy.blank(blank_language)
+
+
+def shuffle_and_select(dataset, limit, seed=None):
+    """Shuffles the dataset and writes the selected rows contiguously, so they are not read through an indices mapping."""
+    return dataset.shuffle(seed=seed).select(range(min(limit, len(dataset)))).flatten_indices()
+
+
+def shard_key(**inputs):
+    """Returns the hash of the inputs of a shard."""
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def plan_shards(dataset, language, split, output_dir, file_name, shard_size, suffix='.spacy', inputs=None):
+    """
+    Splits a dataset into consecutive shards named `{file_name}{N}{suffix}`.
+
+    Args:
+        dataset (Dataset): The dataset of the split.
+        language (str): The language of the dataset.
+        split (str): The name of the split, used to look the dataset up in the workers.
+        output_dir (str): The directory of the shards.
+        file_name (str): The prefix of the shard files.
+        shard_size (int): The number of rows in one shard.
+        suffix (str): The extension of the shard files.
+        inputs (Dict[str, object]): Further inputs of the shards besides the dataset, e.g. the seed and the versions
+            of the converter and of the lookup tables it uses.
+
+    Returns:
+        List[ShardUnit]: The shards of the dataset.
+    """
+    units = []
+    for index, start in enumerate(range(0, len(dataset), shard_size)):
+        stop = min(start + shard_size, len(dataset))
+        key = shard_key(fingerprint=dataset._fingerprint, start=start, stop=stop, **(inputs or {}))
+        output_file = os.path.join(output_dir, f'{file_name}{index + 1}{suffix}')
+        units.append(ShardUnit(language, split, start, stop, output_file, cost=stop - start, key=key))
+    return units
+
+
+def read_manifest(output_dir):
+    """Returns the keys of the shards written to a directory by file name."""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def write_manifest(output_dir, manifest):
+    os.makedirs(output_dir, exist_ok=True)
+    with atomic_output(os.path.join(output_dir, MANIFEST_FILE)) as tmp_path, open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def read_segments(merged_file):
+    """
+    Returns the shards of a merged file as {shard file name: {'key', 'offset', 'length'}}, nothing when the merged
+    file is missing or was changed after the merge.
+    """
+    try:
+        with open(f'{merged_file}{SEGMENTS_SUFFIX}', 'r', encoding='utf-8') as f:
+            segments = json.load(f)
+        if segments['file'] != _file_signature(merged_file):
+            return {}
+    except FileNotFoundError:
+        return {}
+    return {segment['shard']: segment for segment in segments['segments']}
+
+
+def stale_outputs(unit, manifests, segments=None):
+    """
+    Returns the files of the shard that were written with another key, or are neither on disk nor in a merged file.
+
+    Args:
+        unit (ShardUnit): The shard.
+        manifests (Dict[str, Dict[str, str]]): The manifests by output directory.
+        segments (Dict[str, Dict[str, dict]]): The segments of the merged file of each merged shard file.
+    """
+    def is_available(path, key):
+        if os.path.exists(path):
+            return True
+        segment = (segments or {}).get(path, {}).get(os.path.basename(path))
+        return segment is not None and segment['key'] == key
+
+    return tuple(
+        path for path, key in unit.outputs
+        if manifests[os.path.dirname(path)].get(os.path.basename(path)) != key or not is_available(path, key)
+    )
+
+
+@contextlib.contextmanager
+def atomic_output(path):
+    """Yields a temporary path and moves it to the given path only if the block succeeds."""
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# The state of a worker process, set once by the pool initializer instead of being sent with every shard
+_datasets = None
+_convert = None
+_convert_kwargs = None
+
+
+def _init_worker(datasets, convert, convert_kwargs):
+    global _datasets, _convert, _convert_kwargs
+    _datasets, _convert, _convert_kwargs = datasets, convert, convert_kwargs
+
+
+def _run_unit(unit, outputs):
+    start = time.perf_counter()
+    for path in outputs:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    rows = _datasets[(unit.language, unit.split)].select(range(unit.start, unit.stop))
+    # Only a shard with further files can write some of its files and not others
+    outputs_kwargs = {'outputs': outputs} if unit.extra_outputs else {}
+    counts = _convert(rows, unit.output_file, language=unit.language, **outputs_kwargs, **_convert_kwargs)
+    return unit, outputs, time.perf_counter() - start, counts
+
+
+def run_units(units, datasets, convert, workers=1, force=False, merges=None, **convert_kwargs):
+    """
+    Converts the shards that are not up to date, in a process pool when more than one worker is requested, and
+    merges text shards into one file per split.
+
+    Args:
+        units (List[ShardUnit]): The shards to convert.
+        datasets (Dict[Tuple[str, str], Dataset]): The datasets by (language, split).
+        convert (Callable): A module level function called as
+            `convert(rows, output_file, language=..., **convert_kwargs)`, which must write output_file. For a shard
+            with extra_outputs it is called with `outputs=...` as well, the files of the shard that are not up to
+            date, and must write those. It may return a dictionary of counts, e.g. of dropped rows, which are
+            summed up over all shards.
+        workers (int): The number of worker processes.
+        force (bool): Whether to convert all shards, also the ones that are up to date.
+        merges (Dict[str, List[str]]): The files, written by the shards, to merge into each merged file, in order.
+            They are deleted after the merge, see merge_shards.
+        **convert_kwargs: Further arguments of convert.
+
+    Returns:
+        Dict[Tuple[str, str], Dict[str, float]]: The shards, rows and busy seconds by (language, split).
+    """
+    output_dirs = {os.path.dirname(path) for unit in units for path, _ in unit.outputs}
+    manifests = {output_dir: read_manifest(output_dir) for output_dir in output_dirs}
+    planned = defaultdict(set)
+    for unit in units:
+        for path, _ in unit.outputs:
+            planned[os.path.dirname(path)].add(os.path.basename(path))
+    for output_dir, manifest in manifests.items():
+        # Shards of an earlier run that are no longer planned, e.g. after the dataset shrank, would be read as well
+        for file_name in set(manifest) - planned[output_dir]:
+            del manifest[file_name]
+            if os.path.exists(os.path.join(output_dir, file_name)):
+                os.remove(os.path.join(output_dir, file_name))
+
+    merges = merges or {}
+    merged_segments = {merged_file: read_segments(merged_file) for merged_file in merges}
+    segments = {path: merged_segments[merged_file] for merged_file, paths in merges.items() for path in paths}
+    keys = {path: key for unit in units for path, key in unit.outputs}
+    stale = [(unit, tuple(path for path, _ in unit.outputs) if force else stale_outputs(unit, manifests, segments))
+             for unit in units]
+    stale = sorted([(unit, outputs) for unit, outputs in stale if outputs], key=lambda s: s[0].cost, reverse=True)
+    print(f"{len(units) - len(stale)} of {len(units)} shards are up to date.", flush=True)
+    units = [unit for unit, _ in stale]
+    summary = defaultdict(lambda: {'shards': 0, 'rows': 0, 'seconds': 0.0})
+    counts = Counter()
+    started = time.perf_counter()
+
+    with tqdm(total=sum(u.size for u in units), desc='Preparation', unit='rows') as progress:
+        def account(unit, outputs, seconds, unit_counts):
+            stats = summary[(unit.language, unit.split)]
+            stats['shards'] += 1
+            stats['rows'] += unit.size
+            stats['seconds'] += seconds
+            counts.update(unit_counts or {})
+            for path in outputs:
+                manifests[os.path.dirname(path)][os.path.basename(path)] = keys[path]
+            progress.update(unit.size)
+
+        # The manifests are written also when the run fails, so that the shards written so far are kept
+        try:
+            if workers <= 1:
+                _init_worker(datasets, convert, convert_kwargs)
+                for unit, outputs in stale:
+                    account(*_run_unit(unit, outputs))
+            else:
+                # Forked workers share the memory-mapped datasets and the lookup tables of the parent
+                context = multiprocessing.get_context('fork')
+                with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                         initargs=(datasets, convert, convert_kwargs)) as executor:
+                    futures = [executor.submit(_run_unit, unit, outputs) for unit, outputs in stale]
+                    for future in as_completed(futures):
+                        account(*future.result())
+        finally:
+            for output_dir, manifest in manifests.items():
+                write_manifest(output_dir, manifest)
+
+    print_summary(summary, time.perf_counter() - started, workers, counts)
+
+    for merged_file, paths in merges.items():
+        merge_shards(paths, merged_file, [keys[path] for path in paths])
+        print(f"Written {merged_file}.")
+    return dict(summary)
+
+
+def print_summary(summary, wall_seconds, workers, counts=None):
+    print(f"\nPrepared {sum(s['shards'] for s in summary.values())} shards with {workers} worker(s) "
+          f"in {wall_seconds:.1f}s:")
+    for (language, split), stats in sorted(summary.items()):
+        rate = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+        print(f"  {language:3} {split:10} {stats['shards']:6} shards {stats['rows']:9} rows  {rate:9.0f} rows/s")
+    total_rows = sum(s['rows'] for s in summary.values())
+    print(f"  Total {total_rows} rows, {total_rows / wall_seconds if wall_seconds else 0.0:.0f} rows/s")
+    for name, count in sorted((counts or {}).items()):
+        print(f"  {name}: {count}")
+
+
+def _copy(src, out, length=None):
+    while length is None or length > 0:
+        block = src.read(COPY_BLOCK_SIZE if length is None else min(COPY_BLOCK_SIZE, length))
+        if not block:
+            break
+        out.write(block)
+        if length is not None:
+            length -= len(block)
+
+
+def merge_shards(shard_files, output_file, keys):
+    """
+    Concatenates text shards in the given order into one file and deletes the shards.
+
+    A shard that is no longer on disk is copied from its range of the previous merged file. The ranges are written
+    to the segments of the merged file before it replaces the previous one, and the shards are only deleted after it
+    did, so an interrupted merge leaves either the shards or a merged file that holds them.
+
+    Args:
+        shard_files (List[str]): The shards, in the order of the merged file.
+        output_file (str): The merged file.
+        keys (List[str]): The key of every shard.
+    """
+    previous = read_segments(output_file)
+    segments, offset = [], 0
+    with atomic_output(output_file) as tmp_path:
+        with open(tmp_path, 'wb') as out, \
+                open(output_file, 'rb') if previous else contextlib.nullcontext() as previous_file:
+            for shard_file, key in zip(shard_files, keys):
+                name = os.path.basename(shard_file)
+                if os.path.exists(shard_file):
+                    with open(shard_file, 'rb') as shard:
+                        _copy(shard, out)
+                else:
+                    segment = previous.get(name)
+                    if segment is None or segment['key'] != key:
+                        raise FileNotFoundError(f"{shard_file} is neither on disk nor merged into {output_file}")
+                    previous_file.seek(segment['offset'])
+                    _copy(previous_file, out, segment['length'])
+                segments.append({'shard': name, 'key': key, 'offset': offset, 'length': out.tell() - offset})
+                offset = out.tell()
+        with atomic_output(f'{output_file}{SEGMENTS_SUFFIX}') as segments_tmp_path, \
+                open(segments_tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'file': _file_signature(tmp_path), 'segments': segments}, f, indent=1)
+
+    for shard_file in shard_files:
+        if os.path.exists(shard_file):
+            os.remove(shard_file)
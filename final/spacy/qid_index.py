@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+"""
+QID label index
+
+Turns the WikiData QID lists (`PER-ND.txt`, `PER-FI.txt`, `LOC-ND.txt`, `ORG-ND.txt`) into a sorted integer array of
+QIDs and a parallel array of label codes, stored as `.npy` files that are memory-mapped when they are opened. The
+index is built once, and every process that opens it shares the page-cached arrays instead of building its own sets
+of strings. Lookups are binary searches over whole batches of QIDs.
+
+The sizes, modification times and hashes of the lists are stored with the index, and the index is built again when it
+is opened after one of the lists changed, so that its version changes with them.
+
+Example:
+    python qid_index.py --output qid_index
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from functools import lru_cache
+from itertools import islice
+
+import numpy as np
+
+INDEX_DIR = 'qid_index'
+QIDS_FILE = 'qids.npy'
+LABELS_FILE = 'labels.npy'
+META_FILE = 'meta.json'
+
+# Label codes, 0 is a QID that is not in any list
+LABELS = [None, 'LOC', 'PER', 'ORG']
+UNKNOWN = 0
+
+# The lists of every label, a QID in several lists gets the label that comes first here
+SOURCES = {
+    'LOC': ['LOC-ND.txt'],
+    'PER': ['PER-ND.txt', 'PER-FI.txt'],
+    'ORG': ['ORG-ND.txt'],
+}
+
+READ_LINES = 1_000_000
+CHUNK_SIZE = 1024 * 1024
+
+
+def parse_qid(qid):
+    """Returns the number of a QID, an integer or a string with or without the `Q` prefix, -1 if it is not one."""
+    qid = '' if qid is None else str(qid).strip().lstrip('Q')
+    return int(qid) if qid.isascii() and qid.isdigit() else -1
+
+
+def read_qids(file_path):
+    """
+    Reads the QIDs of a list, one per line, with or without the `Q` prefix. Lines that are not a QID are skipped.
+
+    :param file_path: The file to read from.
+    :return: A sorted array of the unique QIDs.
+    """
+    chunks = []
+    with open(file_path, 'r') as file:
+        while lines := list(islice(file, READ_LINES)):
+            qids = [line.strip().lstrip('Q') for line in lines]
+            chunks.append(np.array([qid for qid in qids if qid.isascii() and qid.isdigit()], dtype=np.int64))
+    return np.unique(np.concatenate(chunks)) if chunks else np.empty(0, dtype=np.int64)
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def _file_stat(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def source_files(sources):
+    """Returns the sizes, modification times and hashes of the list files, by path."""
+    return {file_path: {'sha256': file_sha256(file_path), **_file_stat(file_path)}
+            for file_paths in sources.values() for file_path in file_paths}
+
+
+def is_up_to_date(index_dir=INDEX_DIR, sources=None):
+    """
+    Checks that the index was built from the given lists and that none of them changed since.
+
+    A list whose size or modification time changed is hashed again, so that only a change of its content counts.
+    A list that is missing counts as changed, building the index then fails on it.
+    """
+    sources = sources or SOURCES
+    try:
+        with open(os.path.join(index_dir, META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if meta.get('sources') != sources:
+        return False
+
+    stamped_files = meta.get('files', {})
+    for file_paths in sources.values():
+        for file_path in file_paths:
+            stamped = stamped_files.get(file_path)
+            if stamped is None or not os.path.isfile(file_path):
+                return False
+            if {key: stamped.get(key) for key in ('size', 'mtime_ns')} != _file_stat(file_path) \
+                    and file_sha256(file_path) != stamped.get('sha256'):
+                return False
+    return True
+
+
+def build_index(output_dir=INDEX_DIR, sources=None):
+    """
+    Builds the index of the QID lists.
+
+    :param output_dir: The directory to write the index to.
+    :param sources: The list files of every label, by default SOURCES.
+    :return: The version of the index, a hash of its content.
+    """
+    sources = sources or SOURCES
+    files = source_files(sources)
+    qids, codes = [], []
+    for label, file_paths in sources.items():
+        label_qids = np.unique(np.concatenate([read_qids(file_path) for file_path in file_paths]))
+        qids.append(label_qids)
+        codes.append(np.full(len(label_qids), LABELS.index(label), dtype=np.uint8))
+        print(f"{label}: {len(label_qids)} QIDs", flush=True)
+
+    # Sort by QID and then by the order of the sources, and keep the first label of every QID
+    priorities = np.concatenate([np.full(len(q), i, dtype=np.uint8) for i, q in enumerate(qids)])
+    qids, codes = np.concatenate(qids), np.concatenate(codes)
+    order = np.lexsort((priorities, qids))
+    qids, codes = qids[order], codes[order]
+    first = np.ones(len(qids), dtype=bool)
+    first[1:] = qids[1:] != qids[:-1]
+    qids, codes = qids[first], codes[first]
+
+    version = hashlib.sha256(qids.tobytes() + codes.tobytes()).hexdigest()[:16]
+    os.makedirs(output_dir, exist_ok=True)
+    for file_name, array in ((QIDS_FILE, qids), (LABELS_FILE, codes)):
+        tmp_path = os.path.join(output_dir, f'{file_name}.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, os.path.join(output_dir, file_name))
+    with open(os.path.join(output_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'version': version, 'size': len(qids), 'sources': sources, 'files': files}, f, indent=2)
+    return version
+
+
+class QidIndex:
+    """A memory-mapped QID to label index written by build_index."""
+
+    def __init__(self, index_dir=INDEX_DIR):
+        self.qids = np.load(os.path.join(index_dir, QIDS_FILE), mmap_mode='r')
+        self.codes = np.load(os.path.join(index_dir, LABELS_FILE), mmap_mode='r')
+        with open(os.path.join(index_dir, META_FILE), 'r', encoding='utf-8') as f:
+            self.version = json.load(f)['version']
+
+    def lookup(self, qids):
+        """
+        Looks up the label codes of a batch of QIDs.
+
+        :param qids: An integer array of QIDs, negative for a missing QID.
+        :return: A uint8 array of label codes, UNKNOWN for the QIDs that are not in the index.
+        """
+        qids = np.asarray(qids, dtype=np.int64)
+        codes = np.full(len(qids), UNKNOWN, dtype=np.uint8)
+        if len(self.qids):
+            positions = np.minimum(np.searchsorted(self.qids, qids), len(self.qids) - 1)
+            found = self.qids[positions] == qids
+            codes[found] = self.codes[positions[found]]
+        return codes
+
+    def labels(self, qids):
+        """Returns the label names of a batch of QIDs, None for the QIDs that are not in the index."""
+        return [LABELS[code] for code in self.lookup(qids)]
+
+
+def open_index(index_dir=INDEX_DIR, sources=None):
+    """Opens the index, building it first if it is missing or if its QID lists changed since it was built."""
+    if not is_up_to_date(index_dir, sources):
+        print(f"Building the QID index in {index_dir}...", flush=True)
+        build_index(index_dir, sources)
+    return QidIndex(index_dir)
+
+
+@lru_cache(maxsize=None)
+def get_qid_index(index_dir=INDEX_DIR):
+    """Opens the index of the QID lists of the working directory once per process, see open_index."""
+    return open_index(index_dir)
+
+
+def qids_to_array(qids):
+    """
+    Converts QIDs as given by the dataset, integers, `Q` strings or None, to an integer array.
+
+    A missing, empty or malformed QID is -1, which is in no list, so its anchor gets the label of unknown QIDs.
+    """
+    return np.array([parse_qid(qid) for qid in qids], dtype=np.int64)
+
+
+def label_anchors(batch_anchors, unknown_label=None, index=None):
+    """
+    Labels the anchors of a batch of WikiANC rows with one lookup for the whole batch.
+
+    :param batch_anchors: The `paragraph_anchors` of every row.
+    :param unknown_label: The label of the QIDs that are not in the index, None to skip their anchors.
+    :param index: The index to use, by default get_qid_index().
+    :return: The entities of every row, as dictionaries of start, end and label.
+    """
+    index = index or get_qid_index()
+    anchors = [anchor for row_anchors in batch_anchors for anchor in row_anchors]
+    labels = index.labels(qids_to_array([anchor.get('qid') for anchor in anchors]))
+
+    batch_entities, position = [], 0
+    for row_anchors in batch_anchors:
+        entities = []
+        for anchor, label in zip(row_anchors, labels[position:position + len(row_anchors)]):
+            label = label or unknown_label
+            start_raw, end_raw = anchor.get('start'), anchor.get('end')
+            if start_raw is None or end_raw is None or label is None:
+                continue
+            try:
+                entities.append({"start": int(start_raw), "end": int(end_raw), "label": label})
+            except ValueError:
+                print(f"start_raw={start_raw}, end_raw={end_raw} are not integers.")
+        batch_entities.append(entities)
+        position += len(row_anchors)
+    return batch_entities
+
+
+def main() -> None:
+    """CLI wrapper."""
+    parser = argparse.ArgumentParser(description="Build the memory-mapped QID label index")
+    parser.add_argument("--output", default=INDEX_DIR, help="Directory of the index")
+    parser.add_argument("--loc", nargs="+", default=SOURCES['LOC'], help="Lists of LOC QIDs")
+    parser.add_argument("--per", nargs="+", default=SOURCES['PER'], help="Lists of PER QIDs")
+    parser.add_argument("--org", nargs="+", default=SOURCES['ORG'], help="Lists of ORG QIDs")
+    args = parser.parse_args()
+
+    version = build_index(args.output, {'LOC': args.loc, 'PER': args.per, 'ORG': args.org})
+    print(f"Written {args.output} (version {version}).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Re-score stored predictions
+
+Computes the metrics of a model again from the predictions the evaluators saved to a prediction store with `--store`,
+without loading or running the model: seqeval metrics for the predictions of every evaluator, and the span-level
+metrics of spaCy for the predictions of wikiann_model_evaluation.py. The labels of both the gold data and the
+predictions can be mapped, a label mapped to `O` is not an entity.
+
+Examples:
+    python rescore_predictions.py --store predictions --list
+    python rescore_predictions.py --store predictions --model models/wikiannc/pl/model-best --metric spacy
+    python rescore_predictions.py --store predictions --model_hash 3fa2 --language sl --label_map '{"ORG": "O"}' \
+        --format json
+"""
+
+import argparse
+import json
+from typing import Dict, List, Optional
+
+from prediction_store import PredictionStore, entry_labels
+
+
+def select_entries(store: PredictionStore, model_hash: str, language: Optional[str] = None) -> List[dict]:
+    """Returns the entries of the one model whose hash starts with the given prefix, optionally of one language."""
+    entries = [entry for entry in store.entries(model_hash) if language is None or entry['language'] == language]
+    model_hashes = {entry['model_hash'] for entry in entries}
+    if not entries:
+        raise ValueError(f"No stored predictions of the model {model_hash} in {store.root}")
+    if len(model_hashes) > 1:
+        raise ValueError(f"The model hash {model_hash} is ambiguous, it matches {', '.join(sorted(model_hashes))}")
+    return entries
+
+
+def list_entries(store: PredictionStore) -> None:
+    for entry in store.entries():
+        print(f"{entry['model_hash'][:16]}  {entry['kind']:5}  {entry['language']:3}  "
+              f"{len(entry['sentences']):7} sentences  {entry['seconds']:8.1f}s  {entry['created']}  "
+              f"{entry['model']}  {entry['shard']}")
+
+
+def rescore_seqeval(entries: List[dict], label_map: Optional[Dict[str, str]], output_format: str) -> None:
+    from seqeval.metrics import classification_report, precision_score, recall_score, f1_score
+
+    true_labels, pred_labels = [], []
+    for entry in entries:
+        entry_true, entry_pred = entry_labels(entry, label_map)
+        true_labels.extend(entry_true)
+        pred_labels.extend(entry_pred)
+
+    if output_format == "json":
+        report = classification_report(true_labels, pred_labels, output_dict=True)
+        print(json.dumps(report, indent=1, default=float))
+        return
+    print(classification_report(true_labels, pred_labels, digits=4))
+    print(f"Precision : {precision_score(true_labels, pred_labels):.4f}")
+    print(f"Recall    : {recall_score(true_labels, pred_labels):.4f}")
+    print(f"F1        : {f1_score(true_labels, pred_labels):.4f}")
+
+
+def rescore_spacy(entries: List[dict], label_map: Optional[Dict[str, str]], output_format: str) -> None:
+    from wikiann_model_evaluation import print_results, score_entries
+
+    kinds = {entry['kind'] for entry in entries}
+    if kinds != {'spacy'}:
+        raise ValueError(f"The spaCy metrics need predictions of the spaCy evaluator, not of {', '.join(kinds)}")
+    results, _, _ = score_entries(entries, label_map)
+    if output_format == "json":
+        print(json.dumps(results, indent=1))
+        return
+    print_results(', '.join(sorted({entry['language'] for entry in entries})), results)
+
+
+def main() -> None:
+    """CLI wrapper."""
+    parser = argparse.ArgumentParser(description="Compute the metrics of stored predictions again")
+    parser.add_argument("--store", required=True, help="Directory of the prediction store")
+    parser.add_argument("--list", action="store_true", help="List the stored predictions")
+    model_group = parser.add_mutually_exclusive_group()
+    model_group.add_argument("--model", help="Model directory or 🤗 Hub name, hashed as the evaluators hash it")
+    model_group.add_argument("--model_hash", help="Model hash or a prefix of it, see --list")
+    parser.add_argument("--language", help="Only re-score the predictions of this language")
+    parser.add_argument("--metric", choices=["seqeval", "spacy"], default="seqeval", help="Metrics to compute")
+    parser.add_argument("--label_map", type=json.loads, help="JSON object mapping labels, e.g. '{\"MISC\": \"O\"}'")
+    parser.add_argument("--format", choices=["text", "json"], default="text", help="Format of the report")
+    args = parser.parse_args()
+
+    store = PredictionStore(args.store)
+    if args.list:
+        list_entries(store)
+        return
+    if not args.model and not args.model_hash:
+        parser.error("one of --list, --model or --model_hash is required")
+
+    model_hash = store.model_hash(args.model) if args.model else args.model_hash
+    entries = select_entries(store, model_hash, args.language)
+    if args.format == "text":
+        print(f"Re-scoring {sum(len(entry['sentences']) for entry in entries)} sentences of {len(entries)} shards "
+              f"predicted by {entries[0]['model']}")
+    if args.metric == "spacy":
+        rescore_spacy(entries, args.label_map, args.format)
+    else:
+        rescore_seqeval(entries, args.label_map, args.format)
+
+
+if __name__ == "__main__":
+    main()
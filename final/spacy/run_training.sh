@@ -44,8 +44,13 @@ eval "$(conda shell.bash hook)"
 echo "conda activate mnre"
 conda activate mnre
 
-# Get max index from folders
-max_index=$(find datasets/wikianc/${language}/ -maxdepth 1 -type d -regex ".*/[0-9]+" | sed 's#.*/##' | sort -n | tail -n1)
+# The train corpus is streamed with training.max_epochs = -1, and spaCy cannot stop a streamed corpus after a number of
+# epochs, so every split is trained for this number of steps
+max_steps=20000
+
+# Get max index from the split manifest written by split_dataset.sh
+manifest="datasets/wikianc/${language}/splits.json"
+max_index=$(python -c "import json, sys; print(json.load(open(sys.argv[1]))['splits'])" "$manifest")
 
 for index in $(seq 1 $max_index); do
     echo "Training on ${language}, split $index"
@@ -62,12 +67,15 @@ for index in $(seq 1 $max_index); do
     fi
 
     python -m spacy train "$cfg_file" \
+      --code streaming_corpus.py \
       --output "$out_dir" \
       --gpu-id 0 \
       -VV \
-      --paths.train "datasets/wikianc/${language}/${index}/train/" \
-      --paths.dev   "datasets/wikianc/${language}/${index}/dev/" \
-      --training.max_epochs 4 \
+      --paths.train "datasets/wikianc/${language}/train/" \
+      --paths.dev   "datasets/wikianc/${language}/dev/" \
+      --paths.manifest "$manifest" \
+      --paths.split $index \
+      --training.max_steps "$max_steps" \
       ${extra_params}
 
 done
@@ -1,39 +1,21 @@
 #!/bin/bash
 
-# Usage: ./split_dataset.sh <path_to_dataset> [--splits N]
+# Usage: ./split_dataset.sh <path_to_dataset> [--splits N] [--seed S]
+#
+# Writes <path_to_dataset>/splits.json, which assigns the shards to the splits. The shards stay where they are and
+# are read through the ner.ManifestCorpus.v1 reader of virtual_splits.py.
 
 if [ -z "$1" ]; then
-    echo "Usage: $0 <path_to_dataset> [--splits N]"
+    echo "Usage: $0 <path_to_dataset> [--splits N] [--seed S]"
     exit 1
 fi
 
 input_dir="$1"
-splits=4
-
-if [[ "$2" == "--splits" && "$3" =~ ^[0-9]+$ ]]; then
-    splits=$3
-fi
+shift
 
 if [ ! -d "$input_dir/train" ] || [ ! -d "$input_dir/dev" ]; then
     echo "Error: input directory must contain 'train/' and 'dev/' subdirectories."
     exit 2
 fi
 
-echo "Splitting .spacy files in $input_dir into $splits chunks..."
-
-for split in train dev; do
-    mapfile -t files < <(find "$input_dir/$split" -type f -name "*.spacy" | shuf)
-    total=${#files[@]}
-    echo "Found $total $split files"
-
-    for i in $(seq 1 $splits); do
-        mkdir -p "$input_dir/$i/$split"
-    done
-
-    for i in "${!files[@]}"; do
-        target=$(( (i % splits) + 1 ))
-        cp "${files[$i]}" "$input_dir/$target/$split/"
-    done
-done
-
-echo "Done. Created $splits subfolders in $input_dir."
+python "$(dirname "$0")/virtual_splits.py" "$input_dir" "$@"
@@ -0,0 +1,183 @@
+"""
+Streaming corpus
+
+A `@readers` corpus for datasets of thousands of `.spacy` shards. Every epoch it visits the shards in a new random
+order, reads the next shards on a background thread while the current one is trained on, and shuffles the docs through
+a bounded buffer instead of loading the whole corpus. At most `shuffle_buffer` docs and `prefetch` serialized shards
+are held at a time, whatever the size of the dataset.
+
+spaCy only streams a corpus when `training.max_epochs = -1`, with any other value it first turns the whole corpus into
+a list. It cannot stop a streamed corpus after a number of epochs, so the configs that use this reader are budgeted by
+`training.max_steps` only, and the reader logs every pass it completes.
+
+The `ner.reset_corpora.v1` callback of `training.before_to_disk` replaces the readers of this module in the config of
+the saved pipelines by `spacy.Corpus.v1`, so that loading, evaluating or training from `model-best/config.cfg` does
+not need `--code streaming_corpus.py`.
+
+Example:
+    python -m spacy train config/wikianc/pl_fresh.cfg --code streaming_corpus.py \
+        --paths.train datasets/wikianc/pl/train/ --paths.dev datasets/wikianc/pl/dev/ \
+        --paths.manifest datasets/wikianc/pl/splits.json --paths.split 1
+"""
+
+import queue
+import random
+import sys
+import threading
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional, Union
+
+from spacy.tokens import Doc, DocBin
+from spacy.training import Example
+from spacy.training.corpus import FILE_TYPE, walk_corpus
+from spacy.util import logger, registry
+
+# The manifest reader is registered along with this one, so that the configs only need `--code streaming_corpus.py`
+sys.path.append(str(Path(__file__).resolve().parent))
+from virtual_splits import ManifestCorpus, read_split_files
+
+# Marks the end of the shards in the prefetch queue
+_DONE = object()
+
+# The readers that only load with this module, and the settings of spacy.Corpus.v1 they share
+CUSTOM_READERS = ('ner.StreamingCorpus.v1', 'ner.ManifestCorpus.v1')
+CORPUS_SETTINGS = ('path', 'gold_preproc', 'max_length', 'limit', 'augmenter')
+
+
+class StreamingCorpus(ManifestCorpus):
+    """A ManifestCorpus that streams its shards in a random order through a bounded shuffle buffer."""
+
+    def __init__(self, files: List[Path], shuffle_buffer: int = 10000, prefetch: int = 2, **kwargs) -> None:
+        super().__init__(files, **kwargs)
+        self.shuffle_buffer = shuffle_buffer
+        self.prefetch = prefetch
+        self.passes = 0
+
+    def __call__(self, nlp) -> Iterator[Example]:
+        # The random module is the one seeded by spaCy with training.seed
+        files = list(self.files)
+        random.shuffle(files)
+        ref_docs = self.shuffle_docs(self.read_docbin(nlp.vocab, files))
+
+        if self.gold_preproc:
+            examples = self.make_examples_gold_preproc(nlp, ref_docs)
+        else:
+            examples = self.make_examples(nlp, ref_docs)
+        count = 0
+        for real_eg in examples:
+            count += 1
+            for augmented_eg in self.augmenter(nlp, real_eg):
+                yield augmented_eg
+        self.passes += 1
+        logger.info("Streamed pass %d over %d examples of %d shards", self.passes, count, len(files))
+
+    def read_docbin(self, vocab, locs) -> Iterator[Doc]:
+        """Yields the non-empty docs of the shards, which are read and decompressed ahead on a background thread."""
+        i = 0
+        for doc_bin in self.prefetch_shards(locs):
+            # The docs are created here, the vocab is not safe to share with the reading thread
+            for doc in doc_bin.get_docs(vocab):
+                if len(doc):
+                    yield doc
+                    i += 1
+                    if self.limit >= 1 and i >= self.limit:
+                        return
+
+    def prefetch_shards(self, locs) -> Iterator[DocBin]:
+        """Yields the DocBin of every shard, keeping up to `prefetch` of the next ones read in a background thread."""
+        shards = queue.Queue(maxsize=max(self.prefetch, 1))
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    shards.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def read():
+            try:
+                for loc in locs:
+                    if stop.is_set():
+                        return
+                    put(DocBin().from_disk(loc))
+                put(_DONE)
+            except BaseException as e:
+                put(e)
+
+        thread = threading.Thread(target=read, name='shard-prefetch', daemon=True)
+        thread.start()
+        try:
+            while (item := shards.get()) is not _DONE:
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # Also stops the thread when the docs are not read to the end, e.g. at max_steps
+            stop.set()
+            thread.join()
+
+    def shuffle_docs(self, docs: Iterable[Doc]) -> Iterator[Doc]:
+        """Shuffles a stream of docs through a buffer of `shuffle_buffer` docs, 0 to keep the order."""
+        if self.shuffle_buffer <= 0:
+            yield from docs
+            return
+
+        buffer = []
+        for doc in docs:
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(doc)
+                continue
+            index = random.randrange(len(buffer))
+            yield buffer[index]
+            buffer[index] = doc
+        random.shuffle(buffer)
+        yield from buffer
+
+
+@registry.readers("ner.StreamingCorpus.v1")
+def create_streaming_reader(
+    path: Optional[Path],
+    gold_preproc: bool,
+    subset: str = "train",
+    manifest: Optional[Union[str, Path]] = None,
+    split: Optional[Union[int, str]] = None,
+    shuffle_buffer: int = 10000,
+    prefetch: int = 2,
+    max_length: int = 0,
+    limit: int = 0,
+    augmenter: Optional[Callable] = None,
+) -> Callable[["Language"], Iterable[Example]]:
+    """Streams the shards of one split of a manifest, or all shards of path without a manifest."""
+    if manifest is None or split is None:
+        if path is None:
+            raise ValueError("Either a manifest and a split or a path is needed.")
+        files = walk_corpus(path, FILE_TYPE)
+    else:
+        files = read_split_files(manifest, split, subset)
+    return StreamingCorpus(files, shuffle_buffer=shuffle_buffer, prefetch=prefetch, gold_preproc=gold_preproc,
+                           max_length=max_length, limit=limit, augmenter=augmenter)
+
+
+@registry.callbacks("ner.reset_corpora.v1")
+def create_reset_corpora() -> Callable[["Language"], "Language"]:
+    """
+    Returns a `training.before_to_disk` callback that makes the config of the saved pipeline independent of this
+    module: the corpora of CUSTOM_READERS are read with spacy.Corpus.v1 from their path, i.e. all shards of the
+    directory instead of one split, and the callback itself is removed.
+    """
+
+    def reset_corpora(nlp: "Language") -> "Language":
+        # The config was resolved when the training started, changing it only changes what is saved
+        config = nlp.config
+        for name, corpus in config.get("corpora", {}).items():
+            if corpus.get("@readers") in CUSTOM_READERS:
+                config["corpora"][name] = {
+                    "@readers": "spacy.Corpus.v1",
+                    **{key: value for key, value in corpus.items() if key in CORPUS_SETTINGS},
+                }
+        config["training"]["before_to_disk"] = None
+        return nlp
+
+    return reset_corpora
@@ -0,0 +1,124 @@
+"""
+Alignment of model predictions to gold tokens
+
+Maps the entities predicted by a model back to the tokens of the gold sentence as IOB2 labels, for the evaluators of
+the spaCy, TNER and XLM-R models. Every sentence is indexed once, from predicted positions, respectively characters,
+to gold tokens, so that every entity is aligned with lookups instead of a scan over all tokens.
+
+- align_predictions_to_tokens aligns entities given as positions of the sub-word tokens the model read (TNER).
+- align_entity_offsets_to_tokens aligns entities given as character offsets into the sentence (🤗 pipelines).
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+_PREFIXES: Tuple[str, ...] = ("Ġ", "▁", "##")
+
+
+def _clean(tok: str) -> str:
+    """Strip common sub‑word prefixes."""
+    while tok and tok.startswith(_PREFIXES):
+        tok = tok[1:]
+    return tok
+
+
+def _set_labels(labels: List[str], start_idx: Optional[int], end_idx: Optional[int], label: str) -> None:
+    if start_idx is None:
+        return
+    labels[start_idx] = f"B-{label}"
+    for i in range(start_idx + 1, (end_idx or start_idx) + 1):
+        labels[i] = f"I-{label}"
+
+
+def align_predictions_to_tokens(tokens: List[str], pred_input: List[str], ent_spans) -> List[str]:
+    """
+    Map span‑level entity predictions to token‑level IOB2 labels.
+
+    Every gold token is matched to the next predicted token that equals it without its sub-word prefix, ignoring
+    case, and an entity is labelled from the gold token of its first position to the one of its last position.
+
+    Args:
+        tokens: The gold tokens.
+        pred_input: The tokens the model read.
+        ent_spans: The predicted entities as (positions in pred_input, label).
+
+    Returns:
+        The IOB2 labels of the gold tokens.
+    """
+    cleaned = [_clean(pred).lower() for pred in pred_input]
+    pred_len = len(cleaned)
+    # The gold tokens map to strictly increasing positions, so the inverse index is unique
+    token_at: Dict[int, int] = {}
+    j = 0
+    for idx, tok in enumerate(tokens):
+        tok = tok.lower()
+        while j < pred_len and cleaned[j] != tok:
+            j += 1
+        token_at[j] = idx
+        j += 1
+
+    labels = ["O"] * len(tokens)
+    for pos_list, label in ent_spans:
+        if not pos_list:
+            continue
+        start_idx = token_at.get(pos_list[0])
+        _set_labels(labels, start_idx, token_at.get(pos_list[-1], start_idx), label)
+    return labels
+
+
+def align_entity_offsets_to_tokens(tokens: List[str], entities: List[dict], sentence: str) -> List[str]:
+    """
+    Map entities given as character offsets into a sentence to token‑level IOB2 labels.
+
+    Every gold token is located in the sentence after the whitespace that precedes it, and an entity is labelled
+    from the token that contains its start to the token that contains its last character.
+
+    Args:
+        tokens: The gold tokens.
+        entities: The predicted entities as dictionaries of start, end and entity_group.
+        sentence: The sentence the model read.
+
+    Returns:
+        The IOB2 labels of the gold tokens.
+    """
+    sentence_len = len(sentence)
+    # The token of every character, the token spans do not overlap
+    token_of_char = [-1] * sentence_len
+    i = 0
+    for idx, tok in enumerate(tokens):
+        while i < sentence_len and sentence[i].isspace():
+            i += 1
+        start = i
+        for c in tok:
+            if i < sentence_len and sentence[i] == c:
+                i += 1
+        token_of_char[start:i] = [idx] * (i - start)
+
+    def token_at(char: int) -> Optional[int]:
+        if 0 <= char < sentence_len and token_of_char[char] >= 0:
+            return token_of_char[char]
+        return None
+
+    labels = ["O"] * len(tokens)
+    for ent in entities:
+        start_idx = token_at(ent["start"])
+        end_idx = token_at(ent["end"] - 1)
+        _set_labels(labels, start_idx, start_idx if end_idx is None else end_idx, ent.get("entity_group", "O"))
+    return labels
+
+
+def align_predictions_batch(batch_tokens: Sequence[List[str]], batch_pred_input: Sequence[List[str]],
+                            batch_ent_spans: Sequence) -> List[List[str]]:
+    """Align the predictions of a batch of sentences with align_predictions_to_tokens."""
+    return [
+        align_predictions_to_tokens(tokens, pred_input, ent_spans)
+        for tokens, pred_input, ent_spans in zip(batch_tokens, batch_pred_input, batch_ent_spans)
+    ]
+
+
+def align_entity_offsets_batch(batch_tokens: Sequence[List[str]], batch_entities: Sequence[List[dict]],
+                               sentences: Sequence[str]) -> List[List[str]]:
+    """Align the predictions of a batch of sentences with align_entity_offsets_to_tokens."""
+    return [
+        align_entity_offsets_to_tokens(tokens, entities, sentence)
+        for tokens, entities, sentence in zip(batch_tokens, batch_entities, sentences)
+    ]
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""
+Benchmark of the prediction alignment
+
+Compares align_predictions_to_tokens and align_entity_offsets_to_tokens with the previous implementations of the
+spaCy and TNER evaluators, which scanned all tokens for every entity, and of xlmr_model_evaluation.align_labels,
+which scanned all character spans for every entity, on long sentences. The reference implementations are kept in
+token_alignment_reference.py, and tests/test_token_alignment.py checks that the alignment agrees with them.
+
+Example:
+    python token_alignment_benchmark.py --sentences 200 --tokens 2000 --entities 300
+"""
+
+import argparse
+import random
+import time
+
+from token_alignment import align_entity_offsets_batch, align_predictions_batch
+from token_alignment_reference import build_tner_sentences, build_xlmr_sentences, reference_align_labels, \
+    reference_align_predictions_to_tokens
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def report(name, sentences, reference_seconds, seconds):
+    print(f"{name}:")
+    print(f"  previous  {reference_seconds:8.3f}s  {sentences / reference_seconds:10.0f} sentences/s")
+    print(f"  indexed   {seconds:8.3f}s  {sentences / seconds:10.0f} sentences/s  ({reference_seconds / seconds:.1f}x)")
+
+
+def main() -> None:
+    """CLI wrapper."""
+    parser = argparse.ArgumentParser(description="Benchmark the prediction alignment on long sentences")
+    parser.add_argument("--sentences", default=200, type=int, help="Number of sentences")
+    parser.add_argument("--tokens", default=2000, type=int, help="Maximum tokens per sentence")
+    parser.add_argument("--entities", default=300, type=int, help="Maximum entities per sentence")
+    parser.add_argument("--seed", default=0, type=int, help="Random seed")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{args.sentences} sentences of up to {args.tokens} tokens and {args.entities} entities")
+    batch = build_tner_sentences(args.sentences, args.tokens, args.entities, rng)
+    _, reference_seconds = timed(lambda: [reference_align_predictions_to_tokens(*sentence) for sentence in zip(*batch)])
+    _, seconds = timed(align_predictions_batch, *batch)
+    report("align_predictions_to_tokens", args.sentences, reference_seconds, seconds)
+
+    batch = build_xlmr_sentences(args.sentences, args.tokens, args.entities, rng)
+    _, reference_seconds = timed(lambda: [reference_align_labels(*sentence) for sentence in zip(*batch)])
+    _, seconds = timed(align_entity_offsets_batch, *batch)
+    report("align_entity_offsets_to_tokens (xlmr align_labels)", args.sentences, reference_seconds, seconds)
+
+
+if __name__ == "__main__":
+    main()
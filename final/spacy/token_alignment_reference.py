@@ -0,0 +1,105 @@
+"""
+The previous alignments, kept as references for tests/test_token_alignment.py and token_alignment_benchmark.py: the
+token alignment of the spaCy and TNER evaluators and xlmr_model_evaluation.align_labels. The builders build the random
+sentences they are compared on.
+"""
+
+from typing import List
+
+from token_alignment import _clean
+
+WORDS = ['Jan', 'kowalski', 'Mieszka', 'w', 'Warszawie', 'nad', 'Wisłą', '(PL)', 'i', 'Kraków,', 'r.', '1920']
+PREFIXES = ['', '', '', 'Ġ', '▁', '##']
+LABELS = ['PER', 'LOC', 'ORG']
+
+
+def reference_align_predictions_to_tokens(tokens: List[str], pred_input: List[str], ent_spans):
+    mapping, j = [], 0
+    for tok in tokens:
+        while j < len(pred_input) and _clean(pred_input[j]).lower() != tok.lower():
+            j += 1
+        mapping.append(j)
+        j += 1
+    labels = ["O"] * len(tokens)
+    for pos_list, label in ent_spans:
+        if not pos_list:
+            continue
+        start_tok_idx = next((idx for idx, mp in enumerate(mapping) if mp == pos_list[0]), None)
+        end_tok_idx = next((idx for idx, mp in enumerate(mapping) if mp == pos_list[-1]), start_tok_idx)
+        if start_tok_idx is None:
+            continue
+        labels[start_tok_idx] = f"B-{label}"
+        for i in range(start_tok_idx + 1, (end_tok_idx or start_tok_idx) + 1):
+            labels[i] = f"I-{label}"
+    return labels
+
+
+def reference_align_labels(tokens: List[str], entities: List[dict], sentence: str) -> List[str]:
+    labels = ["O"] * len(tokens)
+    char_to_token_map = []
+    i = 0
+    for tok in tokens:
+        while i < len(sentence) and sentence[i].isspace():
+            i += 1
+        start = i
+        for c in tok:
+            if i < len(sentence) and sentence[i] == c:
+                i += 1
+        end = i
+        char_to_token_map.append((start, end))
+
+    for ent in entities:
+        ent_start = ent["start"]
+        ent_end = ent["end"]
+        label = ent.get("entity_group", "O")
+
+        start_idx, end_idx = None, None
+        for idx, (s, e) in enumerate(char_to_token_map):
+            if s <= ent_start < e and start_idx is None:
+                start_idx = idx
+            if s < ent_end <= e:
+                end_idx = idx
+        if start_idx is not None:
+            labels[start_idx] = f"B-{label}"
+            if end_idx is None:
+                end_idx = start_idx
+            for i in range(start_idx + 1, end_idx + 1):
+                labels[i] = f"I-{label}"
+    return labels
+
+
+def build_tner_sentences(count, tokens, entities, rng):
+    """Builds gold tokens, the sub-word tokens a model read, with some extra and some missing, and entities."""
+    batch_tokens, batch_pred_input, batch_ent_spans = [], [], []
+    for _ in range(count):
+        gold = [rng.choice(WORDS) for _ in range(rng.randint(1, tokens))]
+        pred_input = []
+        for tok in gold:
+            if rng.random() < 0.05:
+                pred_input.append(rng.choice(PREFIXES) + rng.choice(WORDS))
+            if rng.random() < 0.97:
+                pred_input.append(rng.choice(PREFIXES) + (tok.upper() if rng.random() < 0.1 else tok))
+        ent_spans = []
+        for _ in range(rng.randint(0, entities)):
+            start = rng.randrange(len(pred_input) + 2)
+            ent_spans.append((list(range(start, start + rng.randint(0, 4))), rng.choice(LABELS)))
+        batch_tokens.append(gold)
+        batch_pred_input.append(pred_input)
+        batch_ent_spans.append(ent_spans)
+    return batch_tokens, batch_pred_input, batch_ent_spans
+
+
+def build_xlmr_sentences(count, tokens, entities, rng):
+    """Builds gold tokens, the sentences read by the model, sometimes differing from the tokens, and entities."""
+    batch_tokens, batch_entities, sentences = [], [], []
+    for _ in range(count):
+        gold = [rng.choice(WORDS) for _ in range(rng.randint(1, tokens))]
+        sentence = " ".join(tok if rng.random() < 0.95 else tok[::-1] for tok in gold)
+        ents = []
+        for _ in range(rng.randint(0, entities)):
+            start = rng.randrange(-2, len(sentence) + 2)
+            ents.append({"start": start, "end": start + rng.randint(0, 30), "entity_group": rng.choice(LABELS)})
+        batch_tokens.append(gold)
+        batch_entities.append(ents)
+        sentences.append(sentence)
+    return batch_tokens, batch_entities, sentences
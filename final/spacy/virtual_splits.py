@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""
+Virtual dataset splits
+
+Assigns the `.spacy` shards of a dataset directory round-robin to N splits and records the assignment in a
+`splits.json` manifest, instead of copying the shards into `1/ … N/` directories. The `ner.ManifestCorpus.v1` reader
+reads the shards of one split in place, so re-splitting only rewrites the manifest.
+
+Examples:
+    python virtual_splits.py datasets/wikianc/pl --splits 4 --seed 0
+    python -m spacy train config/wikianc/pl_fresh.cfg --code streaming_corpus.py \
+        --paths.train datasets/wikianc/pl/train/ --paths.dev datasets/wikianc/pl/dev/ \
+        --paths.manifest datasets/wikianc/pl/splits.json --paths.split 1
+"""
+
+import argparse
+import json
+import os
+import random
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional, Union
+
+from spacy.training import Example
+from spacy.training.corpus import FILE_TYPE, Corpus, walk_corpus
+from spacy.util import registry
+
+MANIFEST_FILE = 'splits.json'
+SUBSETS = ('train', 'dev')
+
+
+def create_split_manifest(dataset_dir, splits=4, seed=None, subsets=SUBSETS):
+    """
+    Writes the manifest of a random round-robin assignment of the shards of a dataset directory to splits.
+
+    :param dataset_dir: The directory with one subdirectory of `.spacy` shards per subset.
+    :param splits: The number of splits.
+    :param seed: The seed of the shuffle of the shards, a random one is drawn and recorded if None.
+    :param subsets: The subdirectories to split.
+    :return: The path of the manifest.
+    """
+    dataset_dir = Path(dataset_dir)
+    seed = random.randrange(2 ** 32) if seed is None else seed
+    rng = random.Random(seed)
+    shards = {str(index): {} for index in range(1, splits + 1)}
+    for subset in subsets:
+        files = sorted(str(path.relative_to(dataset_dir)) for path in walk_corpus(dataset_dir / subset, FILE_TYPE))
+        rng.shuffle(files)
+        print(f"Found {len(files)} {subset} files")
+        for index in range(splits):
+            shards[str(index + 1)][subset] = files[index::splits]
+
+    manifest_path = dataset_dir / MANIFEST_FILE
+    tmp_path = manifest_path.with_name(manifest_path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'seed': seed, 'splits': splits, 'shards': shards}, f, indent=1)
+    os.replace(tmp_path, manifest_path)
+    return manifest_path
+
+
+def read_split_files(manifest_path, split, subset):
+    """Returns the shards of a subset of a split, resolved relative to the directory of the manifest."""
+    manifest_path = Path(manifest_path)
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    try:
+        files = manifest['shards'][str(split)][subset]
+    except KeyError:
+        raise ValueError(f"{manifest_path} has no {subset} shards of split {split}.")
+    return [manifest_path.parent / file for file in files]
+
+
+class ManifestCorpus(Corpus):
+    """A Corpus that reads a given list of `.spacy` files instead of walking a directory."""
+
+    def __init__(self, files: List[Path], **kwargs) -> None:
+        super().__init__(files[0] if files else '', **kwargs)
+        self.files = files
+
+    def __call__(self, nlp) -> Iterator[Example]:
+        ref_docs = self.read_docbin(nlp.vocab, self.files)
+        if self.shuffle:
+            ref_docs = list(ref_docs)
+            random.shuffle(ref_docs)
+
+        if self.gold_preproc:
+            examples = self.make_examples_gold_preproc(nlp, ref_docs)
+        else:
+            examples = self.make_examples(nlp, ref_docs)
+        for real_eg in examples:
+            for augmented_eg in self.augmenter(nlp, real_eg):
+                yield augmented_eg
+
+
+@registry.readers("ner.ManifestCorpus.v1")
+def create_manifest_reader(
+    path: Optional[Path],
+    subset: str,
+    gold_preproc: bool,
+    manifest: Optional[Union[str, Path]] = None,
+    split: Optional[Union[int, str]] = None,
+    max_length: int = 0,
+    limit: int = 0,
+    augmenter: Optional[Callable] = None,
+) -> Callable[["Language"], Iterable[Example]]:
+    """Reads the shards of one split of a manifest, or all shards of path like spacy.Corpus.v1 without a manifest."""
+    if manifest is None or split is None:
+        if path is None:
+            raise ValueError("Either a manifest and a split or a path is needed.")
+        files = walk_corpus(path, FILE_TYPE)
+    else:
+        files = read_split_files(manifest, split, subset)
+    return ManifestCorpus(files, gold_preproc=gold_preproc, max_length=max_length, limit=limit, augmenter=augmenter)
+
+
+def main() -> None:
+    """CLI wrapper."""
+    parser = argparse.ArgumentParser(description="Split the .spacy shards of a dataset through a manifest")
+    parser.add_argument("dataset_dir", type=Path, help="Directory with train/ and dev/ subdirectories")
+    parser.add_argument("--splits", default=4, type=int, help="Number of splits")
+    parser.add_argument("--seed", type=int, help="Seed of the shuffle of the shards")
+    args = parser.parse_args()
+
+    for subset in SUBSETS:
+        if not (args.dataset_dir / subset).is_dir():
+            parser.error(f"{args.dataset_dir} must contain {', '.join(f'{s}/' for s in SUBSETS)} subdirectories.")
+
+    print(f"Written {create_split_manifest(args.dataset_dir, args.splits, args.seed)}.")
+
+
+if __name__ == "__main__":
+    main()
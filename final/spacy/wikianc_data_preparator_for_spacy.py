@@ -1,20 +1,54 @@
+import argparse
+import json
 import os
+import re
+from collections import Counter, deque
 
-import spacy
+import numpy as np
+from spacy.attrs import ENT_IOB, ENT_TYPE, IDX, IS_SPACE, LENGTH
 from spacy.tokens import DocBin
-from tqdm import tqdm
 
 import datasets
 from datasets import DatasetDict
 
+from preparation_driver import atomic_output, blank_model, plan_shards, run_units, shard_key, shuffle_and_select
+from qid_index import get_qid_index, label_anchors
+
 LANGUAGES =             ['be', 'bg', 'bs', 'cs', 'hr', 'mk', 'pl', 'ru', 'sh', 'sk', 'sl', 'sr', 'uk']
 SPACY_BLANK_LANGUAGES = ['xx', 'bg', 'bs', 'cs', 'hr', 'mk', 'pl', 'ru', 'sh', 'sk', 'sl', 'sr', 'uk']
 
+# The splits of the source dataset as (split, output name, row limit)
+SPLITS = [('train', 'train', 3200000), ('test', 'dev', 960000), ('validation', 'validation', 25000)]
+
+# The version of the conversion, part of the keys of the shards, to be increased when the written docs change
+CONVERTER_VERSION = 1
+
+# The label of the anchors whose QIDs are in no list, they are tagged in the whitespace-token files of XLM-R and left
+# out of the docs
+UNKNOWN_LABEL = 'MISC'
+
+# The further formats, merged into one file per split, named as by xlmr/spacy_to_txt_converter.py and, for the
+# whitespace-token files of XLM-R, as by the former xlmr/wikianc_data_preparator_for_xlmr.py
+EXPORT_SUFFIXES = {'conll': '.txt', 'jsonl': '.jsonl', 'xlmr': '.txt'}
+CONVERTER_SPLIT_NAMES = {'train': 'train', 'dev': 'dev', 'validation': 'test'}
+EXPORT_SPLIT_NAMES = {
+    'conll': CONVERTER_SPLIT_NAMES,
+    'jsonl': CONVERTER_SPLIT_NAMES,
+    'xlmr': {'train': 'train', 'dev': 'dev', 'validation': 'validation'},
+}
+
+# Tokens of the XLM-R files are the maximal runs of non-whitespace characters, as str.isspace defines whitespace
+TOKEN_PATTERN = re.compile(r'\S+')
+
+# The further formats are written through a large buffer, the XLM-R files in blocks of paragraphs
+WRITE_PARAGRAPHS = 1000
+WRITE_BUFFER = 1024 * 1024
+
 # python -m spacy train config_wikiann_bs.cfg --output models/wikiann/bs --gpu-id 0
 
-def load_and_split_ds(path, name, test_size=0.2):
+def load_and_split_ds(path, name, test_size=0.2, seed=None):
     ds = datasets.load_dataset(path, name)
-    ds_split_1 = ds['train'].train_test_split(test_size=test_size)
+    ds_split_1 = ds['train'].train_test_split(test_size=test_size, seed=seed)
 
     if 'validation' in ds:
         return DatasetDict({
@@ -22,156 +56,265 @@ def load_and_split_ds(path, name, test_size=0.2):
             'test': ds_split_1['test'],
             'validation': ds['validation']})
     else:
-        ds_split_2 = ds_split_1['test'].train_test_split(test_size=0.5)
+        ds_split_2 = ds_split_1['test'].train_test_split(test_size=0.5, seed=seed)
         return DatasetDict({
             'train': ds_split_1['train'],
             'test': ds_split_2['test'],
             'validation': ds_split_2['train']})
 
 
-def get_lines_set(file_path):
+def convert_batch_wikianc(batch, unknown_label=None):
     """
-    Gets a set of lines from a path.
+    Converts a batch of WikiANC rows, e.g. in a `datasets.map` with `batched=True` and `num_proc`.
 
-    :param file_path: The file to read from.
-    :return: A set of lines from the file.
+    :param batch: The columns of the rows.
+    :param unknown_label: The label of the anchors whose QIDs are in no list, None to leave them out.
+    :return: The text and the entities of the rows.
     """
-    lines_set = set()
-    with open(file_path, 'r') as file:
-        for line in file:
-            # Remove leading/trailing spaces and check if the line is not empty
-            line = line.strip()
-            if line:
-                lines_set.add(line)
-    return lines_set
+    return {
+        "text": batch["paragraph_text"],
+        "entities": label_anchors(batch["paragraph_anchors"], unknown_label),
+    }
 
 
-PER_WIKIDATA_ENTITIES = get_lines_set('PER-ND.txt') | get_lines_set('PER-FI.txt')
-LOC_WIKIDATA_ENTITIES = get_lines_set('LOC-ND.txt')
-ORG_WIKIDATA_ENTITIES = get_lines_set('ORG-ND.txt')
+def without_unknown(batch):
+    """Returns the converted rows without the anchors of unknown QIDs, as convert_batch_wikianc leaves them out."""
+    entities = [[entity for entity in row_entities if entity['label'] != UNKNOWN_LABEL]
+                for row_entities in batch['entities']]
+    return {'text': batch['text'], 'entities': entities}
 
 
-def get_entity_by_qid(qid):
+def align_anchors(batch_entities, texts, token_arrays):
     """
-    Returns the entity by WikiData QID.
+    Aligns the anchors of a batch of docs to token spans, strictly as `Doc.char_span` does, and resolves overlaps.
+
+    All docs of the batch are laid out in one character space, so that every anchor is aligned with one binary
+    search over the token offsets of the batch. Of overlapping anchors the earliest and then the longest is kept.
 
-    :return: Entity corresponding to the QID.
+    :param batch_entities: The entities of every doc.
+    :param texts: The texts of the docs.
+    :param token_arrays: The IDX, LENGTH and IS_SPACE arrays of the tokens of every doc.
+    :return: The global start tokens, end tokens (exclusive), labels and doc indices of the kept anchors, and the
+        numbers of dropped anchors by reason.
     """
-    if not qid:
-        return 'MISC'
-    elif qid in LOC_WIKIDATA_ENTITIES:
-        return 'LOC'
-    elif qid in PER_WIKIDATA_ENTITIES:
-        return 'PER'
-    elif qid in ORG_WIKIDATA_ENTITIES:
-        return 'ORG'
-    else:
-        return None
-
-
-def convert_row_wikianc(row):
-    entities = []
-    for anchor in row['paragraph_anchors']:
-        start_raw = anchor.get('start')
-        end_raw = anchor.get('end')
-        qid = anchor.get('qid')
-        label = get_entity_by_qid(str(qid))
-
-        # skip if any are None
-        if start_raw is None or end_raw is None or label is None:
-            continue
-
-        # ensure these are actually integers
-        try:
-            start = int(start_raw)
-            end = int(end_raw)
-        except ValueError:
-            # if you can't convert them to int, skip
-            print(f"start_raw={start_raw}, type(start_raw)={type(start_raw)}")
-            print(f"start_raw={end_raw}, type(start_raw)={type(end_raw)}")
-            continue
-
-        entities.append({
-            "start": start,
-            "end": end,
-            "label": label,
-        })
-
-    data_point = {
-        "text": row["paragraph_text"],
-        "entities": entities,
-    }
-    return data_point
+    dropped = Counter()
+    token_counts = np.array([len(array) for array in token_arrays], dtype=np.int64)
+    token_offsets = np.concatenate([[0], np.cumsum(token_counts)])
+    # One character of padding between the docs, so that no offset is both the end of a doc and the start of the next
+    char_offsets = np.concatenate([[0], np.cumsum([len(text) + 1 for text in texts])])
+
+    tokens = np.concatenate(token_arrays) if token_offsets[-1] else np.zeros((0, 3), dtype=np.int64)
+    token_docs = np.repeat(np.arange(len(texts)), token_counts)
+    token_starts = tokens[:, 0] + char_offsets[token_docs]
+    token_ends = token_starts + tokens[:, 1]
+    token_spaces = tokens[:, 2].astype(bool)
+
+    docs = np.array([d for d, entities in enumerate(batch_entities) for _ in entities], dtype=np.int64)
+    starts = np.array([e['start'] for entities in batch_entities for e in entities], dtype=np.int64)
+    ends = np.array([e['end'] for entities in batch_entities for e in entities], dtype=np.int64)
+    labels = np.array([e['label'] for entities in batch_entities for e in entities], dtype=object)
+    if not len(docs) or not len(tokens):
+        dropped['dropped misaligned anchors'] += len(docs)
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, labels[:0], empty, dropped
+
+    in_range = (starts >= 0) & (ends <= char_offsets[docs + 1] - char_offsets[docs] - 1) & (starts < ends)
+    dropped['dropped anchors out of range'] += int(np.count_nonzero(~in_range))
+    starts, ends = starts + char_offsets[docs], ends + char_offsets[docs]
+
+    first = np.minimum(np.searchsorted(token_starts, starts), len(tokens) - 1)
+    last = np.minimum(np.searchsorted(token_ends, ends), len(tokens) - 1)
+    aligned = in_range & (token_starts[first] == starts) & (token_ends[last] == ends) & (last >= first)
+    dropped['dropped misaligned anchors'] += int(np.count_nonzero(in_range & ~aligned))
+
+    space = aligned & (token_spaces[first] | token_spaces[last])
+    dropped['dropped whitespace anchors'] += int(np.count_nonzero(space))
+    keep = aligned & ~space
+    first, last, labels, docs = first[keep], last[keep] + 1, labels[keep], docs[keep]
+
+    # Sort by start and then by length, the token indices of the batch already order the docs
+    order = np.lexsort((first - last, first))
+    first, last, labels, docs = first[order], last[order], labels[order], docs[order]
+
+    # An anchor that starts after the ends of all anchors before it is kept, the rare docs with other anchors are
+    # resolved one anchor at a time
+    previous_ends = np.concatenate([[0], np.maximum.accumulate(last)[:-1]])
+    keep = first >= previous_ends
+    for doc in np.unique(docs[~keep]):
+        kept_end = -1
+        for i in np.flatnonzero(docs == doc):
+            keep[i] = first[i] >= kept_end
+            if keep[i]:
+                kept_end = last[i]
+    dropped['dropped overlapping anchors'] += int(np.count_nonzero(~keep))
+
+    return first[keep] - token_offsets[docs[keep]], last[keep] - token_offsets[docs[keep]], labels[keep], \
+        docs[keep], dropped
+
+
+def create_docs(batch, nlp, batch_size=1000):
+    """
+    Creates the docs of a batch of converted WikiANC rows with the tokenizer only.
+
+    :param batch: The text and the entities of the rows.
+    :param nlp: The blank pipeline whose tokenizer and vocab the docs use.
+    :param batch_size: The batch size of the tokenizer.
+    :return: The docs and the numbers of dropped anchors by reason.
+    """
+    texts = batch['text']
+    docs = list(nlp.tokenizer.pipe(texts, batch_size=batch_size))
+    token_arrays = [doc.to_array([IDX, LENGTH, IS_SPACE]).astype(np.int64).reshape(-1, 3) for doc in docs]
+    starts, ends, labels, doc_indices, dropped = align_anchors(batch['entities'], texts, token_arrays)
+
+    # The entities are written as IOB arrays, with every token outside of an entity set to O as the ents setter does
+    token_offsets = np.concatenate([[0], np.cumsum([len(doc) for doc in docs])])
+    ents = np.zeros((token_offsets[-1], 2), dtype=np.uint64)
+    ents[:, 0] = 2
+    lengths = ends - starts
+    inside = np.repeat(starts + token_offsets[doc_indices], lengths) + \
+        np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    ents[inside, 0] = 1
+    ents[starts + token_offsets[doc_indices], 0] = 3
+    label_hashes = {label: nlp.vocab.strings.add(label) for label in set(labels)}
+    ents[inside, 1] = np.repeat(np.array([label_hashes[label] for label in labels], dtype=np.uint64), lengths)
+
+    for doc, start, end in zip(docs, token_offsets[:-1], token_offsets[1:]):
+        if start < end:
+            doc.from_array([ENT_IOB, ENT_TYPE], ents[start:end])
+    return docs, dropped
+
+
+def export_path(output_file, export_format):
+    """
+    Returns the part file of a further format of a DocBin shard, e.g. `pl/conll/train.parts/train7.txt` for
+    `pl/train/train7.spacy`.
+    """
+    split_dir, file_name = os.path.split(output_file)
+    language_dir, split = os.path.split(split_dir)
+    stem = os.path.splitext(file_name)[0]
+    return os.path.join(language_dir, export_format, f'{split}.parts', f'{stem}{EXPORT_SUFFIXES[export_format]}')
 
 
-def create_spacy_doc_bin_files(dataset, output_dir, file_name, nlp, chunk_size=5000):
-    os.makedirs(output_dir, exist_ok=True)  # Ensure output directory exists
+def write_conll(docs, batch, f):
+    """Writes the docs as BIO lines, in the format of xlmr/spacy_to_txt_converter.py."""
+    for doc in docs:
+        f.write(''.join(
+            f"{token.text} {'O' if token.ent_iob_ == 'O' else f'{token.ent_iob_}-{token.ent_type_}'}\n"
+            for token in doc if not token.is_space
+        ))
+        f.write("\n")
 
-    docs_limit = len(dataset)
-    file_index = 0
 
-    for i in tqdm(range(0, docs_limit, chunk_size), "Serialization:"):
-        db = DocBin()
-        for j in range(i, min(i + chunk_size, docs_limit)):
-            datum = dataset[j]
-            text = datum['text']
-            doc = nlp(text)
-            ents = []
-            for entities in datum.get('entities', []):
-                start = entities.get('start')
-                end = entities.get('end')
-                label = entities.get('label')
+def write_jsonl(docs, batch, f):
+    for doc in docs:
+        entities = [{"start": ent.start_char, "end": ent.end_char, "label": ent.label_} for ent in doc.ents]
+        f.write(json.dumps({"text": doc.text, "entities": entities}, ensure_ascii=False) + "\n")
+
+
+def tokenize_and_tag(text, entities):
+    """
+    Splits a text at whitespace and tags every token with the first entity, by start, that contains it.
 
-                span = doc.char_span(start, end, label=label)
+    The entities are swept alongside the tokens: an entity becomes active once a token starts at or after its start,
+    and an active entity that ends before the end of a token cannot contain any later token either.
+    """
+    tokens = []
+    sorted_entities = sorted(entities, key=lambda x: x['start'])
+    next_entity = 0
+    active = deque()
 
-                try:
-                    if text[start].isspace():
-                        print(f"Entity span '{text[start:end]}' has leading whitespace. Skipping.")
-                        print(f"Text: '{text}'")
-                        span = None
+    for match in TOKEN_PATTERN.finditer(text):
+        current, end = match.span()
+        while next_entity < len(sorted_entities) and sorted_entities[next_entity]['start'] <= current:
+            active.append(sorted_entities[next_entity])
+            next_entity += 1
+        while active and active[0]['end'] < end:
+            active.popleft()
 
-                    if text[end - 1].isspace():
-                        print(f"Entity span '{text[start:end]}' has trailing whitespace. Skipping.")
-                        print(f"Text: '{text}'")
-                        span = None
-                except IndexError:
-                    print(f"Index is out of range. start: {start}, end: {end}, test: '{text}'")
-                    span = None
+        if active:
+            entity = active[0]
+            label = ('B-' if current == entity['start'] else 'I-') + entity['label']
+        else:
+            label = 'O'
+        tokens.append((match.group(), label))
 
-                if span is not None:
-                    ents.append(span)
+    return tokens
 
 
-            # Discard overlapping entities and keep the longest one
-            ents = sorted(ents, key=lambda x: (x.start, -x.end + x.start))
-            filtered_ents = []
-            for ent in ents:
-                if not filtered_ents or ent.start >= filtered_ents[-1].end:
-                    filtered_ents.append(ent)
+def tag_batch(texts, batch_entities):
+    """Tags a batch of paragraphs and returns every paragraph as one block of `token label` lines."""
+    return [
+        ''.join(f"{token} {label}\n" for token, label in tokenize_and_tag(text, entities)) + "\n"
+        for text, entities in zip(texts, batch_entities)
+    ]
 
-            try:
-                doc.ents = filtered_ents
-            except ValueError as ex:
-                print(f"ValueError raised.")
-                print(f"filtered_ents={filtered_ents}, text={text}")
-                raise ex
-            db.add(doc)
 
-        # Save the chunk to a new file
-        output_file = os.path.join(output_dir, f'{file_name}{file_index + 1}.spacy')
-        db.to_disk(output_file)
-        file_index += 1
+def write_xlmr(docs, batch, f):
+    """Writes the rows as whitespace tokens with BIO tags, the anchors of unknown QIDs included, for XLM-R."""
+    blocks = tag_batch(batch['text'], batch['entities'])
+    for i in range(0, len(blocks), WRITE_PARAGRAPHS):
+        f.write(''.join(blocks[i:i + WRITE_PARAGRAPHS]))
 
 
-def create_spacy_files(data_source, language, nlp):
-    train_ner = data_source['train'].shuffle().select(range(min(3200000, len(data_source['train'])))).map(convert_row_wikianc)
-    create_spacy_doc_bin_files(dataset=train_ner, file_name='train', output_dir=f'./datasets/wikianc/{language}/train', nlp=nlp)
+# Every writer gets the docs and the converted rows they were created from, with the anchors of unknown QIDs
+EXPORT_WRITERS = {'conll': write_conll, 'jsonl': write_jsonl, 'xlmr': write_xlmr}
 
-    dev_ner = data_source['test'].shuffle().select(range(min(960000, len(data_source['test'])))).map(convert_row_wikianc)
-    create_spacy_doc_bin_files(dataset=dev_ner, file_name='dev', output_dir=f'./datasets/wikianc/{language}/dev', nlp=nlp)
 
-    valid_ner = data_source['validation'].shuffle().select(range(min(25000, len(data_source['validation'])))).map(convert_row_wikianc)
-    create_spacy_doc_bin_files(dataset=valid_ner, file_name='validation', output_dir=f'./datasets/wikianc/{language}/validation', nlp=nlp)
+def write_doc_bin_shard(rows, output_file, language, formats=(), outputs=None):
+    """
+    Converts a slice of WikiANC rows and writes their docs to one DocBin file, called by the preparation driver.
+
+    :param rows: The rows of the shard.
+    :param output_file: The DocBin file to write.
+    :param language: The language of the rows.
+    :param formats: Further formats to write the same docs in, see EXPORT_WRITERS.
+    :param outputs: The files to write, the DocBin file and the files of all formats by default.
+    :return: The numbers of dropped anchors by reason.
+    """
+    nlp = blank_model(SPACY_BLANK_LANGUAGES[LANGUAGES.index(language)])
+    batch = convert_batch_wikianc(rows.select_columns(['paragraph_text', 'paragraph_anchors'])[:], UNKNOWN_LABEL)
+    docs, dropped = create_docs(without_unknown(batch), nlp)
+    for export_format in formats:
+        if outputs is None or export_path(output_file, export_format) in outputs:
+            with atomic_output(export_path(output_file, export_format)) as tmp_path, \
+                    open(tmp_path, 'w', encoding='utf-8', buffering=WRITE_BUFFER) as f:
+                EXPORT_WRITERS[export_format](docs, batch, f)
+    if outputs is None or output_file in outputs:
+        with atomic_output(output_file) as tmp_path:
+            DocBin(docs=docs).to_disk(tmp_path)
+    return dropped
+
+
+def plan_spacy_files(data_source, language, seed=None, chunk_size=5000, formats=()):
+    """
+    Selects the rows of every split and plans their DocBin shards.
+
+    :param data_source: The split dataset of the language.
+    :param language: The language.
+    :param seed: The seed of the shuffle.
+    :param chunk_size: The number of docs in one DocBin file.
+    :param formats: Further formats that the shards are written in.
+    :return: The shards, the selected datasets by (language, split) and the part files of the further formats by
+        the file they are merged into.
+    """
+    # The QID index is opened here, before the workers are forked, so that they share its pages
+    inputs = {'seed': seed, 'converter': CONVERTER_VERSION, 'qid_index': get_qid_index().version}
+    units, split_datasets, merges = [], {}, {}
+    for split, name, limit in SPLITS:
+        dataset = shuffle_and_select(data_source[split], limit, seed)
+        split_datasets[(language, name)] = dataset
+        split_units = plan_shards(dataset, language, name, f'./datasets/wikianc/{language}/{name}', name, chunk_size,
+                                  inputs=inputs)
+        for export_format in formats:
+            parts = [export_path(unit.output_file, export_format) for unit in split_units]
+            merged_name = f'{EXPORT_SPLIT_NAMES[export_format][name]}{EXPORT_SUFFIXES[export_format]}'
+            merges[f'./datasets/wikianc/{language}/{export_format}/{merged_name}'] = parts
+        # Every format has its own key, so that adding a format writes only its files and not the DocBin shards
+        for unit in split_units:
+            unit.extra_outputs = tuple(export_path(unit.output_file, export_format) for export_format in formats)
+            unit.extra_keys = tuple(shard_key(shard=unit.key, format=export_format) for export_format in formats)
+        units += split_units
+    return units, split_datasets, merges
 
 
 # Slavic languages supported by 'unimelb-nlp/wikianc':
@@ -190,12 +333,28 @@ def create_spacy_files(data_source, language, nlp):
 # uk – Ukrainian (East Slavic)
 
 
-def main():
-    for i, language in enumerate(LANGUAGES):
-        print(f"Processing language: {language}")
-
-        ds = load_and_split_ds('cyanic-selkie/wikianc', language)
-        create_spacy_files(ds, language, spacy.blank(SPACY_BLANK_LANGUAGES[i]))
+def main(default_formats=()):
+    parser = argparse.ArgumentParser(description="Convert WikiANC to SpaCy DocBin files")
+    parser.add_argument("--languages", nargs="+", default=LANGUAGES, help="Languages to convert")
+    parser.add_argument("--workers", default=os.cpu_count(), type=int, help="Number of worker processes")
+    parser.add_argument("--seed", type=int, help="Seed of the shuffle of the splits, needed to reuse shards")
+    parser.add_argument("--force", action="store_true", help="Convert all shards, also the ones that are up to date")
+    parser.add_argument("--formats", nargs="*", default=list(default_formats), choices=sorted(EXPORT_WRITERS),
+                        help="Further formats to write in the same pass, into <language>/<format>/")
+    args = parser.parse_args()
+
+    units, split_datasets, merges = [], {}, {}
+    for language in args.languages:
+        print(f"Loading language: {language}")
+        ds = load_and_split_ds('cyanic-selkie/wikianc', language, seed=args.seed)
+        language_units, language_datasets, language_merges = plan_spacy_files(ds, language, args.seed,
+                                                                              formats=args.formats)
+        units += language_units
+        split_datasets.update(language_datasets)
+        merges.update(language_merges)
+
+    run_units(units, split_datasets, write_doc_bin_shard, workers=args.workers, force=args.force, merges=merges,
+              formats=args.formats)
 
 
 if __name__ == "__main__":
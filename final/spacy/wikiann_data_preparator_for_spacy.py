@@ -1,90 +1,26 @@
+import argparse
 import os
 
 import datasets
-import spacy
 from datasets import DatasetDict
 from spacy.tokens import DocBin, Doc
-from tqdm import tqdm
 
-PUNCTUATION_MARKS = {
-    ',', '.', '!', '?', ';', ':', '"', "'", "''", '[', ']', '(', ')', '{', '}',
-    '“', '”', '‘', '’', '–', '-', '—', '/', '\\', '|', '<', '>', '<<', '>>', '#', '*', '&', '%', '$', '@', '`', '~',
-    '‹', '›', '«', '»'
-}
-
-NO_SPACE_BEFORE_MARKS = {
-    ',', '.', '!', '?', ';', ':', ']', ')', '}', '”', '’', '>', '>>', '›', '»'
-}
-
-NO_SPACE_AFTER_MARKS = {
-    '[', '(', '{', '“', '‘', '<', '<<', '‹', '«',
-}
-
-NO_SPACE_BEFORE_SEQUENCE = ["''", "'"]
-NO_SPACE_AFTER_SEQUENCE = ["'", "''"]
+from detokenizer import WIKIANN_SPACING
+from preparation_driver import atomic_output, blank_model, plan_shards, run_units, shuffle_and_select
 
 DS_PATH = 'unimelb-nlp/wikiann'
 
 LANGUAGES =             ['be', 'bg', 'bs', 'cs', 'hr', 'mk', 'pl', 'ru', 'sh', 'sk', 'sl', 'sr', 'uk']
 SPACY_BLANK_LANGUAGES = ['xx', 'bg', 'bs', 'cs', 'hr', 'mk', 'pl', 'ru', 'sh', 'sk', 'sl', 'sr', 'uk']
 
-# python -m spacy train config_wikiann_bs.cfg --output models/wikiann/bs --gpu-id 0 && python -m spacy train config_wikiann_cs.cfg --output models/wikiann/cs --gpu-id 0 && python -m spacy train config_wikiann_hr.cfg --output models/wikiann/hr --gpu-id 0 && python -m spacy train config_wikiann_mk.cfg --output models/wikiann/mk --gpu-id 0 && python -m spacy train config_wikiann_pl.cfg --output models/wikiann/pl --gpu-id 0
+# The splits of the source dataset as (split, output name, row limit)
+SPLITS = [('train', 'train', 3200000), ('test', 'dev', 960000), ('validation', 'validation', 480000)]
 
+# The version of the conversion, part of the keys of the shards, to be increased when the written docs change
+CONVERTER_VERSION = 1
 
-def tokens_to_spans(tokens, tags, language, tag_list):
-    """
-    Converts a list of tokens into a formatted sentence and extracts entity positions.
-    Handles spacing before punctuation marks correctly.
-
-    Args:
-        tokens (List[str]): The list of tokens to be converted.
-        tags (List[str]): The corresponding list of tags.
-        language (str): The language.
-        tag_list (List[str]): A callable that maps tags from one type to another.
-
-    Returns:
-        Span: The formatted sentence and entity list.
-    """
-
-    sentence = ""
-    entities = []
-    current_pos = 0
-    current_entity = None
-
-    for token, tag_idx in zip(tokens, tags):
-        if token in PUNCTUATION_MARKS:
-            sentence += token  # Attach punctuation directly
-            current_pos += len(token)
-        else:
-            if sentence and not sentence.endswith(' '):
-                sentence += ' '
-                current_pos += 1
-            start_pos = current_pos
-            sentence += token
-            end_pos = current_pos + len(token)
-            current_pos = end_pos
-            tag = tag_list[tag_idx]
-
-            if tag.startswith('B-'):
-                if current_entity:
-                    entities.append(current_entity)
-                current_entity = {'start': start_pos, 'end': end_pos, 'label': tag[2:]}
-            elif tag.startswith('I-') and current_entity:
-                current_entity['end'] = end_pos
-            elif tag != 'O':
-                if current_entity:
-                    entities.append(current_entity)
-                    current_entity = None
-                entities.append({'start': start_pos, 'end': end_pos, 'label': tag})
-            else:
-                if current_entity:
-                    entities.append(current_entity)
-                    current_entity = None
-
-    if current_entity:
-        entities.append(current_entity)
-
-    return sentence, entities
+# The configs read the shards with streaming_corpus.py
+# python -m spacy train config_wikiann_bs.cfg --output models/wikiann/bs --gpu-id 0 --code streaming_corpus.py && python -m spacy train config_wikiann_cs.cfg --output models/wikiann/cs --gpu-id 0 --code streaming_corpus.py && python -m spacy train config_wikiann_hr.cfg --output models/wikiann/hr --gpu-id 0 --code streaming_corpus.py && python -m spacy train config_wikiann_mk.cfg --output models/wikiann/mk --gpu-id 0 --code streaming_corpus.py && python -m spacy train config_wikiann_pl.cfg --output models/wikiann/pl --gpu-id 0 --code streaming_corpus.py
 
 
 def load_ds(path, name, language):
@@ -96,9 +32,9 @@ def load_ds(path, name, language):
     return ds
 
 
-def load_and_split_ds(path, name, test_size=0.2):
+def load_and_split_ds(path, name, test_size=0.2, seed=None):
     ds = datasets.load_dataset(path, name)
-    ds_split_1 = ds['train'].train_test_split(test_size=test_size)
+    ds_split_1 = ds['train'].train_test_split(test_size=test_size, seed=seed)
 
     if 'validation' in ds:
         return DatasetDict({
@@ -106,7 +42,7 @@ def load_and_split_ds(path, name, test_size=0.2):
             'test': ds_split_1['test'],
             'validation': ds['validation']})
     else:
-        ds_split_2 = ds_split_1['test'].train_test_split(test_size=0.5)
+        ds_split_2 = ds_split_1['test'].train_test_split(test_size=0.5, seed=seed)
         return DatasetDict({
             'train': ds_split_1['train'],
             'test': ds_split_2['test'],
@@ -114,55 +50,67 @@ def load_and_split_ds(path, name, test_size=0.2):
 
 
 def create_doc(tokens, ner_tags, nlp):
-    tokens_len = len(tokens)
-    spaces = [True] * tokens_len
-    spaces[tokens_len - 1] = False
-
-    for i, token in enumerate(tokens):
-        if i > 0 and (token in NO_SPACE_BEFORE_MARKS or
-                i < tokens_len - 1 and tokens[i] == "''" and tokens[i + 1] == "'"):
-            spaces[i - 1] = False
-        if token in NO_SPACE_AFTER_MARKS or \
-                i > 0 and tokens[i - 1] == "'" and tokens[i] == "''":
-            spaces[i] = False
+    return Doc(nlp.vocab, tokens, WIKIANN_SPACING.spaces(tokens), ents=ner_tags)
 
-    return Doc(nlp.vocab, tokens, spaces, ents=ner_tags)
 
+def create_docs(batch, nlp, tag_list):
+    """
+    Creates the docs of a batch of dataset rows.
 
-def create_spacy_doc_bin_files(dataset, output_dir, file_name, nlp, tag_list, chunk_size=100):
-    os.makedirs(output_dir, exist_ok=True)  # Ensure output directory exists
+    Args:
+        batch (Dict[str, List]): The columns of the rows, as returned by Dataset.iter.
+        nlp (Language): The pipeline whose vocab the docs use.
+        tag_list (List[str]): The tag names by tag index.
 
-    docs_limit = len(dataset)
-    file_index = 0
+    Returns:
+        List[Doc]: The docs of the rows.
+    """
+    batch_tokens = batch['tokens']
+    batch_tags = [[tag_list[tag] for tag in tags] for tags in batch['ner_tags']]
+    batch_spaces = [WIKIANN_SPACING.spaces(tokens) for tokens in batch_tokens]
+    return [
+        Doc(nlp.vocab, tokens, spaces, ents=tags)
+        for tokens, spaces, tags in zip(batch_tokens, batch_spaces, batch_tags)
+    ]
 
-    for i in tqdm(range(0, docs_limit, chunk_size), "Serialization:"):
-        db = DocBin()
-        for j in range(i, min(i + chunk_size, docs_limit)):
-            datum = dataset[j]
-            tokens = datum['tokens']
-            ner_tags = [tag_list[i] for i in datum['ner_tags']]
-            doc = create_doc(tokens, ner_tags, nlp)
-            db.add(doc)
 
-        # Save the chunk to a new file
-        output_file = os.path.join(output_dir, f'{file_name}{file_index + 1}.spacy')
-        db.to_disk(output_file)
-        file_index += 1
+def write_doc_bin_shard(rows, output_file, language, tag_list):
+    """
+    Writes the docs of a slice of dataset rows to one DocBin file, called by the preparation driver.
 
+    Args:
+        rows (Dataset): The rows of the shard.
+        output_file (str): The DocBin file to write.
+        language (str): The language of the rows.
+        tag_list (List[str]): The tag names by tag index.
+    """
+    # The shard is one contiguous slice of the Arrow table, converted to Python columns at once
+    batch = rows.select_columns(['tokens', 'ner_tags'])[:]
+    with atomic_output(output_file) as tmp_path:
+        DocBin(docs=create_docs(batch, blank_model(SPACY_BLANK_LANGUAGES[LANGUAGES.index(language)]), tag_list)).to_disk(tmp_path)
 
-def create_spacy_files(data_source, language, nlp, tag_list):
-    train_ner = data_source['train'].shuffle().select(range(min(3200000, len(data_source['train']))))
-    create_spacy_doc_bin_files(dataset=train_ner, file_name='train', output_dir=f'./datasets/wikiann/{language}/train', nlp=nlp, tag_list=tag_list)
 
-    dev_ner = data_source['test'].shuffle().select(range(min(960000, len(data_source['test']))))
-    create_spacy_doc_bin_files(dataset=dev_ner, file_name='dev', output_dir=f'./datasets/wikiann/{language}/dev', nlp=nlp, tag_list=tag_list)
+def plan_spacy_files(data_source, language, seed=None, chunk_size=100):
+    """
+    Selects the rows of every split and plans their DocBin shards.
 
-    valid_ner = data_source['validation'].shuffle().select(range(min(480000, len(data_source['validation']))))
-    create_spacy_doc_bin_files(dataset=valid_ner, file_name='validation', output_dir=f'./datasets/wikiann/{language}/validation', nlp=nlp, tag_list=tag_list)
+    Args:
+        data_source (DatasetDict): The dataset of the language.
+        language (str): The language.
+        seed (int): The seed of the shuffle.
+        chunk_size (int): The number of docs in one DocBin file.
 
-    print(f"len(train_ner)={len(train_ner)}")
-    print(f"len(dev_ner)={len(dev_ner)}")
-    print(f"len(valid_ner)={len(valid_ner)}")
+    Returns:
+        Tuple[List[ShardUnit], Dict[Tuple[str, str], Dataset]]: The shards and the selected datasets.
+    """
+    units, split_datasets = [], {}
+    for split, name, limit in SPLITS:
+        dataset = shuffle_and_select(data_source[split], limit, seed)
+        split_datasets[(language, name)] = dataset
+        units += plan_shards(dataset, language, name, f'./datasets/wikiann/{language}/{name}', name, chunk_size,
+                             inputs={'seed': seed, 'converter': CONVERTER_VERSION})
+        print(f"len({name}_ner)={len(dataset)}")
+    return units, split_datasets
 
 tags = ['O', 'B-PER', 'I-PER', 'B-ORG', 'I-ORG', 'B-LOC', 'I-LOC']
 
@@ -200,7 +148,25 @@ tags = ['O', 'B-PER', 'I-PER', 'B-ORG', 'I-ORG', 'B-LOC', 'I-LOC']
 # │ uk         │ 20000   │ 10000      │ 10000 │
 # └────────────┴─────────┴────────────┴───────┘
 
-for i, language in enumerate(LANGUAGES):
-    print(f"Processing language: {language}")
-    ds = datasets.load_dataset(DS_PATH, language)
-    create_spacy_files(ds, language, spacy.blank(SPACY_BLANK_LANGUAGES[i]), tags)
\ No newline at end of file
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert WikiANN to SpaCy DocBin files")
+    parser.add_argument("--languages", nargs="+", default=LANGUAGES, help="Languages to convert")
+    parser.add_argument("--workers", default=os.cpu_count(), type=int, help="Number of worker processes")
+    parser.add_argument("--seed", type=int, help="Seed of the shuffle of the splits, needed to reuse shards")
+    parser.add_argument("--force", action="store_true", help="Convert all shards, also the ones that are up to date")
+    args = parser.parse_args()
+
+    units, split_datasets = [], {}
+    for language in args.languages:
+        print(f"Loading language: {language}")
+        ds = datasets.load_dataset(DS_PATH, language)
+        language_units, language_datasets = plan_spacy_files(ds, language, args.seed)
+        units += language_units
+        split_datasets.update(language_datasets)
+
+    run_units(units, split_datasets, write_doc_bin_shard, workers=args.workers, force=args.force, tag_list=tags)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
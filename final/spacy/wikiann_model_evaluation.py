@@ -4,60 +4,46 @@ NER Model Evaluation Script
 
 Evaluate a Hugging Face **TNER** checkpoint on an NER dataset and print precision, recall, and F1.
 
+The gold docs are read shard by shard and run through `nlp.pipe` in batches, optionally in several processes, and
+the examples are scored as they come, so only a bounded number of docs is held at a time.
+
+With `--store`, the predictions on every validation file are kept in a prediction store, the model is only run on the
+files it has not predicted yet, and rescore_predictions.py computes the metrics again without running it.
+
 Example:
-    python wikiann_model_evaluation.py --language bs --repo_id spacy/xx_ent_wiki_sm
+    python wikiann_model_evaluation.py --language bs --repo_id spacy/xx_ent_wiki_sm --batch_size 256 --n_process 4
+    python wikiann_model_evaluation.py --language bs --repo_id spacy/xx_ent_wiki_sm --store predictions
 """
 
 import argparse
 import glob
+import sys
+import time
+from collections import defaultdict
+from itertools import tee
 from pathlib import Path
-from typing import List, Tuple, Iterator
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Iterator
 
 import spacy
 from spacy import Language
 from spacy.tokens import DocBin, Doc, Token
-from spacy.scorer import Scorer
+from spacy.scorer import PRFScore
 from spacy.training import Example
 from tqdm.std import tqdm
 
 from datasets import load_dataset, Dataset, DatasetDict
 from huggingface_hub import snapshot_download
 
-_PREFIXES: Tuple[str, ...] = ("Ġ", "▁", "##")
+from prediction_store import PredictionStore, file_sha256, map_tag
+
+# The quantized models are loaded with the app's utilities
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
 LABEL_LIST = ['B-LOC', 'B-ORG', 'B-PER', 'I-LOC', 'I-ORG', 'I-PER', 'O' ]
 SPACY_BLANK_LANGUAGES = {'be': 'xx', 'bg': 'bg', 'bs': 'bs', 'cs': 'cs', 'hr': 'hr', 'mk': 'mk', 'pl': 'pl', 'ru': 'ru', 'sh': 'sh', 'sk': 'sk',
                          'sl': 'sl', 'sr': 'sr', 'uk': 'uk'}
 
 
-def _clean(tok: str) -> str:
-    """Strip common sub‑word prefixes."""
-    while tok and tok.startswith(_PREFIXES):
-        tok = tok[1:]
-    return tok
-
-
-def align_predictions_to_tokens(tokens: List[str], pred_input: List[str], ent_spans):
-    """Map span‑level entity predictions to token‑level IOB2 labels."""
-    mapping, j = [], 0
-    for tok in tokens:
-        while j < len(pred_input) and _clean(pred_input[j]).lower() != tok.lower():
-            j += 1
-        mapping.append(j)
-        j += 1
-    labels = ["O"] * len(tokens)
-    for pos_list, label in ent_spans:
-        if not pos_list:
-            continue
-        start_tok_idx = next((idx for idx, mp in enumerate(mapping) if mp == pos_list[0]), None)
-        end_tok_idx = next((idx for idx, mp in enumerate(mapping) if mp == pos_list[-1]), start_tok_idx)
-        if start_tok_idx is None:
-            continue
-        labels[start_tok_idx] = f"B-{label}"
-        for i in range(start_tok_idx + 1, (end_tok_idx or start_tok_idx) + 1):
-            labels[i] = f"I-{label}"
-    return labels
-
-
 def get_dataset(local_dataset: dict) -> Tuple[DatasetDict, dict]:
     """Load dataset from local files.
 
@@ -88,45 +74,182 @@ def get_dataset(local_dataset: dict) -> Tuple[DatasetDict, dict]:
     return DatasetDict(dataset_dict), {}
 
 
-def evaluate_model(language: str, repo_id: str) -> None:
-    """Evaluate the model at *entity‑span* level and print a spaCy report."""
-    print(f"Loading model for language: {language} …")
+def gold_files(language: str) -> List[str]:
+    """Return the `.spacy` files of the gold-standard validation set."""
+    return sorted(glob.glob(f"datasets/wikianc_validation/{language}/validation/*.spacy"))
 
-    model_path: Path
-    if repo_id:
-        model_path = Path(snapshot_download(repo_id=repo_id, revision="main"))
-    else:
-        model_path = Path(f"models/wikiannc/{language}/model-best")
-    model = spacy.load(model_path)
 
-    # --- load the gold‑standard validation set ----------------------------
+def iter_gold_docs(language: str) -> Iterator[Doc]:
+    """Stream the gold-standard validation set, reading one shard at a time."""
+    nlp: Language = spacy.blank(SPACY_BLANK_LANGUAGES[language])
+    for file in gold_files(language):
+        yield from DocBin().from_disk(file).get_docs(nlp.vocab)
+
+
+class NerScorer:
+    """Accumulates the span-level NER counts of examples as they come, as `spacy.scorer.get_ner_prf` counts them."""
+
+    def __init__(self) -> None:
+        self.score_per_type: Dict[str, PRFScore] = defaultdict(PRFScore)
+
+    def add(self, eg: Example) -> None:
+        if not eg.y.has_annotation("ENT_IOB"):
+            return
+        golds = {(e.label_, e.start, e.end) for e in eg.y.ents}
+        align_x2y = eg.alignment.x2y
+        for pred_ent in eg.x.ents:
+            score = self.score_per_type[pred_ent.label_]
+            indices = align_x2y[pred_ent.start:pred_ent.end]
+            if len(indices):
+                g_span = eg.y[indices[0]:indices[-1] + 1]
+                # A prediction on a span with missing annotation is neither right nor wrong
+                if all(token.ent_iob != 0 for token in g_span):
+                    key = (pred_ent.label_, indices[0], indices[-1] + 1)
+                    if key in golds:
+                        score.tp += 1
+                        golds.remove(key)
+                    else:
+                        score.fp += 1
+        for label, _, _ in golds:
+            self.score_per_type[label].fn += 1
+
+    def results(self) -> dict:
+        """Return the metrics in the format of `Scorer.score`."""
+        totals = PRFScore()
+        for prf in self.score_per_type.values():
+            totals += prf
+        if len(totals) == 0:
+            return {"ents_p": None, "ents_r": None, "ents_f": None, "ents_per_type": None}
+        return {
+            "ents_p": totals.precision,
+            "ents_r": totals.recall,
+            "ents_f": totals.fscore,
+            "ents_per_type": {k: v.to_dict() for k, v in self.score_per_type.items()},
+        }
+
+
+def score_model(model: Language, gold_docs: Iterable[Doc], batch_size: int = 256,
+                n_process: int = 1) -> Tuple[dict, float, int]:
+    """Score span matches of the model on the gold docs and return the metrics, the time and the number of docs."""
+    scorer = NerScorer()
+    docs_count = 0
+    # The gold docs are read once, the copy only buffers the docs that nlp.pipe is still working on
+    gold_docs, texts = tee(gold_docs)
+    start = time.perf_counter()
+    pred_docs = model.pipe((gold_doc.text for gold_doc in texts), batch_size=batch_size, n_process=n_process)
+    for gold_doc, pred_doc in tqdm(zip(gold_docs, pred_docs), desc="Scoring", unit="doc"):
+        scorer.add(Example(pred_doc, gold_doc))
+        docs_count += 1
+    seconds = time.perf_counter() - start
+    return scorer.results(), seconds, docs_count
+
+
+def gold_tags(doc: Doc) -> List[str]:
+    """Return the IOB tags of the tokens of a doc, empty for tokens with missing annotation."""
+    return [f"{token.ent_iob_}-{token.ent_type_}" if token.ent_iob_ in ('B', 'I') else token.ent_iob_
+            for token in doc]
+
+
+def prediction_record(gold_doc: Doc, pred_doc: Doc) -> dict:
+    """Return the gold tags and the predicted entities of a doc as a sentence of the prediction store."""
+    return {
+        'tokens': [token.text for token in gold_doc],
+        'spaces': [bool(token.whitespace_) for token in gold_doc],
+        'tags': gold_tags(gold_doc),
+        'pred_tokens': [token.text for token in pred_doc],
+        'pred_spaces': [bool(token.whitespace_) for token in pred_doc],
+        'entities': [[ent.start_char, ent.end_char, ent.label_] for ent in pred_doc.ents],
+    }
+
+
+def record_example(nlp: Language, sentence: dict, label_map: Optional[Dict[str, str]] = None) -> Example:
+    """Rebuild the predicted and the gold doc of a sentence of the prediction store."""
+    gold_doc = Doc(nlp.vocab, sentence['tokens'], sentence['spaces'],
+                   ents=[map_tag(tag, label_map) for tag in sentence['tags']])
+    pred_doc = Doc(nlp.vocab, sentence['pred_tokens'], sentence['pred_spaces'])
+    ents = []
+    for start, end, label in sentence['entities']:
+        label = label_map.get(label, label) if label_map else label
+        if label != 'O':
+            ents.append(pred_doc.char_span(start, end, label))
+    pred_doc.ents = ents
+    return Example(pred_doc, gold_doc)
+
+
+def predict_to_store(load_model: Callable[[], Language], model_name: str, model_hash: str, language: str,
+                     store: PredictionStore, batch_size: int = 256, n_process: int = 1) -> List[dict]:
+    """
+    Return the store entries of the model on the validation files, predicting the files that are not stored yet.
+
+    The model is only loaded when a file is missing, and the missing files are run through one `nlp.pipe`.
+    """
+    files = gold_files(language)
+    shard_hashes = [file_sha256(file) for file in files]
+    entries = [store.load(model_hash, shard_hash) for shard_hash in shard_hashes]
+    missing = [index for index, entry in enumerate(entries) if entry is None]
+    if not missing:
+        return entries
+
+    print(f"Predicting {len(missing)} of {len(files)} validation files...")
+    model = load_model()
     nlp: Language = spacy.blank(SPACY_BLANK_LANGUAGES[language])
+    gold_docs = ((index, doc) for index in missing for doc in DocBin().from_disk(files[index]).get_docs(nlp.vocab))
+    gold_docs, texts = tee(gold_docs)
+    pred_docs = model.pipe((gold_doc.text for _, gold_doc in texts), batch_size=batch_size, n_process=n_process)
+
+    def save(index: int, sentences: List[dict], seconds: float) -> None:
+        entries[index] = store.save('spacy', model_name, model_hash, language, files[index], shard_hashes[index],
+                                    sentences, seconds)
+
+    current, sentences = None, []
+    start = time.perf_counter()
+    for (index, gold_doc), pred_doc in tqdm(zip(gold_docs, pred_docs), desc="Predicting", unit="doc"):
+        if index != current:
+            if current is not None:
+                save(current, sentences, time.perf_counter() - start)
+                start = time.perf_counter()
+            current, sentences = index, []
+        sentences.append(prediction_record(gold_doc, pred_doc))
+    if current is not None:
+        save(current, sentences, time.perf_counter() - start)
+    # A file without docs has no predictions to store
+    return [entry for entry in entries if entry is not None]
 
-    validation_files = glob.glob(f"datasets/wikianc_validation/{language}/validation/*.spacy")
-    print(f"Loading {len(validation_files)} validation files...")
-    gold_docs: List[Doc] = []
-    for file in validation_files:
-        print(f"  → {file}")
-        db = DocBin().from_disk(file)
-        gold_docs.extend(list(db.get_docs(nlp.vocab)))
 
-    # --- score span matches ------------------------------------------------
-    examples: List[Example] = []
-    for gold_doc in tqdm(gold_docs, desc="Creating examples"):
-        pred_doc = model(gold_doc.text)
-        examples.append(Example(pred_doc, gold_doc))
+def score_entries(entries: Iterable[dict], label_map: Optional[Dict[str, str]] = None) -> Tuple[dict, float, int]:
+    """Score the stored predictions as score_model scores the model and return the metrics, time and docs count."""
+    nlp: Language = spacy.blank('xx')
+    scorer = NerScorer()
+    seconds, docs_count = 0.0, 0
+    for entry in entries:
+        for sentence in entry['sentences']:
+            scorer.add(record_example(nlp, sentence, label_map))
+            docs_count += 1
+        seconds += entry['seconds']
+    return scorer.results(), seconds, docs_count
 
-    scorer = Scorer()
-    results = scorer.score(examples)                  # returns the metrics dict
 
-    if results is None:
-        raise ValueError("results is None")
+def run_model(language: str, model_name: str, load_model: Callable[[], Language], store: Optional[PredictionStore],
+              batch_size: int, n_process: int) -> Tuple[dict, float, int]:
+    """Score the model directly, or through the prediction store when one is given."""
+    if store is None:
+        return score_model(load_model(), iter_gold_docs(language), batch_size, n_process)
+    entries = predict_to_store(load_model, model_name, store.model_hash(model_name), language, store, batch_size,
+                               n_process)
+    return score_entries(entries)
 
+
+def _format_score(score: Optional[float]) -> str:
+    """Format a metric, which spaCy leaves as None when there are neither gold nor predicted entities."""
+    return "n/a" if score is None else f"{score:.4f}"
+
+
+def print_results(language: str, results: dict) -> None:
     print(f"\nLanguage: {language}")
     print("Span‑level named‑entity evaluation:")
-    print(f"Precision : {results['ents_p']:.4f}")
-    print(f"Recall    : {results['ents_r']:.4f}")
-    print(f"F1        : {results['ents_f']:.4f}")
+    print(f"Precision : {_format_score(results['ents_p'])}")
+    print(f"Recall    : {_format_score(results['ents_r'])}")
+    print(f"F1        : {_format_score(results['ents_f'])}")
 
     if results.get("ents_per_type"):
         print("\nPer‑label breakdown:")
@@ -134,13 +257,71 @@ def evaluate_model(language: str, repo_id: str) -> None:
             print(f"  {label:12}  P={m['p']:.4f}  R={m['r']:.4f}  F1={m['f']:.4f}")
 
 
+def _directory_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def print_quantization_report(language: str, fp32: Tuple[dict, float, Path], int8: Tuple[dict, float, Path],
+                              docs_count: int) -> None:
+    """Print the accuracy, latency and size deltas of the int8 model against the fp32 one, n/a where one is missing."""
+    (fp32_results, fp32_seconds, fp32_path), (int8_results, int8_seconds, int8_path) = fp32, int8
+    print(f"\n=== {language.upper()} int8 vs fp32 ===")
+    for key, name in (("ents_p", "Precision"), ("ents_r", "Recall"), ("ents_f", "F1")):
+        fp32_score, int8_score = fp32_results.get(key), int8_results.get(key)
+        delta = "n/a" if fp32_score is None or int8_score is None else f"{int8_score - fp32_score:+.4f}"
+        print(f"{name:10}: fp32={_format_score(fp32_score)}  int8={_format_score(int8_score)}  Δ={delta}")
+    if docs_count:
+        speedup = f"{fp32_seconds / int8_seconds:.2f}x" if int8_seconds else "n/a"
+        print(f"Latency   : fp32={1000 * fp32_seconds / docs_count:.2f} ms/doc  "
+              f"int8={1000 * int8_seconds / docs_count:.2f} ms/doc  speedup={speedup}")
+    else:
+        print("Latency   : n/a, no validation docs")
+    fp32_size, int8_size = _directory_size(fp32_path), _directory_size(int8_path)
+    ratio = f"{int8_size / fp32_size:.2f}" if fp32_size else "n/a"
+    print(f"Size      : fp32={fp32_size / 2 ** 20:.0f} MB  int8={int8_size / 2 ** 20:.0f} MB  ratio={ratio}")
+
+
+def evaluate_model(language: str, repo_id: str, quantized_model: str = None, batch_size: int = 256,
+                   n_process: int = 1, store_dir: str = None) -> None:
+    """Evaluate the model at *entity‑span* level and print a spaCy report."""
+    print(f"Loading model for language: {language} …")
+
+    model_path: Path
+    if repo_id:
+        model_path = Path(snapshot_download(repo_id=repo_id, revision="main"))
+    else:
+        model_path = Path(f"models/wikiannc/{language}/model-best")
+    store = PredictionStore(store_dir) if store_dir else None
+
+    # --- score span matches on the streamed gold‑standard validation set ---
+    print(f"Streaming {len(gold_files(language))} validation files...")
+    results, seconds, docs_count = run_model(language, str(model_path), lambda: spacy.load(model_path), store,
+                                             batch_size, n_process)
+    print_results(language, results)
+
+    if quantized_model:
+        from utils.model_quantizer import load_quantized_model
+
+        print(f"\nLoading int8 model: {quantized_model} …")
+        int8_results, int8_seconds, _ = run_model(language, quantized_model,
+                                                  lambda: load_quantized_model(quantized_model), store, batch_size,
+                                                  n_process)
+        print_results(language, int8_results)
+        print_quantization_report(language, (results, seconds, model_path),
+                                  (int8_results, int8_seconds, Path(quantized_model)), docs_count)
+
+
 def main() -> None:
     """CLI wrapper."""
     parser = argparse.ArgumentParser(description="Evaluate a TNER model on an HF dataset")
     parser.add_argument("--language", required=True, help="Language")
     parser.add_argument("--repo_id", required=False, help="Spacy repo ID", default="spacy/xx_ent_wiki_sm", type=str)
+    parser.add_argument("--quantized_model", required=False, help="Int8 model directory to compare against", type=str)
+    parser.add_argument("--batch_size", required=False, help="Docs per nlp.pipe batch", default=256, type=int)
+    parser.add_argument("--n_process", required=False, help="Processes of nlp.pipe, 1 on GPU", default=1, type=int)
+    parser.add_argument("--store", required=False, help="Directory of the prediction store", type=str)
     args = parser.parse_args()
-    evaluate_model(args.language, args.repo_id)
+    evaluate_model(args.language, args.repo_id, args.quantized_model, args.batch_size, args.n_process, args.store)
 
 
 if __name__ == "__main__":
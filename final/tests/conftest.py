@@ -0,0 +1,9 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+# The app imports the utils package from the app directory, the preparation and evaluation scripts import each other
+# from the spacy directory
+for path in (ROOT, ROOT / "spacy"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
@@ -0,0 +1,93 @@
+import random
+
+import pytest
+
+spacy = pytest.importorskip("spacy")
+
+from spacy.tokens import Doc  # noqa: E402
+
+from detokenizer import ATTACH_PUNCTUATION, WIKIANN_SPACING, SpacingRules, detokenize, detokenize_batch  # noqa: E402
+from detokenizer_reference import MARKS, MNER_MARKS, TAG_LIST, WORDS, build_sentences, reference_compute_spaces, \
+    reference_tokens_to_spans  # noqa: E402
+
+
+@pytest.fixture
+def rng():
+    return random.Random(0)
+
+
+def random_wikiann_sentences(rng, count=5000):
+    batch_tokens = [[rng.choice(WORDS + MARKS) for _ in range(rng.randint(1, 30))] for _ in range(count)]
+    batch_tags = [[rng.choice(TAG_LIST) for _ in tokens] for tokens in batch_tokens]
+    for tags in batch_tags:
+        # spaCy rejects an I- tag at the start of a sentence
+        tags[0] = tags[0].replace('I-', 'B-')
+    return batch_tokens, batch_tags
+
+
+def test_attached_punctuation_matches_tokens_to_spans(rng):
+    # tokens_to_spans and tokens_to_text_with_tags, the MAPA tag map maps the dataset labels
+    batch_tokens, batch_tags = build_sentences(5000, 30, rng)
+    tag_map = {'PER': 'PER', 'LOC': 'LOC', 'ORG': 'MISC'}
+    texts, _, batch_entities = detokenize_batch(batch_tokens, batch_tags, ATTACH_PUNCTUATION, tag_map)
+    for tokens, tags, text, entities in zip(batch_tokens, batch_tags, texts, batch_entities):
+        assert (text, entities) == reference_tokens_to_spans(tokens, tags, tag_map), (tokens, tags)
+
+
+def test_a_stray_inside_tag_starts_an_entity_of_its_own_label():
+    # The previous implementations made a stray I- tag an entity labelled with the whole tag, or extended the entity
+    # before it whatever its label, an I- tag now continues only an entity of its label, as spaCy reads BIO tags
+    tokens = ['Jan', 'Kowalski', 'w', 'Warszawie', ',', 'Polska']
+    tags = ['O', 'I-PER', 'O', 'B-PER', 'O', 'I-LOC']
+    assert detokenize(tokens, tags, ATTACH_PUNCTUATION)[2] == [
+        {'start': 4, 'end': 12, 'label': 'PER'},
+        {'start': 15, 'end': 24, 'label': 'PER'},
+        {'start': 26, 'end': 32, 'label': 'LOC'},
+    ]
+    assert reference_tokens_to_spans(tokens, tags)[1] == [
+        {'start': 4, 'end': 12, 'label': 'I-PER'},
+        {'start': 15, 'end': 32, 'label': 'PER'},
+    ]
+
+    tags = ['B-PER', 'I-LOC', 'I-LOC', 'O', 'O', 'O']
+    assert detokenize(tokens, tags, WIKIANN_SPACING)[2] == [
+        {'start': 0, 'end': 3, 'label': 'PER'},
+        {'start': 4, 'end': 14, 'label': 'LOC'},
+    ]
+    doc = Doc(spacy.blank('xx').vocab, tokens, WIKIANN_SPACING.spaces(tokens), ents=tags)
+    assert [(ent.start_char, ent.end_char, ent.label_) for ent in doc.ents] == [(0, 3, 'PER'), (4, 14, 'LOC')]
+
+
+def test_mner_rules_match_the_texts_of_mner(rng):
+    # The copy in 4/mner.py has its own marks and did not advance the offsets past them, only the texts agree
+    mner_rules = SpacingRules(no_space_before=MNER_MARKS, untagged=MNER_MARKS)
+    batch_tokens, batch_tags = build_sentences(5000, 30, rng, sorted(MNER_MARKS))
+    texts, _, batch_entities = detokenize_batch(batch_tokens, batch_tags, mner_rules)
+    for tokens, tags, text, entities in zip(batch_tokens, batch_tags, texts, batch_entities):
+        reference_text, reference_entities = reference_tokens_to_spans(tokens, tags, None, MNER_MARKS, False)
+        assert text == reference_text, (tokens, tags)
+        if not MNER_MARKS.intersection(tokens):
+            assert entities == reference_entities, (tokens, tags)
+
+
+def test_wikiann_spacing_matches_the_docs_spacy_builds(rng):
+    nlp = spacy.blank('xx')
+    batch_tokens, batch_tags = random_wikiann_sentences(rng)
+    texts, batch_spaces, batch_entities = detokenize_batch(batch_tokens, batch_tags, WIKIANN_SPACING)
+    for tokens, tags, text, spaces, entities in zip(batch_tokens, batch_tags, texts, batch_spaces, batch_entities):
+        assert spaces == reference_compute_spaces(tokens), tokens
+        doc = Doc(nlp.vocab, tokens, spaces, ents=tags)
+        assert text == doc.text, (tokens, text, doc.text)
+        doc_entities = [{'start': ent.start_char, 'end': ent.end_char, 'label': ent.label_} for ent in doc.ents]
+        assert entities == doc_entities, (tokens, tags)
+
+
+def test_create_doc_matches_the_previous_create_doc(rng):
+    wikiann_preparator = pytest.importorskip("wikiann_data_preparator_for_spacy")
+    nlp = spacy.blank('xx')
+    batch_tokens, batch_tags = random_wikiann_sentences(rng, 2000)
+    for tokens, tags in zip(batch_tokens, batch_tags):
+        doc = wikiann_preparator.create_doc(tokens, tags, nlp)
+        # The previous create_doc
+        reference = Doc(nlp.vocab, tokens, reference_compute_spaces(tokens), ents=tags)
+        assert doc.to_bytes() == reference.to_bytes(), (tokens, tags)
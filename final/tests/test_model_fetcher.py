@@ -0,0 +1,139 @@
+import json
+import threading
+import zipfile
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("requests")
+
+from utils.model_fetcher import MANIFEST_FILE, STAMP_FILE, build_manifest, fetch_model, fetch_models, \
+    is_up_to_date  # noqa: E402
+
+MODEL_FILES = {
+    "model-best/config.cfg": b"[nlp]\nlang = \"pl\"\n",
+    "model-best/ner/model": bytes(range(256)) * 4096,
+}
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Serves the files of a directory, honouring `Range: bytes=<start>-` as a model storage does."""
+
+    ranges = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.ranges.append(self.headers.get("Range"))
+        path = Path(self.translate_path(self.path))
+        if not self.headers.get("Range") or not path.is_file():
+            return super().do_GET()
+
+        data = path.read_bytes()
+        start = int(self.headers["Range"].removeprefix("bytes=").rstrip("-"))
+        if start >= len(data):
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{len(data)}")
+            self.end_headers()
+            return
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+        self.send_header("Content-Length", str(len(data) - start))
+        self.end_headers()
+        self.wfile.write(data[start:])
+
+
+@pytest.fixture
+def storage(tmp_path):
+    """A local HTTP server of a manifest and the zipped model of `pl`."""
+    served = tmp_path / "served"
+    served.mkdir()
+    with zipfile.ZipFile(served / "pl.zip", "w", zipfile.ZIP_DEFLATED) as zip_ref:
+        for name, data in MODEL_FILES.items():
+            zip_ref.writestr(name, data)
+    build_manifest(served)
+
+    RangeRequestHandler.ranges = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(RangeRequestHandler, directory=str(served)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield served, f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+def manifest_entry(served):
+    return json.loads(Path(served, MANIFEST_FILE).read_text(encoding="utf-8"))["pl"]
+
+
+def assert_installed(dest_dir):
+    for name, data in MODEL_FILES.items():
+        assert Path(dest_dir, name).read_bytes() == data
+
+
+def test_fetch_installs_and_skips_up_to_date_models(storage, tmp_path):
+    served, base_url = storage
+    models_dir = tmp_path / "models"
+
+    assert fetch_models(["pl"], models_dir, base_url) == {"pl": True}
+    assert_installed(models_dir / "pl")
+    assert not Path(models_dir, "pl.zip").exists()
+    assert fetch_models(["pl"], models_dir, base_url) == {"pl": False}
+
+
+def test_fetch_resumes_a_partial_download(storage, tmp_path):
+    served, base_url = storage
+    models_dir = tmp_path / "models"
+    models_dir.mkdir()
+    archive = Path(served, "pl.zip").read_bytes()
+    offset = len(archive) // 2
+    Path(models_dir, "pl.zip.part").write_bytes(archive[:offset])
+
+    assert fetch_model("pl", manifest_entry(served), base_url, models_dir)
+    assert RangeRequestHandler.ranges == [f"bytes={offset}-"]
+    assert_installed(models_dir / "pl")
+    assert not Path(models_dir, "pl.zip.part").exists()
+
+
+def test_fetch_rejects_an_archive_with_another_checksum(storage, tmp_path):
+    served, base_url = storage
+    models_dir = tmp_path / "models"
+    entry = dict(manifest_entry(served), sha256="0" * 64)
+
+    with pytest.raises(RuntimeError, match="Checksum mismatch"):
+        fetch_model("pl", entry, base_url, models_dir)
+    assert not Path(models_dir, "pl.zip.part").exists()
+    assert not Path(models_dir, "pl", STAMP_FILE).exists()
+    assert not Path(models_dir, "pl", "model-best").exists()
+
+
+def test_fetch_discards_a_corrupted_partial_download(storage, tmp_path):
+    served, base_url = storage
+    models_dir = tmp_path / "models"
+    models_dir.mkdir()
+    Path(models_dir, "pl.zip.part").write_bytes(b"not the start of the archive")
+
+    with pytest.raises(RuntimeError, match="Checksum mismatch"):
+        fetch_model("pl", manifest_entry(served), base_url, models_dir)
+    assert not Path(models_dir, "pl.zip.part").exists()
+    # The next attempt downloads the archive from the start
+    assert fetch_model("pl", manifest_entry(served), base_url, models_dir)
+    assert_installed(models_dir / "pl")
+
+
+def test_a_modified_file_is_not_up_to_date(storage, tmp_path):
+    served, base_url = storage
+    models_dir = tmp_path / "models"
+    entry = manifest_entry(served)
+    fetch_model("pl", entry, base_url, models_dir)
+    assert is_up_to_date(models_dir / "pl", entry)
+
+    # Same size, other contents
+    model_file = Path(models_dir, "pl", "model-best/ner/model")
+    model_file.write_bytes(bytes(reversed(MODEL_FILES["model-best/ner/model"])))
+    assert not is_up_to_date(models_dir / "pl", entry)
+    assert fetch_model("pl", entry, base_url, models_dir)
+    assert_installed(models_dir / "pl")
@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+spacy = pytest.importorskip("spacy")
+pytest.importorskip("spacy_transformers")
+
+from spacy.training import Example  # noqa: E402
+
+from utils.model_packer import TRANSFORMER_PIPE, load_packed_model, pack_model  # noqa: E402
+
+WORDS = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "jan", "kowalski", "mieszka", "w", "warszawie", "anna",
+         "nowak", "pracuje", "krakowie", "i", "lubi", "."]
+TRAIN_DATA = [
+    ("jan kowalski mieszka w warszawie .", [(0, 12, "PER"), (23, 32, "LOC")]),
+    ("anna nowak pracuje w krakowie .", [(0, 10, "PER"), (21, 29, "LOC")]),
+    ("jan lubi krakowie i warszawie .", [(0, 3, "PER"), (9, 17, "LOC"), (20, 29, "LOC")]),
+]
+
+
+@pytest.fixture(scope="module")
+def model_path(tmp_path_factory):
+    """A small trained transformer and NER pipeline, with a randomly initialized BERT of a few hundred parameters."""
+    root = tmp_path_factory.mktemp("packer")
+    bert_path = root / "bert"
+    bert_path.mkdir()
+    (bert_path / "vocab.txt").write_text("\n".join(WORDS) + "\n", encoding="utf-8")
+    transformers.BertTokenizerFast(str(bert_path / "vocab.txt")).save_pretrained(bert_path)
+    bert_config = transformers.BertConfig(vocab_size=len(WORDS), hidden_size=16, num_hidden_layers=1,
+                                          num_attention_heads=2, intermediate_size=32, max_position_embeddings=64)
+    torch.manual_seed(0)
+    transformers.BertModel(bert_config).save_pretrained(bert_path)
+
+    random.seed(0)
+    spacy.util.fix_random_seed(0)
+    nlp = spacy.blank("pl")
+    nlp.add_pipe(TRANSFORMER_PIPE, config={"model": {"name": str(bert_path)}})
+    nlp.add_pipe("ner", config={"model": {
+        "@architectures": "spacy.TransitionBasedParser.v2",
+        "state_type": "ner",
+        "extra_state_tokens": False,
+        "hidden_width": 16,
+        "maxout_pieces": 2,
+        "use_upper": False,
+        "tok2vec": {
+            "@architectures": "spacy-transformers.TransformerListener.v1",
+            "grad_factor": 1.0,
+            "pooling": {"@layers": "reduce_mean.v1"},
+        },
+    }})
+    examples = [Example.from_dict(nlp.make_doc(text), {"entities": entities}) for text, entities in TRAIN_DATA]
+    optimizer = nlp.initialize(lambda: examples)
+    for _ in range(30):
+        nlp.update(examples, sgd=optimizer)
+
+    nlp.to_disk(root / "model-best")
+    return root / "model-best"
+
+
+def test_packed_model_predicts_the_same_entities(model_path):
+    nlp = spacy.load(model_path)
+    packed_nlp = load_packed_model(pack_model(model_path))
+
+    texts = [text for text, _ in TRAIN_DATA] + ["anna mieszka w warszawie i lubi jan ."]
+    docs, packed_docs = list(nlp.pipe(texts)), list(packed_nlp.pipe(texts))
+    assert any(doc.ents for doc in docs)
+    for doc, packed_doc in zip(docs, packed_docs):
+        assert [(ent.start_char, ent.end_char, ent.label_) for ent in packed_doc.ents] == \
+               [(ent.start_char, ent.end_char, ent.label_) for ent in doc.ents]
+        assert packed_doc._.trf_data.model_output.last_hidden_state.tolist() == \
+               doc._.trf_data.model_output.last_hidden_state.tolist()
+
+
+def test_packed_transformer_weights_are_assigned_from_the_file(model_path):
+    packed_nlp = load_packed_model(pack_model(model_path))
+    hf_model = packed_nlp.get_pipe(TRANSFORMER_PIPE).model.transformer
+    weights = hf_model.state_dict()
+    unpacked_weights = spacy.load(model_path).get_pipe(TRANSFORMER_PIPE).model.transformer.state_dict()
+
+    assert not any(tensor.is_meta for tensor in weights.values())
+    assert weights.keys() == unpacked_weights.keys()
+    for name, tensor in weights.items():
+        assert torch.equal(tensor, unpacked_weights[name]), name
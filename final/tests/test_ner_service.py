@@ -0,0 +1,75 @@
+import http.client
+import json
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip("spacy")
+
+from ner_service import NERRequestHandler, NERServer  # noqa: E402
+
+
+class EchoBatcher:
+    """Tags every text as one entity spanning it, without a model."""
+
+    def submit(self, texts):
+        future = Future()
+        future.set_result([([{"start": 0, "end": len(text), "label": "MISC", "text": text}], 1) for text in texts])
+        return future
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(NERRequestHandler, "batchers", {"pl": EchoBatcher()})
+    server = NERServer(("127.0.0.1", 0), NERRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address
+    server.shutdown()
+    server.server_close()
+
+
+def post(address, body, headers=None):
+    connection = http.client.HTTPConnection(*address, timeout=10)
+    body = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+    connection.request("POST", "/ner", body=body, headers={"Content-Length": str(len(body)), **(headers or {})})
+    response = connection.getresponse()
+    status, payload = response.status, json.loads(response.read())
+    connection.close()
+    return status, payload
+
+
+def test_tags_a_text_and_a_list_of_texts(service):
+    status, payload = post(service, {"language": "pl", "text": "Warszawa"})
+    assert status == 200
+    assert payload["entities"][0]["text"] == "Warszawa" and payload["tokens"] == 1
+
+    status, payload = post(service, {"language": "pl", "texts": ["Jan", "Kraków"]})
+    assert status == 200
+    assert [entities[0]["text"] for entities in payload["entities"]] == ["Jan", "Kraków"]
+
+
+@pytest.mark.parametrize("request_body", [
+    {"language": ["pl"], "text": "Warszawa"},
+    {"language": {"pl": 1}, "text": "Warszawa"},
+    {"language": "pl", "text": 1},
+    {"language": "pl", "texts": "Warszawa"},
+    {"text": "Warszawa"},
+    ["pl", "Warszawa"],
+    b"{",
+])
+def test_rejects_malformed_requests(service, request_body):
+    status, payload = post(service, request_body)
+    assert status == 400
+    assert payload["error"].startswith("Invalid request")
+
+
+def test_rejects_a_negative_content_length(service):
+    status, payload = post(service, b"", headers={"Content-Length": "-1"})
+    assert status == 400
+
+
+def test_rejects_an_unknown_language(service):
+    status, _ = post(service, {"language": "xx", "text": "Warszawa"})
+    assert status == 404
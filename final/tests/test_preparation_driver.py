@@ -0,0 +1,100 @@
+import json
+import os
+
+import pytest
+
+datasets = pytest.importorskip("datasets")
+
+from preparation_driver import MANIFEST_FILE, SEGMENTS_SUFFIX, plan_shards, run_units  # noqa: E402
+
+converted = []
+
+
+def write_rows(rows, output_file, language, suffix=''):
+    converted.append(os.path.basename(output_file))
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write(''.join(f"{text}{suffix}\n" for text in rows['text']))
+
+
+@pytest.fixture
+def dataset():
+    return datasets.Dataset.from_dict({'text': [f"row {i}" for i in range(10)]})
+
+
+def plan(dataset, tmp_path):
+    units = plan_shards(dataset, 'pl', 'train', str(tmp_path / 'train.parts'), 'train', 3, suffix='.txt')
+    merges = {str(tmp_path / 'train.txt'): [unit.output_file for unit in units]}
+    return units, merges
+
+
+def run(units, dataset, merges, **kwargs):
+    converted.clear()
+    run_units(units, {('pl', 'train'): dataset}, write_rows, merges=merges, **kwargs)
+    return sorted(converted)
+
+
+def test_merged_shards_are_deleted_and_reused(dataset, tmp_path):
+    units, merges = plan(dataset, tmp_path)
+    assert run(units, dataset, merges) == ['train1.txt', 'train2.txt', 'train3.txt', 'train4.txt']
+    expected = ''.join(f"row {i}\n" for i in range(10))
+    assert (tmp_path / 'train.txt').read_text(encoding='utf-8') == expected
+    assert os.listdir(tmp_path / 'train.parts') == [MANIFEST_FILE]
+
+    units, merges = plan(dataset, tmp_path)
+    assert run(units, dataset, merges) == []
+    assert (tmp_path / 'train.txt').read_text(encoding='utf-8') == expected
+    assert os.listdir(tmp_path / 'train.parts') == [MANIFEST_FILE]
+
+
+def test_only_changed_shards_are_converted(dataset, tmp_path):
+    units, merges = plan(dataset, tmp_path)
+    run(units, dataset, merges)
+
+    units, merges = plan(dataset, tmp_path)
+    units[2].key = 'changed'
+    assert run(units, dataset, merges, suffix='!') == ['train3.txt']
+    lines = [f"row {i}!" if i in (6, 7, 8) else f"row {i}" for i in range(10)]
+    assert (tmp_path / 'train.txt').read_text(encoding='utf-8') == ''.join(f"{line}\n" for line in lines)
+    segments = json.loads((tmp_path / f'train.txt{SEGMENTS_SUFFIX}').read_text(encoding='utf-8'))['segments']
+    assert [segment['key'] for segment in segments] == [unit.key for unit in units]
+
+
+def test_a_modified_merged_file_is_converted_again(dataset, tmp_path):
+    units, merges = plan(dataset, tmp_path)
+    run(units, dataset, merges)
+    (tmp_path / 'train.txt').write_text("edited\n", encoding='utf-8')
+
+    units, merges = plan(dataset, tmp_path)
+    assert run(units, dataset, merges) == ['train1.txt', 'train2.txt', 'train3.txt', 'train4.txt']
+    assert (tmp_path / 'train.txt').read_text(encoding='utf-8') == ''.join(f"row {i}\n" for i in range(10))
+
+
+def write_rows_and_upper(rows, output_file, language, outputs=None):
+    """Writes the rows to output_file and in upper case to the further outputs of the shard."""
+    outputs = outputs or (output_file,)
+    converted.append(sorted(os.path.basename(path) for path in outputs))
+    for path in outputs:
+        with open(path, 'w', encoding='utf-8') as f:
+            text = ''.join(f"{text}\n" for text in rows['text'])
+            f.write(text.upper() if path != output_file else text)
+
+
+def test_an_added_output_is_written_without_the_others(dataset, tmp_path):
+    units = plan_shards(dataset, 'pl', 'train', str(tmp_path / 'train'), 'train', 5, suffix='.txt')
+    converted.clear()
+    run_units(units, {('pl', 'train'): dataset}, write_rows_and_upper)
+    assert sorted(converted) == [['train1.txt'], ['train2.txt']]
+
+    units = plan_shards(dataset, 'pl', 'train', str(tmp_path / 'train'), 'train', 5, suffix='.txt')
+    for unit in units:
+        unit.extra_outputs = (str(tmp_path / 'upper' / os.path.basename(unit.output_file).replace('train', 'upper')),)
+        unit.extra_keys = (f'{unit.key}-upper',)
+    merges = {str(tmp_path / 'upper.txt'): [unit.extra_outputs[0] for unit in units]}
+    converted.clear()
+    run_units(units, {('pl', 'train'): dataset}, write_rows_and_upper, merges=merges)
+    assert sorted(converted) == [['upper1.txt'], ['upper2.txt']]
+    assert (tmp_path / 'upper.txt').read_text(encoding='utf-8') == ''.join(f"ROW {i}\n" for i in range(10))
+
+    converted.clear()
+    run_units(units, {('pl', 'train'): dataset}, write_rows_and_upper, merges=merges)
+    assert converted == []
@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+
+from qid_index import QidIndex, is_up_to_date, label_anchors, open_index, qids_to_array, read_qids
+
+
+def write_lists(directory, lists):
+    sources = {}
+    for label, lines in lists.items():
+        path = directory / f"{label}-ND.txt"
+        path.write_text("".join(f"{line}\n" for line in lines))
+        sources[label] = [str(path)]
+    return sources
+
+
+def test_qids_to_array_maps_missing_and_malformed_qids_to_minus_one():
+    qids = qids_to_array([5, "Q7", "8", " Q9 ", None, "", "Q", "Qabc", "P31", "1.5", "-3", "²"])
+    assert qids.tolist() == [5, 7, 8, 9, -1, -1, -1, -1, -1, -1, -1, -1]
+
+
+def test_read_qids_skips_malformed_lines(tmp_path):
+    path = tmp_path / "PER-ND.txt"
+    path.write_text("Q3\n\n1\nqid\nQ2 Q4\nQ3\nP17\n")
+    assert read_qids(path).tolist() == [1, 3]
+
+
+def test_unparsable_qids_fall_back_to_the_unknown_label(tmp_path):
+    sources = write_lists(tmp_path, {"LOC": ["Q1"], "PER": ["Q2"], "ORG": ["Q3"]})
+    index = open_index(tmp_path / "index", sources)
+    batch = [[{"qid": "Q1", "start": 0, "end": 1}, {"qid": "", "start": 2, "end": 3},
+              {"qid": "Qx", "start": 4, "end": 5}, {"qid": None, "start": 6, "end": 7}]]
+    assert [entity["label"] for entity in label_anchors(batch, "MISC", index)[0]] == ["LOC", "MISC", "MISC", "MISC"]
+
+
+def test_index_is_rebuilt_when_a_list_changes(tmp_path):
+    sources = write_lists(tmp_path, {"LOC": ["Q1", "Q2"], "PER": ["Q2", "Q5"], "ORG": ["Q7"]})
+    index_dir = tmp_path / "index"
+    index = open_index(index_dir, sources)
+    assert index.labels(np.array([1, 2, 5, 7, 9])) == ["LOC", "LOC", "PER", "ORG", None]
+    assert is_up_to_date(index_dir, sources)
+
+    # Touching a list without changing it keeps the index
+    os.utime(sources["ORG"][0], ns=(0, 0))
+    assert is_up_to_date(index_dir, sources)
+    assert open_index(index_dir, sources).version == index.version
+
+    with open(sources["ORG"][0], "a") as f:
+        f.write("Q9\n")
+    assert not is_up_to_date(index_dir, sources)
+    rebuilt = open_index(index_dir, sources)
+    assert rebuilt.version != index.version
+    assert rebuilt.labels(np.array([9])) == ["ORG"]
+    assert QidIndex(index_dir).version == rebuilt.version
+    assert is_up_to_date(index_dir, sources)
+
+
+def test_index_built_from_other_lists_is_not_up_to_date(tmp_path):
+    sources = write_lists(tmp_path, {"LOC": ["Q1"], "PER": ["Q2"], "ORG": ["Q3"]})
+    open_index(tmp_path / "index", sources)
+    assert not is_up_to_date(tmp_path / "index", {**sources, "ORG": []})
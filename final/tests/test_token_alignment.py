@@ -0,0 +1,33 @@
+import random
+
+import pytest
+
+from token_alignment import align_entity_offsets_batch, align_entity_offsets_to_tokens, align_predictions_batch, \
+    align_predictions_to_tokens
+from token_alignment_reference import build_tner_sentences, build_xlmr_sentences, reference_align_labels, \
+    reference_align_predictions_to_tokens
+
+
+@pytest.fixture
+def rng():
+    return random.Random(0)
+
+
+def test_predictions_match_the_previous_tner_alignment(rng):
+    for tokens, pred_input, ent_spans in zip(*build_tner_sentences(3000, 30, 8, rng)):
+        assert align_predictions_to_tokens(tokens, pred_input, ent_spans) == \
+            reference_align_predictions_to_tokens(tokens, pred_input, ent_spans), (tokens, pred_input, ent_spans)
+
+
+def test_entity_offsets_match_the_previous_xlmr_alignment(rng):
+    for tokens, entities, sentence in zip(*build_xlmr_sentences(3000, 30, 8, rng)):
+        assert align_entity_offsets_to_tokens(tokens, entities, sentence) == \
+            reference_align_labels(tokens, entities, sentence), (tokens, entities, sentence)
+
+
+def test_batches_of_long_sentences_match_the_previous_alignments(rng):
+    batch = build_tner_sentences(10, 500, 80, rng)
+    assert align_predictions_batch(*batch) == [reference_align_predictions_to_tokens(*sentence)
+                                               for sentence in zip(*batch)]
+    batch = build_xlmr_sentences(10, 500, 80, rng)
+    assert align_entity_offsets_batch(*batch) == [reference_align_labels(*sentence) for sentence in zip(*batch)]
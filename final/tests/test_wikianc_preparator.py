@@ -0,0 +1,62 @@
+import pytest
+
+datasets = pytest.importorskip("datasets")
+pytest.importorskip("spacy")
+
+from spacy.tokens import DocBin  # noqa: E402
+
+import qid_index  # noqa: E402
+from preparation_driver import blank_model, run_units  # noqa: E402
+from wikianc_data_preparator_for_spacy import plan_spacy_files, tokenize_and_tag, write_doc_bin_shard  # noqa: E402
+
+TEXT = "Jan Kowalski mieszka w Warszawie nad Wisłą"
+ANCHORS = [
+    {"start": 0, "end": 12, "qid": 1},
+    {"start": 23, "end": 32, "qid": 2},
+    {"start": 37, "end": 42, "qid": 3},
+]
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    """Builds the QID lists in the working directory and a dataset of every split with copies of one paragraph."""
+    monkeypatch.chdir(tmp_path)
+    for name, qids in {'PER-ND.txt': ['Q1'], 'PER-FI.txt': [], 'LOC-ND.txt': ['Q2'], 'ORG-ND.txt': []}.items():
+        (tmp_path / name).write_text(''.join(f"{qid}\n" for qid in qids))
+    qid_index.get_qid_index.cache_clear()
+    yield datasets.DatasetDict({
+        split: datasets.Dataset.from_dict({'paragraph_text': [TEXT] * rows, 'paragraph_anchors': [ANCHORS] * rows})
+        for split, rows in (('train', 7), ('test', 3), ('validation', 2))
+    })
+    qid_index.get_qid_index.cache_clear()
+
+
+def test_all_formats_are_written_in_one_pass(source, tmp_path):
+    formats = ['conll', 'jsonl', 'xlmr']
+    units, split_datasets, merges = plan_spacy_files(source, 'pl', seed=1, chunk_size=5, formats=formats)
+    calls = []
+
+    def convert(rows, output_file, **kwargs):
+        calls.append(output_file)
+        return write_doc_bin_shard(rows, output_file, **kwargs)
+
+    run_units(units, split_datasets, convert, merges=merges, formats=formats)
+    assert len(calls) == len(units) == 4
+
+    # The DocBin shards leave out the anchor of the unknown QID, the XLM-R files tag it as MISC
+    docs = list(DocBin().from_disk(units[0].output_file).get_docs(blank_model('pl').vocab))
+    assert [(ent.text, ent.label_) for ent in docs[0].ents] == [("Jan Kowalski", "PER"), ("Warszawie", "LOC")]
+    language_dir = tmp_path / 'datasets' / 'wikianc' / 'pl'
+    block = ''.join(f"{token} {label}\n" for token, label in tokenize_and_tag(TEXT, [
+        {"start": 0, "end": 12, "label": "PER"}, {"start": 23, "end": 32, "label": "LOC"},
+        {"start": 37, "end": 42, "label": "MISC"},
+    ])) + "\n"
+    assert "Wisłą B-MISC\n" in block
+    for name, rows in (('train', 7), ('dev', 3), ('validation', 2)):
+        assert (language_dir / 'xlmr' / f'{name}.txt').read_text(encoding='utf-8') == block * rows
+    assert (language_dir / 'conll' / 'test.txt').read_text(encoding='utf-8').count("B-PER") == 2
+    assert (language_dir / 'jsonl' / 'train.jsonl').read_text(encoding='utf-8').count('"MISC"') == 0
+
+    calls.clear()
+    run_units(units, split_datasets, convert, merges=merges, formats=formats)
+    assert calls == []
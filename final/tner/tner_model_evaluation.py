@@ -4,55 +4,54 @@ NER Model Evaluation Script
 
 Evaluate a Hugging Face **TNER** checkpoint on an NER dataset and print precision, recall, and F1.
 
+With `--store`, the predictions are kept in the prediction store of the spaCy scripts, the model is not run again on
+the same test set, and ../spacy/rescore_predictions.py computes the metrics again without running it.
+
 Example:
     python ner_evaluate.py --model models/cs --dataset wnut_17 --split test
+    python tner_model_evaluation.py --model models/cs --language cs --store predictions
 """
 
 import argparse
-from typing import List, Tuple
+import sys
+import time
+from pathlib import Path
 
 from tner import TransformersNER, get_dataset
 from datasets import load_dataset
 from seqeval.metrics import classification_report, precision_score, recall_score, f1_score
 
-_PREFIXES: Tuple[str, ...] = ("Ġ", "▁", "##")
+# The alignment and the prediction store are shared with the spaCy and XLM-R evaluators
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'spacy'))
+from prediction_store import PredictionStore, data_hash, entry_labels, round_scores
+
 LABEL_LIST = ['B-LOC', 'B-ORG', 'B-PER', 'I-LOC', 'I-ORG', 'I-PER', 'O' ]
 
 
-def _clean(tok: str) -> str:
-    """Strip common sub‑word prefixes."""
-    while tok and tok.startswith(_PREFIXES):
-        tok = tok[1:]
-    return tok
-
-
-def align_predictions_to_tokens(tokens: List[str], pred_input: List[str], ent_spans):
-    """Map span‑level entity predictions to token‑level IOB2 labels."""
-    mapping, j = [], 0
-    for tok in tokens:
-        while j < len(pred_input) and _clean(pred_input[j]).lower() != tok.lower():
-            j += 1
-        mapping.append(j)
-        j += 1
-    labels = ["O"] * len(tokens)
-    for pos_list, label in ent_spans:
-        if not pos_list:
-            continue
-        start_tok_idx = next((idx for idx, mp in enumerate(mapping) if mp == pos_list[0]), None)
-        end_tok_idx = next((idx for idx, mp in enumerate(mapping) if mp == pos_list[-1]), start_tok_idx)
-        if start_tok_idx is None:
-            continue
-        labels[start_tok_idx] = f"B-{label}"
-        for i in range(start_tok_idx + 1, (end_tok_idx or start_tok_idx) + 1):
-            labels[i] = f"I-{label}"
-    return labels
-
-
-def evaluate_model(model_name: str, language: str) -> None:
-    """Run evaluation and print a seqeval report."""
+def predict(model_name: str, ds_test_tokens, gold_labels) -> dict:
+    """Run the model on the test set and return its predictions as an entry of the prediction store."""
     print(f"Loading model: {model_name} …")
     model = TransformersNER(model_name)
 
+    sentences = []
+    start = time.perf_counter()
+    for tokens, gold in zip(ds_test_tokens, gold_labels):
+        sent = " ".join(tokens)
+
+        outputs = model.predict([sent])
+        sentences.append({
+            "tokens": tokens,
+            "tags": gold,
+            "input": outputs["input"][0],
+            "probability": round_scores(outputs.get("probability", [None])[0]),
+            "entities": [[ent["position"], ent["type"], round_scores(ent.get("probability"))]
+                         for ent in outputs["entity_prediction"][0]],
+        })
+    return {"kind": "tner", "seconds": time.perf_counter() - start, "sentences": sentences}
+
+
+def evaluate_model(model_name: str, language: str, store_dir: str = None) -> None:
+    """Run evaluation and print a seqeval report."""
     data_files = {
         "train": f"datasets/wikiann/{language}/train.txt",
         "validation": f"datasets/wikiann/{language}/dev.txt",
@@ -67,21 +66,23 @@ def evaluate_model(model_name: str, language: str) -> None:
     if len(ds_test_tokens) != len(ds_test_tags):
         raise ValueError(f"Number of tokens ({len(ds_test_tokens)}) does not match number of tags ({len(ds_test_tags)})")
 
-    true_labels, pred_labels = [], []
-    for i in range(0, len(ds_test_tokens)):
-        tokens = ds_test_tokens[i]
-        tags = ds_test_tags[i]
+    gold_labels = [[LABEL_LIST[i] for i in tags] for tags in ds_test_tags]
 
-        gold = [LABEL_LIST[i] for i in tags]
-        sent = " ".join(tokens)
-
-        outputs = model.predict([sent])
-        pred_input = outputs["input"][0]
-        ent_pred = [(ent["position"], ent["type"]) for ent in outputs["entity_prediction"][0]]
+    if store_dir:
+        store = PredictionStore(store_dir)
+        model_hash = store.model_hash(model_name)
+        shard_hash = data_hash(ds_test_tokens, gold_labels)
+        entry = store.load(model_hash, shard_hash)
+        if entry is None:
+            prediction = predict(model_name, ds_test_tokens, gold_labels)
+            entry = store.save("tner", model_name, model_hash, language, data_files["test"], shard_hash,
+                               prediction["sentences"], prediction["seconds"])
+        else:
+            print(f"Using the predictions of {model_name} stored on {entry['created']}")
+    else:
+        entry = predict(model_name, ds_test_tokens, gold_labels)
 
-        pred = align_predictions_to_tokens(tokens, pred_input, ent_pred)
-        true_labels.append(gold)
-        pred_labels.append(pred)
+    true_labels, pred_labels = entry_labels(entry)
 
     print(classification_report(true_labels, pred_labels, digits=4))
     print(f"Precision : {precision_score(true_labels, pred_labels):.4f}")
@@ -94,8 +95,9 @@ def main() -> None:
     parser = argparse.ArgumentParser(description="Evaluate a TNER model on an HF dataset")
     parser.add_argument("--model", default="tner/roberta-large-wnut2017", help="Model name or local path")
     parser.add_argument("--language", help="Language")
+    parser.add_argument("--store", help="Directory of the prediction store")
     args = parser.parse_args()
-    evaluate_model(args.model, args.language)
+    evaluate_model(args.model, args.language, args.store)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,155 @@
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import streamlit as st
+from spacy.tokens import Doc
+
+from utils.model_loader import INFERENCE_WORKERS, estimate_model_size, load_spacy_model
+from utils.model_registry import MODEL_BUDGET_MB, ModelRegistry
+
+# Restricts languages to some of the workers, e.g. "pl:0,1;ru:2". Languages without a route use all workers.
+INFERENCE_ROUTES = os.environ.get("NER_INFERENCE_ROUTES", "")
+INFERENCE_THREADS_PER_WORKER = int(os.environ.get("NER_INFERENCE_THREADS_PER_WORKER", 1))
+
+# Only the annotations are needed to render the results, the transformer output is dropped.
+DOC_EXCLUDE = ["tensor", "user_data"]
+
+# Pipelines loaded inside a worker process
+_worker_models = None
+
+
+def _init_worker(threads, budget_bytes):
+    global _worker_models
+    _worker_models = ModelRegistry(load_spacy_model, budget_bytes=budget_bytes, size_estimator=estimate_model_size)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def _tag_in_worker(language, texts, batch_size):
+    model = _worker_models.get(language)
+    return [doc.to_bytes(exclude=DOC_EXCLUDE) for doc in model.pipe(texts, batch_size=batch_size)]
+
+
+def parse_routes(routes):
+    """
+    Parses a routing specification of the form "pl:0,1;ru:2".
+
+    :param routes: The routing specification.
+    :return: A dictionary of worker indices by language.
+    """
+    parsed = {}
+    for route in filter(None, (r.strip() for r in routes.split(";"))):
+        language, _, workers = route.partition(":")
+        parsed[language.strip()] = [int(w) for w in workers.split(",") if w.strip()]
+    return parsed
+
+
+class InferenceExecutor:
+    """
+    Runs the NER pipelines in worker processes, so that concurrent sessions do not serialize on one interpreter.
+
+    Every worker is a single-process pool that keeps the pipelines of the languages routed to it loaded. A batch
+    is submitted to the least busy worker among the ones serving its language. The memory budget of the models is
+    the budget of all workers together, every worker gets an equal share of it.
+    """
+
+    def __init__(self, workers, routes=None, threads_per_worker=INFERENCE_THREADS_PER_WORKER,
+                 budget_bytes=MODEL_BUDGET_MB * 1024 * 1024):
+        context = multiprocessing.get_context("spawn")
+        self._workers = [
+            ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_init_worker,
+                                initargs=(threads_per_worker, budget_bytes // workers))
+            for _ in range(workers)
+        ]
+        self._pending = [0] * workers
+        self._routes = routes or {}
+        self._lock = threading.Lock()
+
+    @property
+    def workers(self):
+        return len(self._workers)
+
+    def _workers_for(self, language):
+        route = self._routes.get(language)
+        if not route:
+            return range(len(self._workers))
+        return [i % len(self._workers) for i in route]
+
+    def _done(self, index):
+        with self._lock:
+            self._pending[index] -= 1
+
+    def submit(self, language, texts, batch_size=16):
+        """
+        Submits texts to a worker serving the language.
+
+        :return: A future of the serialized docs.
+        """
+        with self._lock:
+            index = min(self._workers_for(language), key=lambda i: self._pending[i])
+            self._pending[index] += 1
+        future = self._workers[index].submit(_tag_in_worker, language, list(texts), batch_size)
+        future.add_done_callback(lambda _: self._done(index))
+        return future
+
+    def warm_up(self, language, texts):
+        """Runs the texts through every worker serving the language, so that each has the pipeline loaded."""
+        futures = [self._workers[i].submit(_tag_in_worker, language, list(texts), len(texts))
+                   for i in set(self._workers_for(language))]
+        for future in futures:
+            future.result()
+
+    def tag(self, language, texts, vocab, batch_size=16):
+        docs_bytes = self.submit(language, texts, batch_size).result()
+        return [Doc(vocab).from_bytes(data) for data in docs_bytes]
+
+    def shutdown(self):
+        for worker in self._workers:
+            worker.shutdown(cancel_futures=True)
+
+
+@st.cache_resource
+def get_inference_executor():
+    if INFERENCE_WORKERS <= 0:
+        return None
+    print(f"Starting {INFERENCE_WORKERS} inference workers...", flush=True)
+    return InferenceExecutor(INFERENCE_WORKERS, parse_routes(INFERENCE_ROUTES))
+
+
+def pipe(language, model, texts, batch_size=16):
+    """
+    Tags the texts with the language pipeline, in the inference workers if they are enabled.
+
+    :param language: The language of the model.
+    :param model: The loaded SpaCy pipeline, used directly when there are no workers.
+    :param texts: An iterable of texts.
+    :param batch_size: The number of texts in one batch.
+    :return: A generator of tagged docs in the order of the texts.
+    """
+    executor = get_inference_executor()
+    if executor is None:
+        yield from model.pipe(texts, batch_size=batch_size)
+        return
+
+    # Keep every worker busy while holding only a bounded number of batches in flight
+    in_flight = deque()
+    batch = []
+    for text in texts:
+        batch.append(text)
+        if len(batch) == batch_size:
+            in_flight.append(executor.submit(language, batch, batch_size))
+            batch = []
+            if len(in_flight) >= 2 * executor.workers:
+                for data in in_flight.popleft().result():
+                    yield Doc(model.vocab).from_bytes(data)
+    if batch:
+        in_flight.append(executor.submit(language, batch, batch_size))
+    while in_flight:
+        for data in in_flight.popleft().result():
+            yield Doc(model.vocab).from_bytes(data)
@@ -0,0 +1 @@
+AVAILABLE_LANGUAGES = ["be", "bg", "cs", "hr", "mk", "pl", "ru", "sk", "sl", "sr", "uk"]
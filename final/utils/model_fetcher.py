@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+"""
+Model fetcher
+
+Downloads zipped models from NER_MODELS_BASE_URL, which serves a `manifest.json` of the form
+
+    {"pl": {"path": "wikiann/pl.zip", "sha256": "...", "size": 123,
+            "files": {"model-best/config.cfg": {"sha256": "...", "size": 45}, ...}}, ...}
+
+Downloads resume from a `.part` file and are verified against the manifest before any member is extracted, the members
+are then streamed from the archive into the model directory and the archive is removed. A language is skipped when its
+directory already holds the files of the manifest entry, with the hashes the manifest lists for them.
+
+Examples:
+    python -m utils.model_fetcher --languages pl ru --workers 4
+    python -m utils.model_fetcher --build-manifest zips/
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urljoin
+
+import requests
+
+MODELS_BASE_URL = os.environ.get("NER_MODELS_BASE_URL", "")
+MANIFEST_FILE = "manifest.json"
+STAMP_FILE = ".manifest.json"
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def fetch_manifest(base_url):
+    response = requests.get(urljoin(base_url, MANIFEST_FILE), timeout=30)
+    response.raise_for_status()
+    return response.json()
+
+
+def _file_stat(path):
+    stat = path.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def is_up_to_date(dest_dir, entry):
+    """
+    Checks that the directory was installed from the same archive and still holds all of its files.
+
+    The stamp written after extraction records the hash, size and modification time of every file. A file whose size
+    and modification time still match the stamp is trusted to have the recorded hash, any other file is hashed again.
+    """
+    stamp_path = Path(dest_dir, STAMP_FILE)
+    if not stamp_path.exists():
+        return False
+    with open(stamp_path, "r", encoding="utf-8") as f:
+        stamp = json.load(f)
+    if stamp.get("sha256") != entry["sha256"]:
+        return False
+
+    stamped_files = stamp.get("files", {})
+    for name, info in entry.get("files", {}).items():
+        path = Path(dest_dir, name)
+        if not path.is_file():
+            return False
+        stamped = stamped_files.get(name, {})
+        if stamped.get("sha256") != info["sha256"]:
+            return False
+        if {key: stamped.get(key) for key in ("size", "mtime_ns")} != _file_stat(path) \
+                and file_sha256(path) != info["sha256"]:
+            return False
+    return True
+
+
+def write_stamp(dest_dir, entry):
+    """Records the archive of the directory and the hash, size and modification time of its files."""
+    files = {
+        name: {"sha256": info["sha256"], **_file_stat(Path(dest_dir, name))}
+        for name, info in entry.get("files", {}).items()
+    }
+    with open(Path(dest_dir, STAMP_FILE), "w", encoding="utf-8") as f:
+        json.dump({"path": entry["path"], "sha256": entry["sha256"], "files": files}, f)
+
+
+def download(url, output, expected_sha256):
+    """
+    Downloads a file, resuming from a partial download if there is one, and verifies its hash.
+
+    :param url: The URL to download.
+    :param output: The file to write.
+    :param expected_sha256: The expected hex digest of the file.
+    """
+    part = Path(f"{output}.part")
+    sha256 = hashlib.sha256()
+    offset = 0
+    if part.exists():
+        with open(part, "rb") as f:
+            for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+                sha256.update(block)
+                offset += len(block)
+
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    with requests.get(url, headers=headers, stream=True, timeout=60) as response:
+        if response.status_code == 416:
+            # The partial file is already complete
+            pass
+        else:
+            response.raise_for_status()
+            if offset and response.status_code != 206:
+                print(f"Server does not support resuming {url}, downloading from the start.", flush=True)
+                sha256 = hashlib.sha256()
+                offset = 0
+            with open(part, "ab" if offset else "wb") as f:
+                for block in response.iter_content(CHUNK_SIZE):
+                    f.write(block)
+                    sha256.update(block)
+
+    if sha256.hexdigest() != expected_sha256:
+        part.unlink()
+        raise RuntimeError(f"Checksum mismatch for {url}: expected {expected_sha256}, got {sha256.hexdigest()}.")
+    part.replace(output)
+
+
+def extract(zip_path, dest_dir, entry):
+    """Streams the zip members into the directory, verifying them against the manifest entry."""
+    dest_dir = Path(dest_dir).resolve()
+    files = entry.get("files", {})
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        for member in zip_ref.infolist():
+            target = (dest_dir / member.filename).resolve()
+            if dest_dir not in target.parents and target != dest_dir:
+                raise RuntimeError(f"Zip member {member.filename} is outside of {dest_dir}.")
+            if member.is_dir():
+                target.mkdir(parents=True, exist_ok=True)
+                continue
+
+            target.parent.mkdir(parents=True, exist_ok=True)
+            sha256 = hashlib.sha256()
+            with zip_ref.open(member) as src, open(target, "wb") as dst:
+                for block in iter(lambda: src.read(CHUNK_SIZE), b""):
+                    dst.write(block)
+                    sha256.update(block)
+
+            expected = files.get(member.filename, {}).get("sha256")
+            if expected is not None and sha256.hexdigest() != expected:
+                raise RuntimeError(f"Checksum mismatch for {member.filename} in {zip_path}.")
+
+
+def fetch_model(language, entry, base_url, models_dir):
+    """
+    Fetches the model of one language unless the local copy already matches the manifest entry.
+
+    :return: True if the model was downloaded, False if it was up to date.
+    """
+    dest_dir = Path(models_dir, language)
+    if is_up_to_date(dest_dir, entry):
+        print(f"Model for {language} is up to date.", flush=True)
+        return False
+
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    Path(dest_dir, STAMP_FILE).unlink(missing_ok=True)
+    # A zip is indexed by its central directory at the end of the file, so its members cannot be extracted while it
+    # downloads. It is kept whole on disk, which also lets a download resume and be verified before extraction.
+    zip_path = Path(models_dir, f"{language}.zip")
+
+    print(f"Downloading model for {language}...", flush=True)
+    download(urljoin(base_url, entry["path"]), zip_path, entry["sha256"])
+    print(f"Extracting {zip_path}...", flush=True)
+    extract(zip_path, dest_dir, entry)
+    os.remove(zip_path)
+
+    write_stamp(dest_dir, entry)
+    print(f"Done! Files are in '{dest_dir}'.", flush=True)
+    return True
+
+
+def fetch_models(languages, models_dir, base_url=MODELS_BASE_URL, workers=4):
+    """
+    Fetches the models of several languages concurrently.
+
+    :param languages: The languages to fetch.
+    :param models_dir: The directory holding one model directory per language.
+    :param base_url: The URL serving the manifest and the zip files.
+    :param workers: The number of concurrent downloads.
+    :return: A dictionary of whether each language was downloaded.
+    """
+    if not base_url:
+        raise RuntimeError("No base URL to fetch the models from, set NER_MODELS_BASE_URL.")
+    base_url = base_url if base_url.endswith("/") else f"{base_url}/"
+    manifest = fetch_manifest(base_url)
+
+    missing = [language for language in languages if language not in manifest]
+    if missing:
+        raise ValueError(f"Languages {missing} are not in the manifest.")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        downloaded = executor.map(lambda l: fetch_model(l, manifest[l], base_url, models_dir), languages)
+        return dict(zip(languages, downloaded))
+
+
+def build_manifest(zip_dir, prefix=""):
+    """
+    Writes the manifest of the `<language>.zip` files of a directory, e.g. to serve them from a local HTTP server.
+
+    :param zip_dir: The directory with the zip files.
+    :param prefix: The path of the zip files relative to the base URL.
+    :return: The path of the written manifest.
+    """
+    manifest = {}
+    for zip_path in sorted(Path(zip_dir).glob("*.zip")):
+        files = {}
+        with zipfile.ZipFile(zip_path, "r") as zip_ref:
+            for member in zip_ref.infolist():
+                if member.is_dir():
+                    continue
+                sha256 = hashlib.sha256()
+                with zip_ref.open(member) as src:
+                    for block in iter(lambda: src.read(CHUNK_SIZE), b""):
+                        sha256.update(block)
+                files[member.filename] = {"sha256": sha256.hexdigest(), "size": member.file_size}
+        manifest[zip_path.stem] = {
+            "path": f"{prefix}{zip_path.name}",
+            "sha256": file_sha256(zip_path),
+            "size": zip_path.stat().st_size,
+            "files": files,
+        }
+
+    manifest_path = Path(zip_dir, MANIFEST_FILE)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest_path
+
+
+def main() -> None:
+    """CLI wrapper."""
+    parser = argparse.ArgumentParser(description="Fetch the NER models")
+    parser.add_argument("--languages", nargs="*", default=[], help="Languages to fetch")
+    parser.add_argument("--models-dir", default="spacy/models/wikiann", help="Directory of the models")
+    parser.add_argument("--base-url", default=MODELS_BASE_URL, help="URL serving manifest.json and the zip files")
+    parser.add_argument("--workers", default=4, type=int, help="Number of concurrent downloads")
+    parser.add_argument("--build-manifest", type=Path, help="Write the manifest of the zip files of a directory")
+    args = parser.parse_args()
+
+    if args.build_manifest:
+        print(f"Written {build_manifest(args.build_manifest)}.")
+        return
+
+    fetch_models(args.languages, args.models_dir, args.base_url, args.workers)
+
+
+if __name__ == "__main__":
+    main()
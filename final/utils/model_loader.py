@@ -6,10 +6,22 @@ from pathlib import Path
 import gdown
 import spacy
 import streamlit as st
+from spacy import util
+
+from utils.model_fetcher import MODELS_BASE_URL, fetch_models
+from utils.model_packer import load_packed_model, packed_path
+from utils.model_quantizer import load_quantized_model, quantized_path
+from utils.model_registry import MODEL_BUDGET_MB, ModelRegistry, directory_size
 
 MODELS_PATH = "spacy/models"
 WIKIANN_DIR = "wikiann"
 MODEL_BEST_DIR = "model-best"
+# Serve the int8 quantized variants of the models where they exist
+QUANTIZED_MODELS = os.environ.get("NER_QUANTIZED_MODELS", "0") == "1"
+# The pipelines run in this many worker processes, see utils.inference_executor, 0 runs them in the app process
+INFERENCE_WORKERS = int(os.environ.get("NER_INFERENCE_WORKERS", 0))
+# The components excluded when a pipeline is loaded to run it
+EXCLUDED_COMPONENTS = ["tagger", "parser"]
 
 def download(file_id, output):
     try:
@@ -72,19 +84,100 @@ def download_and_extract(language):
     print(f"Done! Files are in '{dest_dir}'.", flush=True)
 
 
-@st.cache_resource
-def load_model(language):
+def _with_labels(model):
+    """Keeps the NER labels of the meta of a pipeline loaded without its components, see ner_labels."""
+    labels = model._meta.get("labels", {})
+    model.meta["ner_labels"] = list(labels.get("ner", []))
+    return model
+
+
+def ner_labels(model):
+    """Returns the NER labels of a pipeline, also of one loaded by load_vocab_model."""
+    if model.has_pipe("ner"):
+        return model.get_pipe("ner").labels
+    return tuple(model.meta.get("ner_labels", ()))
+
+
+def load_spacy_model(language, components=True):
+    """
+    Loads the pipeline of a language.
+
+    :param language: The language of the model.
+    :param components: Whether to load the components, or only the vocab, tokenizer and meta of the pipeline.
+    :return: The loaded SpaCy pipeline.
+    """
     try:
         print("Attempting to load SpaCy model...", flush=True)
-        path = Path(MODELS_PATH, WIKIANN_DIR, language, MODEL_BEST_DIR)
+        path = model_path(language)
+        packed = packed_path(path)
+        quantized = quantized_path(path)
+
+        if QUANTIZED_MODELS and quantized.exists():
+            if not components:
+                return _with_labels(spacy.load(quantized, exclude=pipeline_names(quantized)))
+            model = load_quantized_model(quantized, exclude=EXCLUDED_COMPONENTS)
+            print("Quantized SpaCy model loaded!", flush=True)
+            return model
+
+        if packed.exists():
+            if not components:
+                return _with_labels(load_packed_model(packed, components=False))
+            model = load_packed_model(packed, exclude=EXCLUDED_COMPONENTS)
+            print("Packed SpaCy model loaded!", flush=True)
+            return model
+
+        if not path.exists() and MODELS_BASE_URL:
+            print(f"Path {str(path)} does not exist. Fetching the model from {MODELS_BASE_URL}.", flush=True)
+            fetch_models([language], Path(MODELS_PATH, WIKIANN_DIR))
 
         if not path.exists():
             # print(f"Path {str(path)} does not exist. Fetching the model from Google Drive.", flush=True)
             # download_and_extract(language)
             raise RuntimeError(f"Could not load model. Path {str(path)} is not found.")
 
-        model = spacy.load(path, exclude=["tagger","parser"])
+        if not components:
+            return _with_labels(spacy.load(path, exclude=pipeline_names(path)))
+
+        model = spacy.load(path, exclude=EXCLUDED_COMPONENTS)
         print("SpaCy model loaded!", flush=True)
         return model
     except Exception as e:
-        raise RuntimeError(f"Could not load model: {e}")
\ No newline at end of file
+        raise RuntimeError(f"Could not load model: {e}")
+
+
+def load_vocab_model(language):
+    """
+    Loads the vocab, tokenizer and meta of the pipeline of a language without its components.
+
+    Used by the app when the pipelines run in the inference workers: the results are only read with the vocab.
+    """
+    return load_spacy_model(language, components=False)
+
+
+def pipeline_names(path):
+    """Returns the names of the components of a pipeline directory."""
+    return list(util.load_config(Path(path, "config.cfg"))["nlp"]["pipeline"])
+
+
+def model_path(language):
+    return Path(MODELS_PATH, WIKIANN_DIR, language, MODEL_BEST_DIR)
+
+
+def estimate_model_size(language):
+    path = model_path(language)
+    packed = packed_path(path)
+    if packed.exists():
+        return packed.stat().st_size
+    return directory_size(path) if path.exists() else 0
+
+
+@st.cache_resource
+def get_model_registry():
+    if INFERENCE_WORKERS > 0:
+        # The full pipelines are only loaded in the workers, which share the memory budget between them
+        return ModelRegistry(load_vocab_model, budget_bytes=MODEL_BUDGET_MB * 1024 * 1024)
+    return ModelRegistry(load_spacy_model, size_estimator=estimate_model_size)
+
+
+def load_model(language):
+    return get_model_registry().get(language)
\ No newline at end of file
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+"""
+Packed model format
+
+Converts a `model-best` directory into one file, whose transformer weights are memory-mapped when it is loaded.
+The pipeline without its transformer weights is stored next to the weights, and the loader rebuilds the pipeline
+around tensors that point into the mapped file. Replicas on the same host therefore share the pages of the weights
+instead of deserializing private copies.
+
+Example:
+    python -m utils.model_packer spacy/models/wikiann/pl/model-best
+"""
+
+import argparse
+import warnings
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+import numpy as np
+import spacy
+import srsly
+import torch
+from spacy import util
+from spacy.util import SimpleFrozenDict, make_tempdir
+from spacy_transformers.data_classes import HFObjects
+from spacy_transformers.layers.hf_shim import HFShim
+from thinc.api import Config, get_torch_default_device
+
+PACKED_FORMAT = "ner-packed-v1"
+PACKED_SUFFIX = ".pack"
+TRANSFORMER_PIPE = "transformer"
+
+try:
+    from transformers.modeling_utils import init_empty_weights, no_init_weights
+except ImportError:
+    init_empty_weights = no_init_weights = None
+
+
+def packed_path(model_path):
+    """Returns the path of the packed file of a model directory, e.g. `model-best.pack` for `model-best`."""
+    model_path = Path(model_path)
+    return model_path.with_name(model_path.name + PACKED_SUFFIX)
+
+
+@contextmanager
+def without_weights(hf_model):
+    """Makes the transformer serialize an empty state dict, so that its weights are stored only once."""
+    hf_model.state_dict = lambda *args, **kwargs: {}
+    try:
+        yield
+    finally:
+        del hf_model.state_dict
+
+
+@contextmanager
+def loading_without_weights():
+    """Skips the random initialization and the strict loading warning of a transformer stored without weights."""
+    with warnings.catch_warnings(), no_init_weights() if no_init_weights is not None else nullcontext():
+        warnings.simplefilter("ignore")
+        yield
+
+
+@contextmanager
+def parameters_on_meta_device():
+    """Builds the parameters of a transformer on the meta device, without allocating or initializing them."""
+    if init_empty_weights is None:
+        raise ImportError("Loading a packed model requires a version of transformers with init_empty_weights.")
+    # The buffers stay on the CPU, so that those missing from the state dict, e.g. position_ids, keep their values
+    with init_empty_weights(include_buffers=False), no_init_weights():
+        yield
+
+
+def _split_shim_bytes(msg):
+    """
+    Takes the transformer config and tokenizer out of the serialized Hugging Face shims of a thinc model dict.
+
+    The shims are left with an empty config, so that deserializing them builds no transformer.
+
+    :return: The configs and tokenizer files of the shims, by node and shim index.
+    """
+    hf_msgs = {}
+    for node_index, node_shims in enumerate(msg["shims"]):
+        for shim_index, shim_bytes in enumerate(node_shims):
+            shim_msg = srsly.msgpack_loads(shim_bytes)
+            if not shim_msg.get("config"):
+                continue
+            hf_msgs[node_index, shim_index] = shim_msg
+            node_shims[shim_index] = srsly.msgpack_dumps({
+                "config": {},
+                "state": b"",
+                "tokenizer": {},
+                "_init_tokenizer_config": {},
+                "_init_transformer_config": {},
+            })
+    return hf_msgs
+
+
+def _load_hf_objects(shim, shim_msg, state_dict):
+    """Builds the tokenizer and transformer of a shim, the transformer around the given tensors."""
+    tok_dict = dict(shim_msg["tokenizer"])
+    tok_kwargs = tok_dict.pop("kwargs", {})
+    with make_tempdir() as temp_dir:
+        config_file = temp_dir / "config.json"
+        srsly.write_json(config_file, shim_msg["config"])
+        config = shim.config_cls.from_pretrained(config_file)
+        for name, data in tok_dict.items():
+            Path(temp_dir, name).write_bytes(data)
+        tokenizer = shim.tokenizer_cls.from_pretrained(str(temp_dir.absolute()), **tok_kwargs)
+        vocab_file_contents = None
+        if hasattr(tokenizer, "vocab_file"):
+            vocab_file_contents = Path(temp_dir, tokenizer.vocab_files_names["vocab_file"]).read_bytes()
+
+    with parameters_on_meta_device():
+        hf_model = shim.model_cls.from_config(config)
+    hf_model.load_state_dict(state_dict, strict=True, assign=True)
+    on_meta = [name for name, tensor in [*hf_model.named_parameters(), *hf_model.named_buffers()] if tensor.is_meta]
+    if on_meta:
+        raise ValueError(f"The packed state dict has no values for {', '.join(on_meta)}.")
+
+    shim._hfmodel = HFObjects(tokenizer, hf_model, vocab_file_contents, SimpleFrozenDict(), SimpleFrozenDict())
+    # A no-op on the CPU, the mapped tensors are only copied to a GPU
+    shim._model = hf_model.to(get_torch_default_device())
+
+
+def _to_tensor(data):
+    return torch.from_numpy(np.frombuffer(bytearray(data), dtype=np.uint8))
+
+
+def pack_model(model_path, output_path=None):
+    """
+    Packs a SpaCy pipeline with a transformer component into one file.
+
+    :param model_path: The directory of the pipeline, e.g. `model-best`.
+    :param output_path: The packed file, by default next to the directory.
+    :return: The path of the packed file.
+    """
+    output_path = Path(output_path) if output_path else packed_path(model_path)
+    nlp = spacy.load(model_path)
+    transformer = nlp.get_pipe(TRANSFORMER_PIPE)
+    hf_model = transformer.model.transformer
+
+    with without_weights(hf_model):
+        transformer_bytes = transformer.model.to_bytes()
+
+    packed = {
+        "format": PACKED_FORMAT,
+        "config": nlp.config.to_str(),
+        "pipeline": _to_tensor(nlp.to_bytes(exclude=[TRANSFORMER_PIPE])),
+        "transformer": _to_tensor(transformer_bytes),
+        "state_dict": {name: tensor.contiguous() for name, tensor in hf_model.state_dict().items()},
+    }
+
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    torch.save(packed, tmp_path)
+    tmp_path.replace(output_path)
+    return output_path
+
+
+def load_packed_model(path, exclude=(), components=True):
+    """
+    Loads a packed pipeline with its transformer weights memory-mapped from the file.
+
+    :param path: The packed file.
+    :param exclude: The names of the components to exclude.
+    :param components: Whether to load the components, or only the vocab, tokenizer and meta of the pipeline.
+    :return: The loaded SpaCy pipeline.
+    """
+    packed = torch.load(path, mmap=True, weights_only=True, map_location="cpu")
+    if packed.get("format") != PACKED_FORMAT:
+        raise ValueError(f"{path} is not a packed model of format {PACKED_FORMAT}.")
+
+    config = Config().from_str(packed["config"])
+    if not components:
+        exclude = list(config["nlp"]["pipeline"])
+    nlp = util.load_model_from_config(config, exclude=exclude, validate=False)
+    nlp.from_bytes(packed["pipeline"].numpy().tobytes(), exclude=[TRANSFORMER_PIPE, *exclude])
+    # Identifies the file the pipeline was loaded from, as spacy.load does for a directory
+    nlp._path = Path(path)
+    if TRANSFORMER_PIPE in exclude:
+        return nlp
+
+    transformer = nlp.get_pipe(TRANSFORMER_PIPE)
+    msg = srsly.msgpack_loads(packed["transformer"].numpy().tobytes())
+    # The transformer is built below around the mapped tensors, instead of by the shim around a copy of them
+    hf_msgs = _split_shim_bytes(msg)
+    if len(hf_msgs) != 1:
+        raise ValueError(f"{path} has {len(hf_msgs)} transformers, expected one.")
+    transformer.model.from_dict(msg)
+
+    ((node_index, shim_index), shim_msg), = hf_msgs.items()
+    shim = list(transformer.model.walk())[node_index].shims[shim_index]
+    if not isinstance(shim, HFShim):
+        raise ValueError(f"{path} has a transformer in a {type(shim).__name__}, expected a {HFShim.__name__}.")
+    _load_hf_objects(shim, shim_msg, packed["state_dict"])
+    return nlp
+
+
+def main() -> None:
+    """CLI wrapper."""
+    parser = argparse.ArgumentParser(description="Pack a SpaCy transformer pipeline into one memory-mappable file")
+    parser.add_argument("model_paths", nargs="+", type=Path, help="Pipeline directories, e.g. model-best")
+    args = parser.parse_args()
+
+    for model_path in args.model_paths:
+        print(f"Packing {model_path}...", flush=True)
+        output_path = pack_model(model_path)
+        print(f"Written {output_path} ({output_path.stat().st_size / 1024 / 1024:.0f} MB).", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Int8 quantized models
+
+Converts the linear layers of the transformer component of a `model-best` pipeline to dynamically quantized int8
+layers for CPU inference. The result is written to `model-best-int8`: the pipeline without its transformer weights
+and the quantized state dict of the transformer.
+
+Example:
+    python -m utils.model_quantizer spacy/models/wikiann/pl/model-best
+"""
+
+import argparse
+from pathlib import Path
+
+import spacy
+import torch
+
+from utils.model_packer import TRANSFORMER_PIPE, loading_without_weights, without_weights
+
+QUANTIZED_SUFFIX = "-int8"
+QUANTIZED_WEIGHTS_FILE = "transformer_int8.pt"
+
+
+def quantized_path(model_path):
+    """Returns the directory of the quantized variant of a model directory, e.g. `model-best-int8`."""
+    model_path = Path(model_path)
+    return model_path.with_name(model_path.name + QUANTIZED_SUFFIX)
+
+
+def quantize_transformer(hf_model):
+    return torch.ao.quantization.quantize_dynamic(hf_model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def quantize_model(model_path, output_path=None):
+    """
+    Writes the int8 quantized variant of a SpaCy pipeline with a transformer component.
+
+    :param model_path: The directory of the pipeline, e.g. `model-best`.
+    :param output_path: The directory to write, by default `model-best-int8` next to the pipeline.
+    :return: The directory of the quantized pipeline.
+    """
+    output_path = Path(output_path) if output_path else quantized_path(model_path)
+    nlp = spacy.load(model_path)
+    hf_model = nlp.get_pipe(TRANSFORMER_PIPE).model.transformer
+
+    with without_weights(hf_model):
+        nlp.to_disk(output_path)
+
+    quantize_transformer(hf_model)
+    torch.save(hf_model.state_dict(), Path(output_path, QUANTIZED_WEIGHTS_FILE))
+    return output_path
+
+
+def load_quantized_model(path, exclude=()):
+    """
+    Loads a pipeline written by quantize_model.
+
+    :param path: The directory of the quantized pipeline.
+    :param exclude: The names of the components to exclude.
+    :return: The loaded SpaCy pipeline.
+    """
+    with loading_without_weights():
+        nlp = spacy.load(path, exclude=exclude)
+
+    hf_model = nlp.get_pipe(TRANSFORMER_PIPE).model.transformer
+    quantize_transformer(hf_model)
+    hf_model.load_state_dict(torch.load(Path(path, QUANTIZED_WEIGHTS_FILE), weights_only=True, map_location="cpu"))
+    return nlp
+
+
+def main() -> None:
+    """CLI wrapper."""
+    parser = argparse.ArgumentParser(description="Quantize the transformer of a SpaCy pipeline to int8")
+    parser.add_argument("model_paths", nargs="+", type=Path, help="Pipeline directories, e.g. model-best")
+    args = parser.parse_args()
+
+    for model_path in args.model_paths:
+        print(f"Quantizing {model_path}...", flush=True)
+        print(f"Written {quantize_model(model_path)}.", flush=True)
+
+
+if __name__ == "__main__":
+    main()
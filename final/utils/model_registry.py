@@ -0,0 +1,175 @@
+import gc
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+MODEL_BUDGET_MB = int(os.environ.get("NER_MODEL_BUDGET_MB", 3072))
+PINNED_LANGUAGES = [l.strip() for l in os.environ.get("NER_PINNED_LANGUAGES", "").split(",") if l.strip()]
+
+logger = logging.getLogger(__name__)
+
+
+def _rss():
+    return psutil.Process().memory_info().rss if psutil is not None else 0
+
+
+def directory_size(path):
+    """Returns the total size of the files in a directory, used as a size estimate of a model not loaded yet."""
+    return sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file())
+
+
+def _tensors_bytes(value):
+    if isinstance(value, (tuple, list)):
+        return sum(_tensors_bytes(item) for item in value)
+    if hasattr(value, "element_size") and hasattr(value, "nelement"):
+        return value.element_size() * value.nelement()
+    # The packed weights of quantized layers are stored as custom objects holding tensors
+    if hasattr(value, "__getstate__") and type(value).__module__.startswith("torch"):
+        try:
+            return _tensors_bytes(value.__getstate__())
+        except Exception:
+            return 0
+    return 0
+
+
+def pipeline_bytes(model):
+    """
+    Returns the bytes of the parameters of a loaded pipeline.
+
+    Counts the parameters of the thinc models of the components, the tensors of the PyTorch modules they wrap,
+    e.g. the transformer, and the vectors of the vocab.
+
+    :param model: The loaded SpaCy pipeline.
+    :return: The estimated size of the pipeline in bytes.
+    """
+    size = 0
+    torch_modules = {}
+    for _, component in getattr(model, "components", []):
+        thinc_model = getattr(component, "model", None)
+        if thinc_model is None or not hasattr(thinc_model, "walk"):
+            continue
+        for node in thinc_model.walk():
+            for name in node.param_names:
+                if node.has_param(name):
+                    size += node.get_param(name).nbytes
+            for shim in node.shims:
+                module = getattr(shim, "_model", None)
+                if hasattr(module, "state_dict"):
+                    torch_modules[id(module)] = module
+    # A module shared by several components, e.g. a listened transformer, is counted once
+    for module in torch_modules.values():
+        size += sum(_tensors_bytes(value) for value in module.state_dict(keep_vars=True).values())
+    vectors = getattr(getattr(model, "vocab", None), "vectors", None)
+    if vectors is not None and getattr(vectors, "data", None) is not None:
+        size += vectors.data.nbytes
+    return size
+
+
+class ModelRegistry:
+    """
+    Process-wide registry of loaded pipelines with a memory budget.
+
+    The size of a pipeline is the size of its parameters, see pipeline_bytes. The growth of the process RSS while
+    loading it and the size of its files are only used when the parameters cannot be counted, since the RSS also
+    grows with concurrent inference and allocator caches. When the loaded pipelines exceed the budget, the least
+    recently used ones that are not pinned are evicted.
+    """
+
+    def __init__(self, loader, budget_bytes=MODEL_BUDGET_MB * 1024 * 1024, pinned=PINNED_LANGUAGES,
+                 size_estimator=None, model_size=pipeline_bytes):
+        self.loader = loader
+        self.budget_bytes = budget_bytes
+        self.pinned = set(pinned)
+        self.size_estimator = size_estimator
+        self.model_size = model_size
+        self.events = deque(maxlen=100)
+        self._models = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+
+    def _report(self, event, language, size):
+        self.events.append((time.time(), event, language, size))
+        logger.info("Model registry: %s '%s' (%.0f MB), %.0f of %.0f MB used.", event, language, size / 1024 / 1024,
+                    self.used_bytes() / 1024 / 1024, self.budget_bytes / 1024 / 1024)
+
+    def used_bytes(self):
+        with self._lock:
+            return sum(self._sizes[language] for language in self._models)
+
+    def is_loaded(self, language):
+        with self._lock:
+            return language in self._models
+
+    def loaded(self):
+        """Returns (language, size, pinned) of the loaded pipelines from the least to the most recently used."""
+        with self._lock:
+            return [(language, self._sizes[language], language in self.pinned) for language in self._models]
+
+    def pin(self, language):
+        with self._lock:
+            self.pinned.add(language)
+
+    def unpin(self, language):
+        with self._lock:
+            self.pinned.discard(language)
+
+    def _evict(self, needed_bytes, keep):
+        evicted = False
+        for language in list(self._models):
+            if self.used_bytes() + needed_bytes <= self.budget_bytes:
+                break
+            if language in self.pinned or language == keep:
+                continue
+            del self._models[language]
+            evicted = True
+            self._report("evicted", language, self._sizes[language])
+        if evicted:
+            gc.collect()
+
+    def get(self, language):
+        """
+        Returns the pipeline of the language, loading it and evicting others if needed.
+
+        :param language: The language of the model.
+        :return: The loaded SpaCy pipeline.
+        """
+        with self._lock:
+            model = self._models.get(language)
+            if model is not None:
+                self._models.move_to_end(language)
+                return model
+
+        # Loads are serialized, so that the budget holds and a fallback RSS growth is attributed to one pipeline
+        with self._load_lock:
+            with self._lock:
+                model = self._models.get(language)
+                if model is not None:
+                    return model
+                estimate = self._sizes.get(language)
+                if estimate is None and self.size_estimator is not None:
+                    estimate = self.size_estimator(language)
+                self._evict(estimate or 0, keep=language)
+
+            rss_before = _rss()
+            model = self.loader(language)
+            size = self.model_size(model) if self.model_size is not None else 0
+            if size <= 0:
+                size = _rss() - rss_before
+            if size <= 0:
+                size = estimate or 0
+
+            with self._lock:
+                self._models[language] = model
+                self._sizes[language] = size
+                self._report("loaded", language, size)
+                self._evict(0, keep=language)
+            return model
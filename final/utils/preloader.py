@@ -0,0 +1,112 @@
+import json
+import os
+import threading
+
+import streamlit as st
+
+from utils.inference_executor import get_inference_executor
+from utils.model_loader import get_model_registry, load_model
+
+# Comma separated languages, or "all"
+PRELOAD_LANGUAGES = os.environ.get("NER_PRELOAD_LANGUAGES", "")
+# JSON file of the form {"languages": ["pl", "ru"], "warmup_texts": ["..."]}, overrides the variable above
+PRELOAD_CONFIG = os.environ.get("NER_PRELOAD_CONFIG")
+
+WARMUP_TEXTS = [
+    "Warszawa jest stolicą Polski.",
+    "Москва — столица России, а Киев — столица Украины.",
+    "Václav Havel se narodil v Praze.",
+    "Никола Тесла е роден в Смилян.",
+    "Ljubljana je glavno mesto Slovenije in leži ob Ljubljanici. " * 20,
+]
+
+PENDING = "pending"
+LOADING = "loading"
+WARMING_UP = "warming up"
+READY = "ready"
+EVICTED = "evicted"
+FAILED = "failed"
+
+
+def read_preload_config(available_languages):
+    """
+    Reads the languages to preload and the warm-up texts from NER_PRELOAD_CONFIG or NER_PRELOAD_LANGUAGES.
+
+    :param available_languages: The languages the app offers.
+    :return: A tuple of the languages to preload and the warm-up texts.
+    """
+    languages = PRELOAD_LANGUAGES
+    warmup_texts = WARMUP_TEXTS
+
+    if PRELOAD_CONFIG:
+        with open(PRELOAD_CONFIG, "r", encoding="utf-8") as config_file:
+            config = json.load(config_file)
+        languages = config.get("languages", languages)
+        warmup_texts = config.get("warmup_texts", warmup_texts)
+
+    if isinstance(languages, str):
+        languages = [l.strip() for l in languages.split(",") if l.strip()]
+    if "all" in languages:
+        languages = list(available_languages)
+
+    return [l for l in languages if l in available_languages], warmup_texts
+
+
+class Preloader:
+    """Loads pipelines in background threads and runs a warm-up batch through each of them."""
+
+    def __init__(self, languages, warmup_texts):
+        self.warmup_texts = warmup_texts
+        self._states = {language: PENDING for language in languages}
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._preload, args=(language,), name=f"preload-{language}", daemon=True)
+            for language in languages
+        ]
+
+    def _set_state(self, language, state):
+        with self._lock:
+            self._states[language] = state
+        print(f"Preloader: '{language}' {state}.", flush=True)
+
+    def _preload(self, language):
+        try:
+            self._set_state(language, LOADING)
+            model = load_model(language)
+
+            # The first forward pass triggers lazy allocations, so it should not happen on a user request
+            self._set_state(language, WARMING_UP)
+            executor = get_inference_executor()
+            if executor is None:
+                list(model.pipe(self.warmup_texts))
+            else:
+                # The app only holds the vocab, the pipelines are loaded and warmed up in the workers
+                executor.warm_up(language, self.warmup_texts)
+
+            self._set_state(language, READY)
+        except Exception as e:
+            self._set_state(language, f"{FAILED}: {e}")
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def status(self):
+        """Returns the state of every preloaded language, a ready model the registry evicted since is reported so."""
+        with self._lock:
+            states = dict(self._states)
+        registry = get_model_registry()
+        return {language: EVICTED if state == READY and not registry.is_loaded(language) else state
+                for language, state in states.items()}
+
+    def is_ready(self, language):
+        return self.status().get(language) == READY
+
+
+@st.cache_resource
+def start_preloader(available_languages):
+    languages, warmup_texts = read_preload_config(available_languages)
+    if languages:
+        print(f"Preloading models for {', '.join(languages)}...", flush=True)
+    return Preloader(languages, warmup_texts).start()
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import unicodedata
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+
+import streamlit as st
+from spacy.tokens import Doc
+
+from utils.inference_executor import DOC_EXCLUDE, pipe
+
+RESULT_CACHE_BYTES = int(os.environ.get("NER_RESULT_CACHE_BYTES", 64 * 1024 * 1024))
+RESULT_CACHE_DIR = os.environ.get("NER_RESULT_CACHE_DIR")
+RESULT_CACHE_DISK_BYTES = int(os.environ.get("NER_RESULT_CACHE_DISK_BYTES", 1024 * 1024 * 1024))
+
+logger = logging.getLogger(__name__)
+
+# The fingerprint of every loaded pipeline, taken once, so that it describes the files the pipeline was loaded from
+_fingerprints = weakref.WeakKeyDictionary()
+
+
+def normalize_text(text):
+    """Returns the text the model runs on, so that equivalent inputs share one cache entry."""
+    return unicodedata.normalize("NFC", text.replace("\r\n", "\n").replace("\r", "\n"))
+
+
+def files_signature(path):
+    """Returns the names, sizes and modification times of a file or of the files in a directory."""
+    path = Path(path)
+    if path.is_file():
+        files = [path]
+    elif path.is_dir():
+        files = sorted(f for f in path.rglob("*") if f.is_file())
+    else:
+        return []
+    return [(f.relative_to(path).as_posix() if f != path else f.name, f.stat().st_size, f.stat().st_mtime_ns)
+            for f in files]
+
+
+def model_fingerprint(model):
+    """
+    Returns a stable fingerprint of a loaded pipeline.
+
+    The fingerprint covers the files the pipeline was loaded from, so retraining a model into the same directory
+    does not serve the results of the old weights. It is taken the first time a pipeline is seen.
+
+    :param model: The loaded SpaCy pipeline.
+    :return: A hex digest identifying the pipeline meta, the path it was loaded from and the files of that path.
+    """
+    fingerprint = _fingerprints.get(model)
+    if fingerprint is None:
+        meta = json.dumps(model.meta, sort_keys=True, default=str)
+        path = getattr(model, "_path", None) or ""
+        files = json.dumps(files_signature(path) if path else [])
+        fingerprint = hashlib.sha256(f"{path}\0{meta}\0{files}".encode("utf-8")).hexdigest()
+        _fingerprints[model] = fingerprint
+    return fingerprint
+
+
+def cache_key(language, fingerprint, text):
+    text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{language}\0{fingerprint}\0{text_hash}".encode("utf-8")).hexdigest()
+
+
+class NERResultCache:
+    """
+    Two-tier cache of serialized NER results.
+
+    The first tier is an in-process LRU bounded by the total size of the stored docs. The optional second tier
+    is a content-addressed directory on disk, so the results survive restarts of the container. It is an LRU too,
+    bounded by max_disk_bytes and ordered by the modification times of its files, which a hit renews.
+    """
+
+    def __init__(self, max_bytes=RESULT_CACHE_BYTES, cache_dir=RESULT_CACHE_DIR,
+                 max_disk_bytes=RESULT_CACHE_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._disk_entries = OrderedDict()
+        self._disk_size = 0
+        self._lock = threading.Lock()
+
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            entries = []
+            for path in self.cache_dir.glob("*/*.spacy"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, path.stem, stat.st_size))
+            for _, key, size in sorted(entries):
+                self._disk_entries[key] = size
+                self._disk_size += size
+            self._evict_disk()
+
+    def _disk_path(self, key):
+        return Path(self.cache_dir, key[:2], f"{key}.spacy")
+
+    def _remember(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key))
+        self._entries[key] = data
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def _evict_disk(self):
+        """Removes the least recently used files until the disk tier fits its budget, the lock must be held."""
+        while self._disk_size > self.max_disk_bytes and self._disk_entries:
+            key, size = self._disk_entries.popitem(last=False)
+            self._disk_size -= size
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                # Another replica sharing the directory may have removed it already
+                pass
+
+    def _remember_disk(self, key, size):
+        if key in self._disk_entries:
+            self._disk_size -= self._disk_entries.pop(key)
+        self._disk_entries[key] = size
+        self._disk_size += size
+        self._evict_disk()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+
+        if self.cache_dir is not None:
+            try:
+                data = self._disk_path(key).read_bytes()
+            except OSError:
+                data = None
+            if data is not None:
+                try:
+                    os.utime(self._disk_path(key))
+                except OSError:
+                    pass
+                with self._lock:
+                    self._remember(key, data)
+                    self._remember_disk(key, len(data))
+                    self.disk_hits += 1
+                return data
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, data):
+        with self._lock:
+            self._remember(key, data)
+
+        if self.cache_dir is not None and len(data) <= self.max_disk_bytes:
+            path = self._disk_path(key)
+            if path.exists():
+                return
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file first, so a concurrent reader never sees a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as tmp_file:
+                    tmp_file.write(data)
+                os.replace(tmp_path, path)
+                with self._lock:
+                    self._remember_disk(key, len(data))
+            except OSError as e:
+                logger.warning("Could not write the result cache entry %s: %s", path, e)
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "disk_entries": len(self._disk_entries),
+                "disk_bytes": self._disk_size,
+                "max_disk_bytes": self.max_disk_bytes,
+            }
+
+
+@st.cache_resource
+def get_result_cache():
+    return NERResultCache()
+
+
+def cached_ner(language, model, text):
+    """
+    Runs the model on the text, reusing an earlier result for the same language, model and text.
+
+    :param language: The language of the model.
+    :param model: The loaded SpaCy pipeline.
+    :param text: The text to tag.
+    :return: The tagged Doc.
+    """
+    cache = get_result_cache()
+    text = normalize_text(text)
+    key = cache_key(language, model_fingerprint(model), text)
+
+    data = cache.get(key)
+    if data is not None:
+        return Doc(model.vocab).from_bytes(data)
+
+    doc = next(pipe(language, model, [text]))
+    cache.put(key, doc.to_bytes(exclude=DOC_EXCLUDE))
+    return doc
@@ -0,0 +1,158 @@
+import io
+import os
+import re
+import secrets
+import time
+import weakref
+from pathlib import Path
+
+from spacy import displacy
+from spacy.displacy.templates import TPL_PAGE
+
+from utils.inference_executor import pipe
+
+CHUNK_CHARS = int(os.environ.get("NER_CHUNK_CHARS", 2000))
+PIPE_BATCH_SIZE = int(os.environ.get("NER_PIPE_BATCH_SIZE", 16))
+# The tagged files are written below the static directory of the app, so Streamlit streams them from disk
+STATIC_DIR = Path(__file__).resolve().parent.parent / "static"
+TAGGED_DIR = "tagged"
+TAGGED_FILE_TTL_SECONDS = int(os.environ.get("NER_TAGGED_FILE_TTL_SECONDS", 6 * 60 * 60))
+# Streamlit does not serve larger static files
+MAX_STATIC_FILE_BYTES = 200 * 1024 * 1024
+
+SENTENCE_END = re.compile(r"[.!?…][\"'”»)\]]*\s+")
+
+
+def split_long_paragraph(paragraph, max_chars):
+    """
+    Splits a paragraph into pieces of at most max_chars, preferring sentence ends and then whitespace.
+
+    :param paragraph: The paragraph to split.
+    :param max_chars: The maximal length of a piece.
+    :return: A generator of pieces of the paragraph.
+    """
+    while len(paragraph) > max_chars:
+        window = paragraph[:max_chars]
+        cut = max((m.end() for m in SENTENCE_END.finditer(window)), default=0)
+        if cut == 0:
+            cut = window.rfind(" ") + 1
+        if cut == 0:
+            cut = max_chars
+        yield paragraph[:cut]
+        paragraph = paragraph[cut:]
+    if paragraph.strip():
+        yield paragraph
+
+
+def iter_chunks(binary_file, max_chars=CHUNK_CHARS, on_bytes_read=None):
+    """
+    Reads a UTF-8 file line by line and yields paragraph chunks of at most max_chars.
+
+    :param binary_file: The binary file-like object to read from.
+    :param max_chars: The maximal length of a chunk.
+    :param on_bytes_read: An optional callable receiving the number of bytes read so far.
+    :return: A generator of text chunks.
+    """
+    bytes_read = 0
+    lines = []
+    lines_chars = 0
+    text_file = io.TextIOWrapper(binary_file, encoding="utf-8")
+    try:
+        for line in text_file:
+            bytes_read += len(line.encode("utf-8"))
+            if line.strip():
+                lines.append(line.rstrip("\n"))
+                lines_chars += len(lines[-1])
+                if lines_chars < max_chars:
+                    continue
+            if lines:
+                yield from split_long_paragraph("\n".join(lines), max_chars)
+                lines = []
+                lines_chars = 0
+            if on_bytes_read is not None:
+                on_bytes_read(bytes_read)
+    finally:
+        # Do not let the wrapper close the uploaded file
+        text_file.detach()
+
+    if lines:
+        yield from split_long_paragraph("\n".join(lines), max_chars)
+    if on_bytes_read is not None:
+        on_bytes_read(bytes_read)
+
+
+def tag_to_html_file(language, model, chunks, batch_size=PIPE_BATCH_SIZE):
+    """
+    Tags the chunks in batches and writes the rendered entities incrementally to a temporary HTML file.
+
+    :param language: The language of the model.
+    :param model: The loaded SpaCy pipeline.
+    :param chunks: An iterable of text chunks.
+    :param batch_size: The number of chunks in one batch.
+    :return: The path of the written HTML file.
+    """
+    page_start, page_end = TPL_PAGE.split("{content}")
+    page_start = page_start.format(lang=model.lang, dir="ltr")
+
+    directory = Path(STATIC_DIR, TAGGED_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    # The name is not guessable, the file is served to whoever knows it
+    path = str(Path(directory, f"tagged_text_{secrets.token_urlsafe(16)}.html"))
+    with open(path, "x", encoding="utf-8") as out_file:
+        out_file.write(page_start)
+        for doc in pipe(language, model, chunks, batch_size=batch_size):
+            out_file.write(displacy.render(doc, style="ent", page=False, minify=True))
+            out_file.write("\n")
+        out_file.write(page_end)
+
+    return path
+
+
+def remove_stale_tagged_files(max_age=TAGGED_FILE_TTL_SECONDS):
+    """Removes the tagged files older than max_age seconds, left behind by sessions that ended."""
+    cutoff = time.time() - max_age
+    for path in Path(STATIC_DIR, TAGGED_DIR).glob("tagged_text_*.html"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError:
+            pass
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class TaggedFile:
+    """
+    A tagged HTML file of a session, removed when it is replaced or when the session state is discarded.
+
+    :param key: The upload and language the file was tagged from.
+    :param path: The path of the file below the static directory.
+    """
+
+    def __init__(self, key, path):
+        self.key = key
+        self.path = path
+        self._finalizer = weakref.finalize(self, _remove_file, path)
+
+    @property
+    def url(self):
+        """The URL of the file relative to the pages, under which Streamlit serves the static directory."""
+        return f"app/static/{Path(self.path).relative_to(STATIC_DIR).as_posix()}"
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def is_servable(self):
+        """Whether Streamlit serves the file from the static directory."""
+        return os.path.getsize(self.path) <= MAX_STATIC_FILE_BYTES
+
+    def open(self):
+        return open(self.path, "rb")
+
+    def remove(self):
+        self._finalizer()
@@ -1,9 +1,13 @@
 import streamlit as st
-from utils.model_loader import load_model
-
-AVAILABLE_LANGUAGES = ["be", "bg", "cs", "hr", "mk", "pl", "ru", "sk", "sl", "sr", "uk"]
+from utils.languages import AVAILABLE_LANGUAGES
+from utils.model_loader import get_model_registry, load_model
+from utils.preloader import EVICTED, start_preloader
 
 def setup_sidebar_and_model():
+    preloader = start_preloader(tuple(AVAILABLE_LANGUAGES))
+    # Kept for the pages that report the preload status, so that they do not start the preloader themselves
+    st.session_state["preloader"] = preloader
+
     st.sidebar.title("Language Selection")
 
     if "selected_language" not in st.session_state:
@@ -18,17 +22,22 @@ def setup_sidebar_and_model():
     st.session_state["selected_language"] = selected
     language = selected
 
-    if "model" not in st.session_state:
-        st.session_state["model"] = {}
+    state = preloader.status().get(language)
+    if state is not None and state != EVICTED and not preloader.is_ready(language):
+        st.sidebar.info(f"The '{language}' model is being preloaded ({state}).")
 
-    if language not in st.session_state["model"]:
+    # Models are not kept in the session state, so that the registry can evict the least recently used ones
+    if not get_model_registry().is_loaded(language):
         with st.spinner("Loading NER model... Please wait."):
             try:
-                model = load_model(language)
-                st.session_state["model"][language] = model
+                load_model(language)
             except Exception as e:
                 st.error(f"Failed to load the model: {e}")
                 st.stop()
         st.rerun()  # ensures clean re-render after model is loaded
 
-    return language, st.session_state["model"][language]
+    model = load_model(language)
+    loaded = ", ".join(name for name, _, _ in get_model_registry().loaded())
+    st.sidebar.caption(f"Loaded models: {loaded}")
+
+    return language, model
\ No newline at end of file
@@ -21,6 +21,10 @@ Options:
     --lang/-l   Language code for loading a blank spaCy tokenizer. When in
                 doubt, leave at default "xx" (language‑agnostic).
     --silent    Suppress per‑file progress messages.
+    --workers/-j
+                Number of processes converting the files in parallel. The
+                files are still merged in sorted order, so the output is the
+                same for any number of workers.
 
 Requirements:
     pip install spacy tqdm
@@ -33,12 +37,18 @@ from __future__ import annotations
 
 import argparse
 import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
 import spacy
 from spacy.tokens import DocBin
 from tqdm import tqdm
 
+# The converted files are written through a large buffer, one block per file
+WRITE_BUFFER = 1024 * 1024
+
 # ---------------------------------------------------------------------------
 # Helper functions
 # ---------------------------------------------------------------------------
@@ -50,15 +60,45 @@ def to_bio(token) -> str:
     return f"{token.ent_iob_}-{token.ent_type_}"
 
 
+def spacy_file_to_text(spacy_path: Path, nlp) -> str:
+    """Return all docs from a .spacy file as one block of BIO lines."""
+    docbin = DocBin().from_disk(spacy_path)
+    return "".join(
+        "".join(f"{tok.text} {to_bio(tok)}\n" for tok in doc if not tok.is_space) + "\n"  # sentence/doc separator
+        for doc in docbin.get_docs(nlp.vocab)
+    )
+
+
 def convert_spacy_file(spacy_path: Path, outfile_handle, nlp):
     """Write all docs from a .spacy file to the given open file handle."""
-    docbin = DocBin().from_disk(spacy_path)
-    for doc in docbin.get_docs(nlp.vocab):
-        for tok in doc:
-            if tok.is_space:
-                continue
-            outfile_handle.write(f"{tok.text} {to_bio(tok)}\n")
-        outfile_handle.write("\n")  # sentence/doc separator
+    outfile_handle.write(spacy_file_to_text(spacy_path, nlp))
+
+
+@lru_cache(maxsize=None)
+def blank_model(lang: str):
+    """Return the blank pipeline of a worker process, loaded once."""
+    return spacy.blank(lang)
+
+
+def _convert_in_worker(spacy_path: Path, lang: str) -> str:
+    return spacy_file_to_text(spacy_path, blank_model(lang))
+
+
+def convert_in_order(spacy_files: list[Path], lang: str, workers: int):
+    """Yield the BIO text of every file in order, converting up to 2 × workers files ahead in a process pool."""
+    if workers <= 1:
+        for spacy_file in spacy_files:
+            yield _convert_in_worker(spacy_file, lang)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for spacy_file in spacy_files:
+            pending.append(executor.submit(_convert_in_worker, spacy_file, lang))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
 
 
 # ---------------------------------------------------------------------------
@@ -74,6 +114,7 @@ def main(argv: list[str] | None = None):
     parser.add_argument("output_dir", type=Path, help="Destination directory for .txt files")
     parser.add_argument("--lang", "-l", default="xx", help="spaCy language code for blank tokenizer")
     parser.add_argument("--silent", action="store_true", help="Disable progress output")
+    parser.add_argument("--workers", "-j", type=int, default=1, help="Number of conversion processes")
     args = parser.parse_args(argv)
 
     subset_map = {
@@ -89,9 +130,6 @@ def main(argv: list[str] | None = None):
         print(f"⚠️  Output directory {args.output_dir} already contains files; they may be overwritten.", file=sys.stderr)
     args.output_dir.mkdir(parents=True, exist_ok=True)
 
-    # Load a blank nlp object for deserialisation ---------------------------
-    nlp = spacy.blank(args.lang)
-
     for subset, outfile_name in subset_map.items():
         subset_dir = args.input_dir / subset
         outfile_path = args.output_dir / outfile_name
@@ -108,10 +146,11 @@ def main(argv: list[str] | None = None):
         if not args.silent:
             print(f"→ Converting {len(spacy_files)} files from {subset_dir} → {outfile_path}")
 
-        with outfile_path.open("w", encoding="utf-8") as out_handle:
-            iterable = spacy_files if args.silent else tqdm(spacy_files, desc=subset, unit="file")
-            for spacy_file in iterable:
-                convert_spacy_file(spacy_file, out_handle, nlp)
+        with outfile_path.open("w", encoding="utf-8", buffering=WRITE_BUFFER) as out_handle:
+            texts = convert_in_order(spacy_files, args.lang, args.workers)
+            iterable = texts if args.silent else tqdm(texts, total=len(spacy_files), desc=subset, unit="file")
+            for text in iterable:
+                out_handle.write(text)
 
     if not args.silent:
         print("Done.")
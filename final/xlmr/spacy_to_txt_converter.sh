@@ -1,14 +1,14 @@
 #!/bin/bash
-python3 spacy_to_txt_converter.py datasets/wikiann_spacy/be datasets/wikiann/be
-python3 spacy_to_txt_converter.py datasets/wikiann_spacy/bg datasets/wikiann/bg
-python3 spacy_to_txt_converter.py datasets/wikiann_spacy/bs datasets/wikiann/bs
-python3 spacy_to_txt_converter.py datasets/wikiann_spacy/cs datasets/wikiann/cs
-python3 spacy_to_txt_converter.py datasets/wikiann_spacy/hr datasets/wikiann/hr
-python3 spacy_to_txt_converter.py datasets/wikiann_spacy/mk datasets/wikiann/mk
-python3 spacy_to_txt_converter.py datasets/wikiann_spacy/pl datasets/wikiann/pl
-python3 spacy_to_txt_converter.py datasets/wikiann_spacy/ru datasets/wikiann/ru
-python3 spacy_to_txt_converter.py datasets/wikiann_spacy/sh datasets/wikiann/sh
-python3 spacy_to_txt_converter.py datasets/wikiann_spacy/sk datasets/wikiann/sk
-python3 spacy_to_txt_converter.py datasets/wikiann_spacy/sl datasets/wikiann/sl
-python3 spacy_to_txt_converter.py datasets/wikiann_spacy/sr datasets/wikiann/sr
-python3 spacy_to_txt_converter.py datasets/wikiann_spacy/uk datasets/wikiann/uk
\ No newline at end of file
+python3 spacy_to_txt_converter.py datasets/wikiann_spacy/be datasets/wikiann/be --workers "$(nproc)"
+python3 spacy_to_txt_converter.py datasets/wikiann_spacy/bg datasets/wikiann/bg --workers "$(nproc)"
+python3 spacy_to_txt_converter.py datasets/wikiann_spacy/bs datasets/wikiann/bs --workers "$(nproc)"
+python3 spacy_to_txt_converter.py datasets/wikiann_spacy/cs datasets/wikiann/cs --workers "$(nproc)"
+python3 spacy_to_txt_converter.py datasets/wikiann_spacy/hr datasets/wikiann/hr --workers "$(nproc)"
+python3 spacy_to_txt_converter.py datasets/wikiann_spacy/mk datasets/wikiann/mk --workers "$(nproc)"
+python3 spacy_to_txt_converter.py datasets/wikiann_spacy/pl datasets/wikiann/pl --workers "$(nproc)"
+python3 spacy_to_txt_converter.py datasets/wikiann_spacy/ru datasets/wikiann/ru --workers "$(nproc)"
+python3 spacy_to_txt_converter.py datasets/wikiann_spacy/sh datasets/wikiann/sh --workers "$(nproc)"
+python3 spacy_to_txt_converter.py datasets/wikiann_spacy/sk datasets/wikiann/sk --workers "$(nproc)"
+python3 spacy_to_txt_converter.py datasets/wikiann_spacy/sl datasets/wikiann/sl --workers "$(nproc)"
+python3 spacy_to_txt_converter.py datasets/wikiann_spacy/sr datasets/wikiann/sr --workers "$(nproc)"
+python3 spacy_to_txt_converter.py datasets/wikiann_spacy/uk datasets/wikiann/uk --workers "$(nproc)"
\ No newline at end of file
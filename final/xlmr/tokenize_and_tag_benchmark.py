@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+Benchmark of tokenize_and_tag
+
+Compares the sweep-line tokenize_and_tag of the XLM-R preparator with the previous implementation, which scanned all
+entities for every token, on paragraphs with dense anchors. The outputs of both are checked to be identical first.
+
+Example:
+    python tokenize_and_tag_benchmark.py --paragraphs 2000 --tokens 200 --anchors 60
+"""
+
+import argparse
+import io
+import random
+import time
+
+from wikianc_data_preparator_for_xlmr import tag_batch, tokenize_and_tag
+
+WORDS = ['Jan', 'Kowalski', 'mieszka', 'w', 'Warszawie', 'nad', 'Wisłą', '(PL)', 'i', 'Kraków,', 'r.', '1920']
+SPACES = [' ', ' ', ' ', '  ', '\n', '\t', '\xa0', ' ', '\x1c']
+LABELS = ['PER', 'LOC', 'ORG', 'MISC']
+
+
+def reference_tokenize_and_tag(text, entities):
+    tokens = []
+    current = 0
+    sorted_entities = sorted(entities, key=lambda x: x['start'])
+
+    while current < len(text):
+        if text[current].isspace():
+            current += 1
+            continue
+
+        end = current + 1
+        while end < len(text) and not text[end].isspace():
+            end += 1
+        token = text[current:end]
+
+        label = 'O'
+        for entity in sorted_entities:
+            if current >= entity['start'] and end <= entity['end']:
+                prefix = 'B-' if current == entity['start'] else 'I-'
+                label = prefix + entity['label']
+                break
+
+        tokens.append((token, label))
+        current = end
+
+    return tokens
+
+
+def build_paragraphs(count, tokens, anchors, rng):
+    """Builds paragraphs with anchors that mostly cover whole tokens and sometimes overlap or cut into tokens."""
+    paragraphs = []
+    for _ in range(count):
+        text = ''.join(rng.choice(WORDS) + rng.choice(SPACES) for _ in range(tokens))
+        entities = []
+        for _ in range(anchors):
+            start = rng.randrange(len(text))
+            entities.append({'start': start, 'end': start + rng.randint(1, 40), 'label': rng.choice(LABELS)})
+        paragraphs.append((text, entities))
+    return paragraphs
+
+
+def reference_write(paragraphs):
+    f = io.StringIO()
+    for text, entities in paragraphs:
+        for token, label in reference_tokenize_and_tag(text, entities):
+            f.write(f"{token} {label}\n")
+        f.write("\n")
+    return f.getvalue()
+
+
+def write(paragraphs):
+    return ''.join(tag_batch([text for text, _ in paragraphs], [entities for _, entities in paragraphs]))
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main() -> None:
+    """CLI wrapper."""
+    parser = argparse.ArgumentParser(description="Benchmark tokenize_and_tag on dense-anchor paragraphs")
+    parser.add_argument("--paragraphs", default=2000, type=int, help="Number of paragraphs")
+    parser.add_argument("--tokens", default=200, type=int, help="Tokens per paragraph")
+    parser.add_argument("--anchors", default=60, type=int, help="Anchors per paragraph")
+    parser.add_argument("--seed", default=0, type=int, help="Random seed")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for text, entities in build_paragraphs(500, 30, 8, rng):
+        assert tokenize_and_tag(text, entities) == reference_tokenize_and_tag(text, entities), (text, entities)
+
+    paragraphs = build_paragraphs(args.paragraphs, args.tokens, args.anchors, rng)
+    reference, reference_seconds = timed(reference_write, paragraphs)
+    output, seconds = timed(write, paragraphs)
+    assert output == reference
+
+    print(f"{args.paragraphs} paragraphs of {args.tokens} tokens and {args.anchors} anchors:")
+    print(f"  previous     {reference_seconds:8.3f}s  {args.paragraphs / reference_seconds:10.0f} paragraphs/s")
+    print(f"  sweep line   {seconds:8.3f}s  {args.paragraphs / seconds:10.0f} paragraphs/s"
+          f"  ({reference_seconds / seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
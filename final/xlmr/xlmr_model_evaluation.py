@@ -1,11 +1,17 @@
 #!/usr/bin/env python
 import argparse
-from typing import List
+import sys
+import time
+from pathlib import Path
 
 from transformers import AutoTokenizer, AutoModelForTokenClassification, pipeline
 from seqeval.metrics import classification_report, precision_score, recall_score, f1_score
 from datasets import Dataset
 
+# The alignment and the prediction store are shared with the spaCy and TNER evaluators
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'spacy'))
+from prediction_store import PredictionStore, data_hash, entry_labels, round_scores
+
 
 def load_conll_txt(filepath: str):
     """Load CoNLL-style txt file with token-label pairs."""
@@ -30,58 +36,51 @@ def load_conll_txt(filepath: str):
     return sentences, labels
 
 
-def align_labels(tokens: List[str], entities: List[dict], sentence: str) -> List[str]:
-    labels = ["O"] * len(tokens)
-    char_to_token_map = []
-    i = 0
-    for tok in tokens:
-        while i < len(sentence) and sentence[i].isspace():
-            i += 1
-        start = i
-        for c in tok:
-            if i < len(sentence) and sentence[i] == c:
-                i += 1
-        end = i
-        char_to_token_map.append((start, end))
-
-    for ent in entities:
-        ent_start = ent["start"]
-        ent_end = ent["end"]
-        label = ent.get("entity_group", "O")
-
-        start_idx, end_idx = None, None
-        for idx, (s, e) in enumerate(char_to_token_map):
-            if s <= ent_start < e and start_idx is None:
-                start_idx = idx
-            if s < ent_end <= e:
-                end_idx = idx
-        if start_idx is not None:
-            labels[start_idx] = f"B-{label}"
-            if end_idx is None:
-                end_idx = start_idx
-            for i in range(start_idx + 1, end_idx + 1):
-                labels[i] = f"I-{label}"
-    return labels
-
-
-def evaluate_model(model_name: str, language: str) -> None:
+def predict(model_name: str, all_tokens, all_gold_labels) -> dict:
+    """Run the model on the test set and return its predictions as an entry of the prediction store."""
     print(f"Loading model: {model_name} …")
     tokenizer = AutoTokenizer.from_pretrained(model_name)
     model = AutoModelForTokenClassification.from_pretrained(model_name)
     ner = pipeline("ner", model=model, tokenizer=tokenizer, aggregation_strategy="first", device=0)
 
-    test_path = f"datasets/wikiann/{language}/test.txt"
-    all_tokens, all_gold_labels = load_conll_txt(test_path)
     sentences = [" ".join(tokens) for tokens in all_tokens]
 
+    start = time.perf_counter()
     dataset = Dataset.from_dict({"sentence": sentences})
     predictions = ner(dataset["sentence"])
 
-    true_labels, pred_labels = [], []
-    for tokens, gold, sentence, prediction in zip(all_tokens, all_gold_labels, sentences, predictions):
-        pred = align_labels(tokens, prediction, sentence)
-        true_labels.append(gold)
-        pred_labels.append(pred)
+    return {"kind": "xlmr", "seconds": time.perf_counter() - start, "sentences": [
+        {
+            "tokens": tokens,
+            "tags": gold,
+            "entities": [
+                [int(ent["start"]), int(ent["end"]), ent.get("entity_group", "O"), round_scores(ent.get("score"))]
+                for ent in prediction
+            ],
+        }
+        for tokens, gold, prediction in zip(all_tokens, all_gold_labels, predictions)
+    ]}
+
+
+def evaluate_model(model_name: str, language: str, store_dir: str = None) -> None:
+    test_path = f"datasets/wikiann/{language}/test.txt"
+    all_tokens, all_gold_labels = load_conll_txt(test_path)
+
+    if store_dir:
+        store = PredictionStore(store_dir)
+        model_hash = store.model_hash(model_name)
+        shard_hash = data_hash(all_tokens, all_gold_labels)
+        entry = store.load(model_hash, shard_hash)
+        if entry is None:
+            prediction = predict(model_name, all_tokens, all_gold_labels)
+            entry = store.save("xlmr", model_name, model_hash, language, test_path, shard_hash,
+                               prediction["sentences"], prediction["seconds"])
+        else:
+            print(f"Using the predictions of {model_name} stored on {entry['created']}")
+    else:
+        entry = predict(model_name, all_tokens, all_gold_labels)
+
+    true_labels, pred_labels = entry_labels(entry)
 
     print(classification_report(true_labels, pred_labels, digits=4))
     print(f"Precision : {precision_score(true_labels, pred_labels):.4f}")
@@ -93,8 +92,9 @@ def main() -> None:
     parser = argparse.ArgumentParser(description="Evaluate a 🤗 token classification model")
     parser.add_argument("--model", default="ivlcic/xlmr-ner-slavic", help="Model name or local path")
     parser.add_argument("--language", required=True, help="Language")
+    parser.add_argument("--store", help="Directory of the prediction store, see ../spacy/rescore_predictions.py")
     args = parser.parse_args()
-    evaluate_model(args.model, args.language)
+    evaluate_model(args.model, args.language, args.store)
 
 
 if __name__ == "__main__":